@@ -3,8 +3,8 @@
 
 import sqlite3
 import os
-import uuid
 from datetime import datetime
+from app import parse_minutes, uuid7
 
 DB_PATH = os.path.join(os.environ.get("DB_DIR", "/app/data"), "shopping.db")
 
@@ -110,14 +110,16 @@ def add_sample_recipes():
     print(f"\nAdding {len(SAMPLE_RECIPES)} sample recipes...\n")
 
     for recipe_data in SAMPLE_RECIPES:
-        recipe_id = str(uuid.uuid4())
+        recipe_id = uuid7()
 
         # Insert recipe
         cursor.execute(
-            """INSERT INTO recipes (id, name, description, servings, prep_time, cook_time, created)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            """INSERT INTO recipes (id, name, description, servings, prep_time, cook_time,
+                                   prep_minutes, cook_minutes, created)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (recipe_id, recipe_data["name"], recipe_data["description"],
              recipe_data["servings"], recipe_data["prep_time"], recipe_data["cook_time"],
+             parse_minutes(recipe_data["prep_time"]), parse_minutes(recipe_data["cook_time"]),
              datetime.now().isoformat())
         )
 
@@ -125,7 +127,7 @@ def add_sample_recipes():
 
         # Insert ingredients
         for idx, ing in enumerate(recipe_data["ingredients"], 1):
-            ing_id = str(uuid.uuid4())
+            ing_id = uuid7()
             cursor.execute(
                 """INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position)
                    VALUES (?, ?, ?, ?, ?, ?)""",
@@ -135,7 +137,7 @@ def add_sample_recipes():
 
         # Insert steps
         for idx, step in enumerate(recipe_data["steps"], 1):
-            step_id = str(uuid.uuid4())
+            step_id = uuid7()
             cursor.execute(
                 """INSERT INTO recipe_steps (id, recipe_id, step_number, instruction)
                    VALUES (?, ?, ?, ?)""",
@@ -1,48 +1,1249 @@
-import sqlite3, os, json, uuid, io, base64
-from flask import Flask, request, jsonify, g
-from datetime import datetime
-from PIL import Image
-
-app = Flask(__name__)
+import time
+_IMPORT_STARTED = time.perf_counter()
+import sqlite3, os, re, json, uuid, io, base64, hashlib, tempfile, threading, logging, queue, random, fcntl, resource
+import gzip, shutil, hmac
+import click
+from contextlib import contextmanager
+from collections import OrderedDict
+from functools import wraps
+from flask import Flask, request, jsonify, g, Response, has_app_context, send_file
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.routing import BaseConverter
+from datetime import datetime, timezone
+
+class Cartly(Flask):
+    def dispatch_request(self):
+        # The view alone, after every before_request hook (see Request tracing and Profiling)
+        with span("handler"), profiled():
+            return super().dispatch_request()
+
+app = Cartly(__name__)
 DB_PATH = os.path.join(os.environ.get("DB_DIR", "/app/data"), "shopping.db")
 
 # ---------------------------------------------------------------------------
 # Database helpers
 # ---------------------------------------------------------------------------
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "50"))
+QUERY_COUNT_WARN = int(os.environ.get("QUERY_COUNT_WARN", "50"))
+sql_log = logging.getLogger("cartly.sql")
+
+class TracedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that counts and times every statement.
+
+    Statements slower than SLOW_QUERY_MS are logged together with their
+    EXPLAIN QUERY PLAN so table scans show up in the logs. Timings cover
+    execution up to the first row; fetching the remainder is not included.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_count = 0
+        self.query_time = 0.0
+        self._explaining = False
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        # Fires for every statement SQLite runs, including BEGIN/COMMIT
+        if not self._explaining:
+            self.query_count += 1
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        self.query_time += elapsed
+        trace = current_trace()
+        if trace is not None and trace.recording:
+            trace.add("sql", start, start + elapsed, sql=" ".join(sql.split())[:TRACE_SQL_CHARS])
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            self._log_slow(sql, parameters, elapsed)
+        return cursor
+
+    def _log_slow(self, sql, parameters, elapsed):
+        try:
+            plan = "; ".join(explain_query_plan(self, sql, parameters))
+        except sqlite3.Error:
+            plan = "n/a"
+        sql_log.warning("slow query (%.1f ms) [%s]: %s | plan: %s",
+                        elapsed * 1000, current_request_id(), " ".join(sql.split()), plan)
+
+def explain_query_plan(db, sql, parameters=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement."""
+    traced = isinstance(db, TracedConnection)
+    if traced:
+        db._explaining = True
+    try:
+        rows = sqlite3.Connection.execute(db, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    finally:
+        if traced:
+            db._explaining = False
+    return [row[3] for row in rows]
+
+# ---------------------------------------------------------------------------
+# Request tracing
+# ---------------------------------------------------------------------------
+# Every request gets an id: nginx's $request_id from X-Request-ID, or a new
+# one. It is echoed in the response and appears in slow-query log lines. With
+# TRACE_FILE set, each request also collects spans (the handler, every SQL
+# statement, queued writes and their group commit, Pillow work and JSON
+# serialization). The trace is appended as one JSON line when the request was
+# sampled (TRACE_SAMPLE_RATE), slower than TRACE_SLOW_MS or failed with a 5xx,
+# so a slow request can be explained after the fact. All workers append to
+# the same file; it is rotated at TRACE_MAX_BYTES, keeping TRACE_BACKUPS.
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "500"))
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", str(16 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.environ.get("TRACE_BACKUPS", "3"))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "1000"))
+TRACE_SQL_CHARS = 200
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+trace_log = logging.getLogger("cartly.trace")
+
+class Trace:
+    """Spans of one request; times are milliseconds from the start of the request."""
+    __slots__ = ("request_id", "start", "recording", "spans", "dropped")
+
+    def __init__(self, request_id, recording):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.recording = recording
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, name, start, end, **attrs):
+        if not self.recording:
+            return
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({"name": name, "start_ms": round((start - self.start) * 1000, 3),
+                           "ms": round((end - start) * 1000, 3), **attrs})
+
+# The trace of the request a thread is working for; the writer thread adopts
+# the trace of each operation it runs
+_trace_local = threading.local()
+
+def current_trace():
+    return getattr(_trace_local, "trace", None)
+
+def current_request_id():
+    trace = current_trace()
+    return trace.request_id if trace is not None else "-"
+
+@contextmanager
+def span(name, **attrs):
+    """Record the enclosed block as a span of the current request's trace, if any."""
+    trace = current_trace()
+    if trace is None or not trace.recording:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), **attrs)
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TraceLog:
+    """JSON-lines file shared by all workers; each trace is one O_APPEND write."""
+
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.written = 0
+        self.errors = 0
+
+    def write(self, record):
+        line = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            self.written += 1
+            if size >= self.max_bytes:
+                self.rotate()
+        except OSError as e:
+            self.errors += 1
+            trace_log.warning("could not write trace %s: %s", record.get("request_id"), e)
+
+    def rotate(self):
+        # Whichever worker gets the lock first rotates; the others see a small file
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.getsize(self.path) < self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            if self.backups:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.unlink(self.path)
+
+traces = TraceLog(TRACE_FILE)
+
+class TracedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with span("serialize"):
+            return super().dumps(obj, **kwargs)
+
+app.json = TracedJSONProvider(app)
+
+@app.before_request
+def start_trace():
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")
+    if not REQUEST_ID_RE.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    _trace_local.trace = Trace(request_id, bool(TRACE_FILE))
+
+@app.after_request
+def add_request_id(response):
+    trace = current_trace()
+    if trace is not None:
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        g.trace_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_trace(exc):
+    trace = current_trace()
+    _trace_local.trace = None
+    if trace is None or not trace.recording:
+        return
+    duration_ms = (time.perf_counter() - trace.start) * 1000
+    status = 500 if exc is not None else g.get("trace_status", 500)
+    if status >= 500:
+        reason = "error"
+    elif duration_ms >= TRACE_SLOW_MS:
+        reason = "slow"
+    elif random.random() < TRACE_SAMPLE_RATE:
+        reason = "sampled"
+    else:
+        return
+    traces.write({
+        "request_id": trace.request_id,
+        "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "household": g.get("household"),
+        "status": status,
+        "ms": round(duration_ms, 3),
+        "reason": reason,
+        "spans": trace.spans,
+        "dropped_spans": trace.dropped,
+    })
+
+# ---------------------------------------------------------------------------
+# Row ids
+# ---------------------------------------------------------------------------
+# Rows are keyed by time-ordered UUIDs (version 7) stored as 16-byte blobs in
+# columns declared `UUID BLOB` (BLOB affinity; "UUID" names the converter).
+# New rows land at the right-hand edge of the primary-key index instead of at
+# random pages. Connections hand ids to Python as uuid.UUID, which Flask
+# serialises as the usual string, and bind uuid.UUID back as 16 bytes, so the
+# API keeps its string ids. Values that are not UUIDs pass through unchanged
+# and simply match nothing.
+def uuid7():
+    """A new version 7 UUID: 48-bit Unix milliseconds, then random bits."""
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = ((time.time_ns() // 1_000_000) << 80) | (0x7 << 76) | ((rand >> 62) & 0xFFF) << 64 \
+        | (0b10 << 62) | (rand & ((1 << 62) - 1))
+    return uuid.UUID(int=value)
+
+def parse_id(value):
+    """An id from the API (URL or JSON body) as uuid.UUID; anything else is returned unchanged."""
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            pass
+    return value
+
+def uuid_blob(value):
+    """SQL function: the 16-byte form of a UUID string (e.g. from json_each), else the value unchanged."""
+    value = parse_id(value)
+    return value.bytes if isinstance(value, uuid.UUID) else value
+
+def _uuid_from_db(data):
+    """
+    Converter for `UUID` columns, the inverse of uuid_blob(). The 16 bytes of
+    a UUID are never printable text, so a 16-character legacy id stays a
+    string; text that parses as a UUID reads back as one, as it would have been
+    stored as a blob had it been written through uuid_blob().
+    """
+    try:
+        text = data.decode()
+    except UnicodeDecodeError:
+        text = None
+    if len(data) == 16 and (text is None or not text.isprintable()):
+        return uuid.UUID(bytes=data)
+    return data if text is None else parse_id(text)
+
+sqlite3.register_adapter(uuid.UUID, lambda u: u.bytes)
+sqlite3.register_converter("UUID", _uuid_from_db)
+
+class IdConverter(BaseConverter):
+    """`<id:name>` URL segment, passed to the view through parse_id."""
+
+    def to_python(self, value):
+        return parse_id(value)
+
+    def to_url(self, value):
+        return str(value)
+
+app.url_map.converters["id"] = IdConverter
+
+# Per-connection pragma profile. The WAL is checkpointed in the background
+# (see Storage maintenance); wal_autocheckpoint is only a backstop.
+SQLITE_PRAGMAS = {
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_SIZE_KB", "16384")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper(),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY").upper(),
+    "journal_size_limit": int(os.environ.get("SQLITE_JOURNAL_SIZE_LIMIT", str(64 * 1024 * 1024))),
+    "wal_autocheckpoint": int(os.environ.get("SQLITE_WAL_AUTOCHECKPOINT", "10000")),
+}
+if SQLITE_PRAGMAS["synchronous"] not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError("SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA")
+if SQLITE_PRAGMAS["temp_store"] not in ("DEFAULT", "FILE", "MEMORY"):
+    raise ValueError("SQLITE_TEMP_STORE must be DEFAULT, FILE or MEMORY")
+
+def open_connection(path, **kwargs):
+    """Open a traced connection to `path` with the pragmas every connection needs."""
+    conn = sqlite3.connect(path, factory=TracedConnection, detect_types=sqlite3.PARSE_DECLTYPES, **kwargs)
+    conn.path = path
+    conn.row_factory = sqlite3.Row
+    conn.create_function("uuid7", 0, lambda: uuid7().bytes)
+    conn.create_function("uuid_blob", 1, uuid_blob, deterministic=True)
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DB_PATH)
-        g.db.row_factory = sqlite3.Row
-        g.db.execute("PRAGMA journal_mode=WAL")
-        g.db.execute("PRAGMA foreign_keys=ON")
+        g.db = connections.acquire(db_path())
     return g.db
 
+def request_query_count():
+    """Number of SQL statements the current request has run so far, writes included."""
+    return (g.db.query_count if "db" in g else 0) + g.get("write_query_count", 0)
+
 @app.teardown_appcontext
 def close_db(exc):
     db = g.pop("db", None)
     if db:
-        db.close()
+        connections.release(db)
+
+# ---------------------------------------------------------------------------
+# Households (one database file per household)
+# ---------------------------------------------------------------------------
+# With SHARD_DIR set, a request naming a household (X-Household header or a
+# /h/<household>/ path prefix) reads and writes SHARD_DIR/<household>.db. The
+# writer gives every file its own queue and thread, so households never wait
+# on each other's write lock or retries. Requests without a
+# household use DB_PATH. Shards are created with `flask shards create`; a
+# request naming a household without one gets a 404, so clients cannot make
+# the server create files.
+SHARD_DIR = os.environ.get("SHARD_DIR")
+SHARD_CONNECTIONS = int(os.environ.get("SHARD_CONNECTIONS", "16"))
+HOUSEHOLD_HEADER = "X-Household"
+# At most 63 characters, so a household never collides with a 64-character photo hash
+HOUSEHOLD_RE = re.compile(r"[a-z0-9][a-z0-9_-]{0,62}")
+
+class HouseholdPrefix:
+    """WSGI middleware that moves a /h/<household> path prefix into SCRIPT_NAME."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        parts = environ.get("PATH_INFO", "").split("/", 3)
+        if len(parts) == 4 and parts[0] == "" and parts[1] == "h":
+            environ["cartly.household"] = parts[2]
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + f"/h/{parts[2]}"
+            environ["PATH_INFO"] = "/" + parts[3]
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = HouseholdPrefix(app.wsgi_app)
+
+class ConnectionCache:
+    """
+    Per-thread LRU of open read connections, one per database file.
+
+    Each gunicorn thread serves one request at a time, so a thread's
+    connections are never shared. Connections stay open between requests;
+    the least recently used one is closed once a thread holds `max_connections`.
+    """
+
+    def __init__(self, max_connections=SHARD_CONNECTIONS):
+        self.max_connections = max_connections
+        self.opened = 0
+        self.evictions = 0
+        self._local = threading.local()
+
+    def acquire(self, path):
+        conns = self._local.__dict__.setdefault("conns", OrderedDict())
+        conn = conns.pop(path, None)
+        if conn is None:
+            conn = open_connection(path)
+            self.opened += 1
+            while len(conns) >= self.max_connections:
+                conns.popitem(last=False)[1].close()
+                self.evictions += 1
+        conns[path] = conn  # re-insert as most recently used
+        conn.query_count = 0
+        conn.query_time = 0.0
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def close_all(self):
+        """Close this thread's connections."""
+        conns = self._local.__dict__.pop("conns", {})
+        for conn in conns.values():
+            conn.close()
+
+connections = ConnectionCache()
+
+def shard_path(household):
+    return os.path.join(SHARD_DIR, f"{household}.db")
+
+def current_household():
+    """Household of the current request, or None for the default database."""
+    return g.get("household") if has_app_context() else None
+
+def db_path():
+    """Database file for the current request."""
+    household = current_household()
+    return shard_path(household) if household else DB_PATH
+
+def household_prefix():
+    """URL prefix that routes a browser request back to the current household."""
+    household = current_household()
+    return f"/h/{household}" if household else ""
+
+def household_subdir(root, path=None):
+    """`root` for the default database, `root/<household>` for the shard at `path` (default: the current request's)."""
+    path = path or db_path()
+    return root if path == DB_PATH else os.path.join(root, os.path.splitext(os.path.basename(path))[0])
+
+_ready_shards = set()
+
+@app.before_request
+def select_household():
+    household = request.environ.get("cartly.household") or request.headers.get(HOUSEHOLD_HEADER)
+    if not household:
+        return None
+    if not SHARD_DIR:
+        return jsonify({"error": "Households are not enabled"}), 400
+    if not HOUSEHOLD_RE.fullmatch(household):
+        return jsonify({"error": "Invalid household"}), 400
+    path = shard_path(household)
+    if not os.path.exists(path):
+        _ready_shards.discard(path)
+        return jsonify({"error": "Unknown household"}), 404
+    g.household = household
+    if path not in _ready_shards:
+        init_db(path)  # upgrade once per process; a single read when already current
+        _ready_shards.add(path)
+    return None
+
+def iter_shards():
+    """Yield (household, path) for the default database and every household shard."""
+    yield None, DB_PATH
+    if SHARD_DIR and os.path.isdir(SHARD_DIR):
+        for name in sorted(os.listdir(SHARD_DIR)):
+            household, ext = os.path.splitext(name)
+            if ext == ".db" and HOUSEHOLD_RE.fullmatch(household):
+                yield household, os.path.join(SHARD_DIR, name)
+
+# ---------------------------------------------------------------------------
+# Write coordination (group commit)
+# ---------------------------------------------------------------------------
+BUSY_TIMEOUT_MS = int(os.environ.get("BUSY_TIMEOUT_MS", "5000"))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "256"))
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "64"))
+WRITE_RETRIES = int(os.environ.get("WRITE_RETRIES", "5"))
+WRITE_BACKOFF_MS = float(os.environ.get("WRITE_BACKOFF_MS", "20"))
+WRITE_TIMEOUT = float(os.environ.get("WRITE_TIMEOUT", "10"))
+WRITE_MAX_WAIT = float(os.environ.get("WRITE_MAX_WAIT", "15"))
+
+class WriteQueueFull(Exception):
+    """Raised when the writer queue stays full for longer than WRITE_TIMEOUT."""
+
+class WriteBusy(Exception):
+    """Raised when a write could not get the database write lock within WRITE_MAX_WAIT."""
+
+class _WriteOp:
+    __slots__ = ("fn", "path", "deadline", "cancelled", "done", "result", "error", "query_count", "trace")
+
+    def __init__(self, fn, path):
+        self.fn = fn
+        self.path = path
+        self.deadline = time.monotonic() + WRITE_MAX_WAIT
+        self.cancelled = False
+        self.trace = current_trace()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.query_count = 0
+
+def _is_busy(exc):
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "locked" in str(exc) or "busy" in str(exc))
+
+class _WriteLane:
+    """Queue and connection of one database file, drained by its own thread."""
+    __slots__ = ("path", "queue", "conn", "busy_timeout_ms", "pending")
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.queue = queue.Queue(maxsize)
+        self.conn = None
+        self.busy_timeout_ms = BUSY_TIMEOUT_MS
+        self.pending = 0  # submitted ops not yet done
+
+class WriteQueue:
+    """
+    Per-process writer that serializes the mutations of each database file.
+
+    Route handlers submit a function taking the writer's connection. Every
+    file (the default database and each household shard) has its own lane:
+    a queue, a thread and a connection. The thread drains whatever has
+    queued up, runs each operation in its own SAVEPOINT (so one failing
+    operation does not sink the others) and commits the whole batch in a
+    single transaction. SQLITE_BUSY from other workers is retried with
+    jittered exponential backoff, which only holds up writes to that file.
+    An op that has not committed WRITE_MAX_WAIT seconds after it was
+    submitted fails with WriteBusy instead of waiting any longer.
+    At most `max_connections` lanes are kept; the least recently used idle
+    lane is shut down to make room.
+    """
+
+    def __init__(self, maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, max_connections=SHARD_CONNECTIONS):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_connections = max_connections
+        self.batches = 0
+        self.ops = 0
+        self.retries = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._lanes = OrderedDict()
+
+    def _lane(self, path):
+        """The lane for `path` (started lazily, and again after fork), with one more pending op."""
+        with self._lock:
+            if self._pid != os.getpid():  # lanes and threads do not survive a fork
+                self._lanes = OrderedDict()
+                self._pid = os.getpid()
+            lane = self._lanes.pop(path, None)
+            if lane is None:
+                self._evict()
+                lane = _WriteLane(path, self.maxsize)
+                name = f"cartly-writer-{os.path.basename(path)}"
+                threading.Thread(target=self._run, args=(lane,), name=name, daemon=True).start()
+            self._lanes[path] = lane  # re-insert as most recently used
+            lane.pending += 1
+            return lane
+
+    def _evict(self):
+        # Called with the lock held. A lane with no pending ops has an empty
+        # queue and gets none after it leaves self._lanes, so the sentinel is last.
+        while len(self._lanes) >= self.max_connections:
+            idle = next((path for path, lane in self._lanes.items() if lane.pending == 0), None)
+            if idle is None:
+                return
+            self._lanes.pop(idle).queue.put(None)
+
+    def submit(self, fn, path):
+        """Queue `fn(conn)` for `path`, wait for its batch to commit and return (result, query_count)."""
+        op = _WriteOp(fn, path)
+        lane = self._lane(path)
+        try:
+            try:
+                lane.queue.put(op, timeout=WRITE_TIMEOUT)
+            except queue.Full:
+                raise WriteQueueFull()
+            if not op.done.wait(op.deadline - time.monotonic() + WRITE_TIMEOUT):
+                op.cancelled = True  # still queued or running; dropped if it has not started
+                raise WriteBusy()
+        finally:
+            with self._lock:
+                lane.pending -= 1
+        if op.error is not None:
+            raise op.error
+        return op.result, op.query_count
+
+    def depth(self):
+        with self._lock:
+            lanes = list(self._lanes.values()) if self._pid == os.getpid() else []
+        return sum(lane.queue.qsize() for lane in lanes)
+
+    def _run(self, lane):
+        while True:
+            op = lane.queue.get()
+            if op is None:
+                break
+            batch = [op]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(lane.queue.get_nowait())
+                except queue.Empty:
+                    break
+            now = time.monotonic()
+            expired = [op for op in batch if op.cancelled or op.deadline <= now]
+            batch = [op for op in batch if not (op.cancelled or op.deadline <= now)]
+            try:
+                if batch:
+                    self._commit(lane, batch)
+            except Exception as e:  # never let the writer thread die
+                for op in batch:
+                    op.error = op.error or e
+            for op in expired:
+                op.error = WriteBusy()
+            for op in expired + batch:
+                op.done.set()
+        if lane.conn is not None:
+            lane.conn.close()
+
+    def _commit(self, lane, ops):
+        deadline = min(op.deadline for op in ops)
+        for attempt in range(WRITE_RETRIES + 1):
+            conn = None
+            try:
+                if lane.conn is None:
+                    lane.conn = open_connection(lane.path, isolation_level=None, check_same_thread=False)
+                    lane.busy_timeout_ms = BUSY_TIMEOUT_MS
+                conn = lane.conn
+                # Never wait on the lock past the batch's deadline
+                busy_timeout_ms = max(0, min(BUSY_TIMEOUT_MS, int((deadline - time.monotonic()) * 1000)))
+                if busy_timeout_ms != lane.busy_timeout_ms:
+                    conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+                    lane.busy_timeout_ms = busy_timeout_ms
+                conn.execute("BEGIN IMMEDIATE")
+                for op in ops:
+                    before = conn.query_count
+                    _trace_local.trace = op.trace  # the op's SQL lands in its request's trace
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        op.result = op.fn(conn)
+                        op.error = None
+                        conn.execute("RELEASE op")
+                    except Exception as e:
+                        if _is_busy(e):
+                            raise
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                        op.error = e
+                    finally:
+                        _trace_local.trace = None
+                    op.query_count = conn.query_count - before
+                commit_start = time.perf_counter()
+                conn.execute("COMMIT")
+                commit_end = time.perf_counter()
+                for op in ops:
+                    if op.trace is not None:
+                        op.trace.add("commit", commit_start, commit_end, batch=len(ops), attempt=attempt)
+                with self._lock:
+                    self.batches += 1
+                    self.ops += len(ops)
+                return
+            except sqlite3.OperationalError as e:
+                if conn is not None and conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not _is_busy(e):
+                    raise
+                delay = WRITE_BACKOFF_MS / 1000 * (2 ** attempt)
+                if attempt == WRITE_RETRIES or time.monotonic() + delay / 2 >= deadline:
+                    raise WriteBusy() from e
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+writer = WriteQueue()
+
+def run_write(fn):
+    """Run `fn(db)` through the per-process writer and return its result."""
+    path = db_path()
+    with span("write"):
+        result, queries = writer.submit(fn, path)
+    maintenance.touch(path)
+    if has_app_context():
+        g.write_query_count = g.get("write_query_count", 0) + queries
+    return result
+
+@app.errorhandler(WriteQueueFull)
+def write_queue_full(exc):
+    return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
+@app.errorhandler(WriteBusy)
+def write_busy(exc):
+    return jsonify({"error": "Database busy, please retry"}), 503, {"Retry-After": "1"}
+
+# ---------------------------------------------------------------------------
+# Metrics (Prometheus text format, aggregated across gunicorn workers)
+# ---------------------------------------------------------------------------
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(tempfile.gettempdir(), "cartly-metrics"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+metric_collectors = []
+
+def metric_collector(fn):
+    """Register `fn() -> {metric_name: value}`; values are summed across workers."""
+    metric_collectors.append(fn)
+    return fn
+
+class Metrics:
+    """
+    Per-process request metrics, shared with sibling workers through files.
+
+    Each worker keeps its counters in memory and periodically writes them to
+    METRICS_DIR/<pid>.json. A scrape of /api/metrics (served by any worker)
+    merges every worker's file, so the totals cover the whole gunicorn pool.
+    """
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._data = {"requests": {}, "latency": {}, "size": {}, "queries": {}}
+
+    @staticmethod
+    def _observe_histogram(hist, key, buckets, value):
+        entry = hist.setdefault(key, {"buckets": [0] * len(buckets), "sum": 0, "count": 0})
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                entry["buckets"][i] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+    def observe(self, endpoint, method, status, seconds, size, queries):
+        """Record one finished request."""
+        key = f"{endpoint} {method}"
+        with self._lock:
+            requests = self._data["requests"]
+            req_key = f"{key} {status}"
+            requests[req_key] = requests.get(req_key, 0) + 1
+            self._observe_histogram(self._data["latency"], key, LATENCY_BUCKETS, seconds)
+            self._observe_histogram(self._data["size"], key, SIZE_BUCKETS, size)
+            self._data["queries"][key] = self._data["queries"].get(key, 0) + queries
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this worker's counters to its shared file (atomic replace)."""
+        os.makedirs(self.directory, exist_ok=True)
+        gauges = {}
+        for collect in metric_collectors:
+            gauges.update(collect())
+        with self._lock:
+            payload = json.dumps(dict(self._data, gauges=gauges))
+            self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Merge the files of every worker into one data set."""
+        self.flush()
+        merged = {"requests": {}, "latency": {}, "size": {}, "queries": {}, "gauges": {}}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # worker is mid-write or the file vanished
+            # Gauges describe live processes only; counters of exited workers still count
+            if not _pid_alive(name[:-len(".json")]):
+                data.pop("gauges", None)
+            for section in ("requests", "queries", "gauges"):
+                for key, value in data.get(section, {}).items():
+                    merged[section][key] = merged[section].get(key, 0) + value
+            for section in ("latency", "size"):
+                for key, entry in data.get(section, {}).items():
+                    into = merged[section].setdefault(
+                        key, {"buckets": [0] * len(entry["buckets"]), "sum": 0, "count": 0})
+                    into["buckets"] = [a + b for a, b in zip(into["buckets"], entry["buckets"])]
+                    into["sum"] += entry["sum"]
+                    into["count"] += entry["count"]
+        return merged
+
+    def render(self):
+        """Render the merged metrics in the Prometheus text exposition format."""
+        data = self.collect()
+        lines = [
+            "# HELP cartly_requests_total Requests handled, by endpoint, method and status.",
+            "# TYPE cartly_requests_total counter",
+        ]
+        for key, value in sorted(data["requests"].items()):
+            endpoint, method, status = key.split(" ")
+            lines.append(f'cartly_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+
+        def histogram(name, help_text, hist, buckets):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, entry in sorted(hist.items()):
+                endpoint, method = key.split(" ")
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for bound, count in zip(buckets, entry["buckets"]):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+                lines.append(f"{name}_sum{{{labels}}} {entry['sum']}")
+                lines.append(f"{name}_count{{{labels}}} {entry['count']}")
+
+        histogram("cartly_request_duration_seconds", "Request latency in seconds.",
+                  data["latency"], LATENCY_BUCKETS)
+        histogram("cartly_response_size_bytes", "Response body size in bytes.",
+                  data["size"], SIZE_BUCKETS)
+
+        lines.append("# HELP cartly_sql_queries_total SQL statements executed, by endpoint.")
+        lines.append("# TYPE cartly_sql_queries_total counter")
+        for key, value in sorted(data["queries"].items()):
+            endpoint, method = key.split(" ")
+            lines.append(f'cartly_sql_queries_total{{endpoint="{endpoint}",method="{method}"}} {value}')
+
+        for name, value in sorted(data["gauges"].items()):
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _resident_memory_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@metric_collector
+def process_metrics():
+    # Summed across workers: divide by cartly_worker_processes for a per-worker figure
+    return {
+        "cartly_worker_processes": 1,
+        "cartly_worker_resident_memory_bytes": _resident_memory_bytes(),
+        "cartly_worker_import_seconds": IMPORT_SECONDS,
+    }
+
+metrics = Metrics(METRICS_DIR)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_start" in g:
+        metrics.observe(
+            request.endpoint or "unmatched",
+            request.method,
+            response.status_code,
+            time.perf_counter() - g.request_start,
+            response.calculate_content_length() or 0,
+            request_query_count(),
+        )
+        g.metrics_recorded = True
+    if request_query_count() > QUERY_COUNT_WARN:
+        sql_log.warning("%s %s ran %d queries [%s]", request.method, request.path, request_query_count(),
+                        current_request_id())
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exc):
+    # after_request is skipped for unhandled exceptions; count them as 500s
+    if exc is not None and "request_start" in g and not g.get("metrics_recorded"):
+        metrics.observe(request.endpoint or "unmatched", request.method, 500,
+                        time.perf_counter() - g.request_start, 0, request_query_count())
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ---------------------------------------------------------------------------
+# Admission control
+# ---------------------------------------------------------------------------
+# Every gunicorn worker has a fixed number of threads, and a request that waits
+# for one is invisible to everything else. Routes marked @heavy (exports,
+# imports, photo uploads, backups) get at most HEAVY_CONCURRENCY threads per
+# worker plus HEAVY_QUEUE waiting ones, so the rest always stay free for
+# interactive list traffic. A heavy request that would queue past the depth
+# limit, or whose expected wait exceeds HEAVY_MAX_WAIT, is refused at once
+# with 503 and Retry-After instead of tying up a thread. Light routes are
+# unlimited unless LIGHT_CONCURRENCY is set.
+HEAVY_CONCURRENCY = int(os.environ.get("HEAVY_CONCURRENCY", "1"))
+HEAVY_QUEUE = int(os.environ.get("HEAVY_QUEUE", "1"))
+HEAVY_MAX_WAIT = float(os.environ.get("HEAVY_MAX_WAIT", "2"))
+LIGHT_CONCURRENCY = int(os.environ.get("LIGHT_CONCURRENCY", "0"))
+LIGHT_QUEUE = int(os.environ.get("LIGHT_QUEUE", "16"))
+LIGHT_MAX_WAIT = float(os.environ.get("LIGHT_MAX_WAIT", "1"))
+
+class AdmissionRejected(Exception):
+    """Raised when a route class is saturated; carries the Retry-After seconds."""
+
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class} requests saturated ({reason})")
+        self.retry_after = retry_after
+
+class AdmissionClass:
+    """
+    Concurrency limit with a bounded wait queue for one class of routes.
+
+    A limit of 0 admits everything and only counts. The expected wait is the
+    queue ahead of the caller times a moving average of how long a slot is
+    held, so a burst is shed before anyone blocks on it.
+    """
+
+    def __init__(self, name, limit, max_queue, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.hold_seconds = 0.0  # moving average of slot hold time
+        self._cond = threading.Condition()
+
+    def expected_wait(self, ahead):
+        return (ahead // self.limit + 1) * self.hold_seconds
+
+    def _reject(self, reason, wait):
+        self.rejected += 1
+        raise AdmissionRejected(self.name, reason, min(int(wait) + 1, 60))
+
+    def acquire(self):
+        """Take a slot, waiting up to max_wait; raises AdmissionRejected. Returns the acquire time."""
+        started = time.monotonic()
+        with self._cond:
+            if self.limit > 0 and (self.in_flight >= self.limit or self.waiting):
+                if self.waiting >= self.max_queue:
+                    self._reject("queue", self.expected_wait(self.waiting))
+                if self.expected_wait(self.waiting) > self.max_wait:
+                    self._reject("wait", self.expected_wait(self.waiting))
+                self.waiting += 1
+                try:
+                    deadline = started + self.max_wait
+                    while self.in_flight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject("timeout", self.expected_wait(self.waiting))
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            now = time.monotonic()
+            self.wait_seconds += now - started
+        return now
+
+    def release(self, acquired):
+        held = time.monotonic() - acquired
+        with self._cond:
+            self.in_flight -= 1
+            self.hold_seconds = held if not self.hold_seconds else 0.8 * self.hold_seconds + 0.2 * held
+            self._cond.notify()
+
+admission = {
+    "heavy": AdmissionClass("heavy", HEAVY_CONCURRENCY, HEAVY_QUEUE, HEAVY_MAX_WAIT),
+    "light": AdmissionClass("light", LIGHT_CONCURRENCY, LIGHT_QUEUE, LIGHT_MAX_WAIT),
+}
+
+def heavy(view):
+    """Mark a route as heavy (slow, CPU or I/O bound) for admission control."""
+    view.route_class = "heavy"
+    return view
+
+@app.before_request
+def admit_request():
+    view = app.view_functions.get(request.endpoint)
+    route_class = admission[getattr(view, "route_class", "light")]
+    with span("admission", route_class=route_class.name):
+        g.admission = (route_class, route_class.acquire())
+
+@app.teardown_request
+def release_admission(exc):
+    if "admission" in g:
+        route_class, acquired = g.pop("admission")
+        route_class.release(acquired)
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(exc):
+    return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": str(exc.retry_after)}
+
+@metric_collector
+def admission_metrics():
+    stats = {}
+    for name, route_class in admission.items():
+        stats.update({
+            f"cartly_admission_{name}_in_flight": route_class.in_flight,
+            f"cartly_admission_{name}_waiting": route_class.waiting,
+            f"cartly_admission_{name}_admitted_total": route_class.admitted,
+            f"cartly_admission_{name}_rejected_total": route_class.rejected,
+            f"cartly_admission_{name}_wait_seconds_total": route_class.wait_seconds,
+        })
+    return stats
+
+# ---------------------------------------------------------------------------
+# Recipe read cache
+# ---------------------------------------------------------------------------
+RECIPE_CACHE_BYTES = int(os.environ.get("RECIPE_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+class RecipeCache:
+    """
+    Size-bounded LRU of serialized recipe responses.
+
+    Entries are tagged with the database's 'recipes' revision, which triggers
+    bump on every write to recipes, ingredients or steps. Reading that one
+    row tells any worker whether its cache is still current, so invalidation
+    works across gunicorn workers without an external cache.
+    """
+
+    def __init__(self, max_bytes=RECIPE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._revs = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, rev, key):
+        with self._lock:
+            if self._revs.get(path) != rev:
+                self._invalidate(path, rev)
+            body = self._entries.get((path, key))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((path, key))
+            self.hits += 1
+            return body
+
+    def put(self, path, rev, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if self._revs.get(path) != rev:
+                return  # a write landed while building; don't cache stale data
+            old = self._entries.pop((path, key), None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[(path, key)] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def _invalidate(self, path, rev):
+        for entry_key in [k for k in self._entries if k[0] == path]:
+            self.size -= len(self._entries.pop(entry_key))
+        if path in self._revs:
+            self.invalidations += 1
+        self._revs[path] = rev
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revs.clear()
+            self.size = 0
+
+recipe_cache = RecipeCache()
+
+@metric_collector
+def recipe_cache_metrics():
+    return {
+        "cartly_recipe_cache_hits_total": recipe_cache.hits,
+        "cartly_recipe_cache_misses_total": recipe_cache.misses,
+        "cartly_recipe_cache_evictions_total": recipe_cache.evictions,
+        "cartly_recipe_cache_invalidations_total": recipe_cache.invalidations,
+        "cartly_recipe_cache_bytes": recipe_cache.size,
+        "cartly_recipe_cache_entries": len(recipe_cache._entries),
+    }
+
+@metric_collector
+def trace_metrics():
+    return {
+        "cartly_traces_written_total": traces.written,
+        "cartly_trace_write_errors_total": traces.errors,
+    }
 
+@metric_collector
+def connection_cache_metrics():
+    return {
+        "cartly_db_connections_opened_total": connections.opened,
+        "cartly_db_connection_evictions_total": connections.evictions,
+    }
+
+def cached_recipe_response(key, build):
+    """
+    Serve a recipe read from the cache, calling `build(db)` on a miss.
+
+    `build` returns JSON-serialisable data, or None for "not found" (which is
+    not cached and makes this return None).
+    """
+    db = get_db()
+    rev = current_revision("recipes")
+    body = recipe_cache.get(db_path(), rev, key)
+    if body is None:
+        data = build(db)
+        if data is None:
+            return None
+        body = (app.json.dumps(data) + "\n").encode()
+        recipe_cache.put(db_path(), rev, key, body)
+    return app.response_class(body, mimetype="application/json")
+
+# ---------------------------------------------------------------------------
+# HTTP caching (nginx micro-cache)
+# ---------------------------------------------------------------------------
+# Hot reads carry an ETag built from the `revisions` row of their scope and
+# X-Accel-Expires, which opts them into nginx's short-lived proxy cache (see
+# nginx/nginx.conf). Successful writes set the cartly_v cookie to the
+# revisions they leave behind. The cookie is part of nginx's cache key, so the
+# writer's next read bypasses entries from before the write, and clients at
+# the same revisions share entries again.
+MICROCACHE_SECONDS = int(os.environ.get("MICROCACHE_SECONDS", "1"))
+CACHE_BUST_COOKIE = "cartly_v"
+
+def current_revision(scope):
+    """Revision counter for `scope`, read once per request."""
+    revisions = g.setdefault("revisions", {})
+    if scope not in revisions:
+        revisions[scope] = get_db().execute("SELECT rev FROM revisions WHERE scope=?", (scope,)).fetchone()["rev"]
+    return revisions[scope]
+
+def revision_etag(scope):
+    """Decorator for GET views whose output only changes when `scope`'s revision does."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Households count revisions independently, so the household is
+            # part of the ETag, and Vary keeps header-selected ones apart in browser caches
+            household = current_household()
+            etag = f"{household}:{scope}-{current_revision(scope)}" if household else f"{scope}-{current_revision(scope)}"
+            headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": HOUSEHOLD_HEADER,
+                       "X-Accel-Expires": str(MICROCACHE_SECONDS)}
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers=headers)
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.headers.update(headers)
+            return response
+        return wrapper
+    return decorator
+
+@app.after_request
+def bust_microcache(response):
+    if request.method not in ("GET", "HEAD") and response.status_code < 400:
+        revisions = get_db().execute(
+            "SELECT rev FROM revisions WHERE scope IN ('lists', 'recipes') ORDER BY scope").fetchall()
+        response.set_cookie(CACHE_BUST_COOKIE, ".".join(str(r["rev"]) for r in revisions), path=request.script_root + "/api/", httponly=True, samesite="Lax")
+    return response
+
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+MAX_PHOTO_PIXELS = int(os.environ.get("MAX_PHOTO_PIXELS", str(50_000_000)))
+PHOTO_FORMATS = ("JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF")
+# Stored photos are served from the app's own origin, so only these passive
+# types are ever stored or served; uploads in other formats become WebP
+PHOTO_MIMES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+class PhotoRejected(ValueError):
+    """The upload is not an image we accept; the message is safe to show users."""
+
+def open_recipe_photo(source):
+    """
+    Open an image lazily and validate it from its header alone.
+
+    Only the header has been read when this returns, so bad formats and
+    oversized dimensions are rejected before any pixels are decoded.
+    """
+    from PIL import Image, UnidentifiedImageError  # imported lazily: only the photo routes need Pillow
+    Image.MAX_IMAGE_PIXELS = MAX_PHOTO_PIXELS  # decompression-bomb guard for anything we miss
+
+    try:
+        image = Image.open(source)
+    except UnidentifiedImageError:
+        raise PhotoRejected("File must be an image")
+    except Image.DecompressionBombError:
+        raise PhotoRejected("Image dimensions too large")
+    if image.format not in PHOTO_FORMATS:
+        raise PhotoRejected(f"Unsupported image format: {image.format}")
+    if image.width * image.height > MAX_PHOTO_PIXELS:
+        raise PhotoRejected("Image dimensions too large")
+    return image
+
+@traced("pillow")
 def process_recipe_photo(file_data, max_width=800):
     """
-    Process uploaded image: resize and convert to WebP base64.
+    Process uploaded image: resize and convert to WebP.
 
     Args:
-        file_data: File bytes from upload
+        file_data: File bytes or a readable binary stream from upload
         max_width: Maximum width in pixels (default 800)
 
     Returns:
-        Base64-encoded WebP image with data URI prefix
+        WebP image bytes
     """
-    # Open image
-    image = Image.open(io.BytesIO(file_data))
+    from PIL import Image
+    if isinstance(file_data, (bytes, bytearray)):
+        file_data = io.BytesIO(file_data)
+    image = open_recipe_photo(file_data)
+
+    # JPEG can decode straight to 1/2, 1/4 or 1/8 scale; ask for the smallest
+    # scale that still covers the target so a 24MP photo never decodes in full
+    if image.format == "JPEG" and image.width > max_width:
+        image.draft("RGB", (max_width, max(1, image.height * max_width // image.width)))
 
     # Convert RGBA to RGB if needed
     if image.mode in ('RGBA', 'LA', 'P'):
         background = Image.new('RGB', image.size, (255, 255, 255))
         if image.mode == 'P':
             image = image.convert('RGBA')
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
         image = background
 
     # Resize maintaining aspect ratio
@@ -54,16 +1255,131 @@ def process_recipe_photo(file_data, max_width=800):
     # Convert to WebP
     output = io.BytesIO()
     image.save(output, format='WEBP', quality=85)
-    webp_data = output.getvalue()
+    return output.getvalue()
+
+# ---------------------------------------------------------------------------
+# Photo store (content-addressed, reference counted)
+# ---------------------------------------------------------------------------
+def hash_stream(stream, chunk_size=64 * 1024):
+    """SHA-256 of a binary stream, read in chunks; the stream is rewound afterwards."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def parse_photo_data_uri(uri):
+    """Split a `data:<mime>;base64,...` URI of an allowed image type into (mime, bytes); None if it isn't one."""
+    if not isinstance(uri, str) or not uri.startswith("data:image/") or ";base64," not in uri:
+        return None
+    header, b64 = uri.split(",", 1)
+    mime = header[len("data:"):-len(";base64")]
+    if mime not in PHOTO_MIMES.values():
+        return None
+    try:
+        return mime, base64.b64decode(b64, validate=True)
+    except ValueError:
+        return None
+
+def checked_photo(parsed):
+    """
+    Validate an imported (mime, bytes) photo with Pillow.
+
+    Returns the photo typed by what Pillow reads from its bytes, or None when
+    it is too large, not an image, or not one of PHOTO_MIMES.
+    """
+    if parsed is None or len(parsed[1]) > MAX_PHOTO_BYTES:
+        return None
+    try:
+        image = open_recipe_photo(io.BytesIO(parsed[1]))
+    except (PhotoRejected, OSError):
+        return None
+    mime = PHOTO_MIMES.get(image.format)
+    return (mime, parsed[1]) if mime else None
+
+def photo_data_uri(mime, data):
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
 
-    # Encode to base64 with data URI
-    b64_string = base64.b64encode(webp_data).decode('utf-8')
-    return f"data:image/webp;base64,{b64_string}"
+def store_photo(db, data, mime="image/webp", source_hash=None):
+    """
+    Insert photo bytes unless identical bytes are already stored; return the photo id.
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.executescript("""
+    Photos are keyed by the SHA-256 of their processed bytes, so the same image
+    attached to several recipes is stored once. Recipe triggers keep refcount.
+    """
+    photo_id = hashlib.sha256(data).hexdigest()
+    db.execute(
+        "INSERT OR IGNORE INTO photos (id, source_hash, mime, refcount, data) VALUES (?, ?, ?, 0, ?)",
+        (photo_id, source_hash, mime, data)
+    )
+    if source_hash:
+        db.execute("UPDATE photos SET source_hash=? WHERE id=? AND source_hash IS NULL", (source_hash, photo_id))
+    return photo_id
+
+def release_photos(db):
+    """Delete photos no recipe references any more, along with their files."""
+    released = [r["id"] for r in db.execute("SELECT id FROM photos WHERE refcount <= 0").fetchall()]
+    if released:
+        db.execute("DELETE FROM photos WHERE refcount <= 0")
+        for photo_id in released:
+            try:
+                os.unlink(photo_file(photo_id, db.path))
+            except FileNotFoundError:
+                pass
+
+def recipe_dict(row):
+    """Recipe row as the API shape, with `photo` as the photo's content-hash URL."""
+    recipe = dict(row)
+    recipe["photo"] = f"{household_prefix()}/api/photos/{recipe['photo_id']}" if recipe["photo_id"] else None
+    return recipe
+
+EXPORT_SELECT = """
+    SELECT r.*, p.mime AS photo_mime, p.data AS photo_data
+    FROM recipes r LEFT JOIN photos p ON p.id = r.photo_id
+"""
+
+def export_photo(row):
+    """Photo of an EXPORT_SELECT row as a self-contained data URI, or None."""
+    return photo_data_uri(row["photo_mime"], row["photo_data"]) if row["photo_data"] is not None else None
+
+# ---------------------------------------------------------------------------
+# Photo files
+# ---------------------------------------------------------------------------
+# The photos table is the source of truth; files under PHOTO_DIR are written
+# from it on first request so nginx can send them itself. With
+# PHOTO_ACCEL_PREFIX set (to an `internal` nginx location aliased to
+# PHOTO_DIR) the photo route answers with X-Accel-Redirect and no body.
+PHOTO_DIR = os.environ.get("PHOTO_DIR")
+PHOTO_ACCEL_PREFIX = os.environ.get("PHOTO_ACCEL_PREFIX", "")
+PHOTO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PHOTO_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; sandbox",
+}
+
+def photo_file(photo_id, path=None):
+    """File for a photo of database `path` (default: the current request's)."""
+    return os.path.join(household_subdir(PHOTO_DIR or os.path.join(os.path.dirname(DB_PATH), "photos"), path),
+                        photo_id)
+
+def materialize_photo(db, photo_id):
+    """Make sure the photo's file exists; return its mime type, or None if unknown."""
+    path = photo_file(photo_id)
+    if os.path.exists(path):
+        row = db.execute("SELECT mime FROM photos WHERE id=?", (photo_id,)).fetchone()
+        return row["mime"] if row else None
+    row = db.execute("SELECT mime, data FROM photos WHERE id=?", (photo_id,)).fetchone()
+    if not row:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(row["data"])
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)  # atomic: concurrent requests never see a partial file
+    return row["mime"]
+
+SCHEMA_SQL = """
         CREATE TABLE IF NOT EXISTS lists (
             id         TEXT PRIMARY KEY,
             name       TEXT NOT NULL,
@@ -115,57 +1431,530 @@ def init_db():
             instruction TEXT NOT NULL,
             FOREIGN KEY(recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
         );
-    """)
-    conn.commit()
-    conn.close()
+        -- Revision counters; triggers bump them so caches in any worker can tell when to refresh
+        CREATE TABLE IF NOT EXISTS revisions (
+            scope       TEXT PRIMARY KEY,
+            rev         INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO revisions (scope, rev) VALUES ('recipes', 0);
+        CREATE TRIGGER IF NOT EXISTS trg_recipes_rev_insert AFTER INSERT ON recipes BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_recipes_rev_update AFTER UPDATE ON recipes BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_recipes_rev_delete AFTER DELETE ON recipes BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_rev_insert AFTER INSERT ON recipe_ingredients BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_rev_update AFTER UPDATE ON recipe_ingredients BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_rev_delete AFTER DELETE ON recipe_ingredients BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_steps_rev_insert AFTER INSERT ON recipe_steps BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_steps_rev_update AFTER UPDATE ON recipe_steps BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_steps_rev_delete AFTER DELETE ON recipe_steps BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'recipes';
+        END;
+        -- Per-list item counters kept current by triggers so stats never scan items
+        CREATE TABLE IF NOT EXISTS list_stats (
+            list_id     TEXT PRIMARY KEY,
+            total       INTEGER NOT NULL DEFAULT 0,
+            done        INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(list_id) REFERENCES lists(id) ON DELETE CASCADE
+        );
+        CREATE TRIGGER IF NOT EXISTS trg_lists_stats_insert AFTER INSERT ON lists BEGIN
+            INSERT OR IGNORE INTO list_stats (list_id) VALUES (new.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_stats_insert AFTER INSERT ON items BEGIN
+            UPDATE list_stats SET total = total + 1, done = done + new.done WHERE list_id = new.list_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_stats_delete AFTER DELETE ON items BEGIN
+            UPDATE list_stats SET total = total - 1, done = done - old.done WHERE list_id = old.list_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_stats_update AFTER UPDATE OF done, list_id ON items
+        WHEN old.done IS NOT new.done OR old.list_id IS NOT new.list_id BEGIN
+            UPDATE list_stats SET total = total - 1, done = done - old.done WHERE list_id = old.list_id;
+            UPDATE list_stats SET total = total + 1, done = done + new.done WHERE list_id = new.list_id;
+        END;
+        -- Backfill counters for lists created before list_stats existed
+        INSERT OR IGNORE INTO list_stats (list_id, total, done)
+            SELECT id,
+                   (SELECT COUNT(*) FROM items WHERE list_id = lists.id),
+                   (SELECT COUNT(*) FROM items WHERE list_id = lists.id AND done = 1)
+            FROM lists WHERE id NOT IN (SELECT list_id FROM list_stats);
+        CREATE INDEX IF NOT EXISTS idx_lists_default ON lists(is_default) WHERE is_default = 1;
+        CREATE INDEX IF NOT EXISTS idx_categories_list ON categories(list_id, position);
+        CREATE INDEX IF NOT EXISTS idx_items_list ON items(list_id, category, position);
+        CREATE INDEX IF NOT EXISTS idx_ingredients_recipe ON recipe_ingredients(recipe_id, position);
+        CREATE INDEX IF NOT EXISTS idx_steps_recipe ON recipe_steps(recipe_id, step_number);
+"""
+
+def _migrate_photo_store(conn):
+    """Move inline base64 photos into the deduplicated photos table."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(recipes)")}
+    if "photo_id" not in columns:
+        conn.execute("ALTER TABLE recipes ADD COLUMN photo_id TEXT REFERENCES photos(id)")
+    for statement in (
+        """CREATE TABLE IF NOT EXISTS photos (
+            id          TEXT PRIMARY KEY,
+            source_hash TEXT,
+            mime        TEXT NOT NULL DEFAULT 'image/webp',
+            refcount    INTEGER NOT NULL DEFAULT 0,
+            data        BLOB NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_photos_source ON photos(source_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_photos_unreferenced ON photos(id) WHERE refcount <= 0",
+        "CREATE INDEX IF NOT EXISTS idx_recipes_photo ON recipes(photo_id)",
+        """CREATE TRIGGER IF NOT EXISTS trg_recipes_photo_ref_insert AFTER INSERT ON recipes
+        WHEN new.photo_id IS NOT NULL BEGIN
+            UPDATE photos SET refcount = refcount + 1 WHERE id = new.photo_id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_recipes_photo_ref_update AFTER UPDATE OF photo_id ON recipes
+        WHEN old.photo_id IS NOT new.photo_id BEGIN
+            UPDATE photos SET refcount = refcount - 1 WHERE id = old.photo_id;
+            UPDATE photos SET refcount = refcount + 1 WHERE id = new.photo_id;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_recipes_photo_ref_delete AFTER DELETE ON recipes
+        WHEN old.photo_id IS NOT NULL BEGIN
+            UPDATE photos SET refcount = refcount - 1 WHERE id = old.photo_id;
+        END""",
+    ):
+        conn.execute(statement)
+    for recipe_id, uri in conn.execute("SELECT id, photo FROM recipes WHERE photo IS NOT NULL").fetchall():
+        parsed = parse_photo_data_uri(uri)
+        photo_id = store_photo(conn, parsed[1], parsed[0]) if parsed else None
+        conn.execute("UPDATE recipes SET photo=NULL, photo_id=? WHERE id=?", (photo_id, recipe_id))
+
+# Each entry is (version, SQL script or callable(conn)). Append a new entry
+# whenever the schema changes; init_db applies whatever the file is missing.
+LISTS_REVISION_SQL = """
+        INSERT OR IGNORE INTO revisions (scope, rev) VALUES ('lists', 0);
+        CREATE TRIGGER IF NOT EXISTS trg_lists_rev_insert AFTER INSERT ON lists BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_lists_rev_update AFTER UPDATE ON lists BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_lists_rev_delete AFTER DELETE ON lists BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_rev_insert AFTER INSERT ON categories BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_rev_update AFTER UPDATE ON categories BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_rev_delete AFTER DELETE ON categories BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_rev_insert AFTER INSERT ON items BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_rev_update AFTER UPDATE ON items BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_rev_delete AFTER DELETE ON items BEGIN
+            UPDATE revisions SET rev = rev + 1 WHERE scope = 'lists';
+        END;
+"""
+
+# ---------------------------------------------------------------------------
+# Recipe times
+# ---------------------------------------------------------------------------
+# Longest duration parse_minutes accepts (30 days); anything longer is not a recipe time
+MAX_RECIPE_MINUTES = 30 * 1440
+TIME_UNITS = {
+    "d": 1440, "day": 1440, "days": 1440,
+    "h": 60, "hr": 60, "hrs": 60, "hour": 60, "hours": 60,
+    "m": 1, "min": 1, "mins": 1, "minute": 1, "minutes": 1,
+}
+VULGAR_FRACTIONS = str.maketrans({
+    "¼": " 1/4", "½": " 1/2", "¾": " 3/4", "⅓": " 1/3", "⅔": " 2/3",
+    "⅕": " 1/5", "⅙": " 1/6", "⅛": " 1/8", "⅜": " 3/8", "⅝": " 5/8", "⅞": " 7/8", "⁄": "/",
+})
+# "1 1/2", "1/2", "1.5" or "1,5"
+TIME_QUANTITY = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?)"
+TIME_RANGE = re.compile(rf"{TIME_QUANTITY}\s*(?:-|–|to)\s*({TIME_QUANTITY})")
+TIME_TOKEN = re.compile(rf"({TIME_QUANTITY})\s*([a-z]+)?")
+
+def _time_quantity(text):
+    value = 0.0
+    for part in text.split():
+        numerator, _, denominator = part.partition("/")
+        if denominator:
+            if not int(denominator):
+                return None
+            value += int(numerator) / int(denominator)
+        else:
+            value += float(numerator.replace(",", "."))
+    return value
+
+def parse_minutes(text):
+    """
+    Whole minutes in a free-text duration such as "15 mins", "1 hr 30 min",
+    "1h30", "1:15", "1.5 hours", "1½ hours" or "1 1/2 hours". None if there
+    is no number in it, a number is followed by a unit that is not a time
+    in TIME_UNITS ("30 seconds", "2 cups"), or the total is over
+    MAX_RECIPE_MINUTES. Ranges ("10-15 min") count as their upper bound;
+    bare numbers are minutes.
+    """
+    text = str(text or "").strip().lower().translate(VULGAR_FRACTIONS)
+    clock = re.fullmatch(r"(\d+):(\d{2})", text)
+    if clock:
+        return int(clock[1]) * 60 + int(clock[2])
+    tokens = TIME_TOKEN.findall(TIME_RANGE.sub(r"\1", text))
+    if not tokens:
+        return None
+    minutes = 0.0
+    for quantity, unit in tokens:
+        value = _time_quantity(quantity)
+        if value is None or (unit and unit not in TIME_UNITS):
+            return None
+        minutes += value * TIME_UNITS.get(unit, 1)
+    return round(minutes) if minutes <= MAX_RECIPE_MINUTES else None
+
+def _migrate_recipe_minutes(conn):
+    """Add parsed minute columns (total is generated from them) and backfill them."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_xinfo(recipes)")}
+    if "prep_minutes" not in columns:
+        conn.execute("ALTER TABLE recipes ADD COLUMN prep_minutes INTEGER")
+        conn.execute("ALTER TABLE recipes ADD COLUMN cook_minutes INTEGER")
+    if "total_minutes" not in columns:
+        conn.execute("""ALTER TABLE recipes ADD COLUMN total_minutes INTEGER GENERATED ALWAYS AS (
+            CASE WHEN prep_minutes IS NULL AND cook_minutes IS NULL THEN NULL
+                 ELSE COALESCE(prep_minutes, 0) + COALESCE(cook_minutes, 0) END) VIRTUAL""")
+    for column in ("prep_minutes", "cook_minutes", "total_minutes", "servings"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_recipes_{column} ON recipes({column})")
+    conn.executemany(
+        "UPDATE recipes SET prep_minutes=?, cook_minutes=? WHERE id=?",
+        [(parse_minutes(prep), parse_minutes(cook), id_)
+         for id_, prep, cook in conn.execute("SELECT id, prep_time, cook_time FROM recipes").fetchall()]
+    )
+
+PURCHASE_HISTORY_SQL = """
+        -- Items archived by clear-done; `key` is the normalized name
+        CREATE TABLE IF NOT EXISTS purchase_history (
+            id          INTEGER PRIMARY KEY,
+            list_id     TEXT NOT NULL,
+            key         TEXT NOT NULL,
+            name        TEXT NOT NULL,
+            quantity    TEXT,
+            category    TEXT,
+            purchased   TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY(list_id) REFERENCES lists(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_purchase_history_list ON purchase_history(list_id, purchased);
+        -- Per-list frequency/recency aggregates, kept current by trigger so
+        -- suggestions never read purchase_history
+        CREATE TABLE IF NOT EXISTS purchase_stats (
+            list_id     TEXT NOT NULL,
+            key         TEXT NOT NULL,
+            name        TEXT NOT NULL,
+            quantity    TEXT,
+            category    TEXT,
+            times       INTEGER NOT NULL DEFAULT 0,
+            last_purchased TEXT NOT NULL,
+            PRIMARY KEY (list_id, key),
+            FOREIGN KEY(list_id) REFERENCES lists(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_purchase_stats_rank ON purchase_stats(list_id, times DESC, last_purchased DESC);
+        CREATE TRIGGER IF NOT EXISTS trg_purchase_history_stats AFTER INSERT ON purchase_history BEGIN
+            INSERT INTO purchase_stats (list_id, key, name, quantity, category, times, last_purchased)
+            VALUES (new.list_id, new.key, new.name, new.quantity, new.category, 1, new.purchased)
+            ON CONFLICT (list_id, key) DO UPDATE SET
+                times = times + 1,
+                name = excluded.name,
+                quantity = excluded.quantity,
+                category = excluded.category,
+                last_purchased = excluded.last_purchased;
+        END;
+"""
+
+AUTOCOMPLETE_SQL = """
+        -- Autocomplete terms per kind (item, ingredient, unit), keyed by the
+        -- lower-cased name so prefix lookups are a primary-key range scan.
+        -- freq counts uses: items added, ingredients written, items bought.
+        CREATE TABLE IF NOT EXISTS terms (
+            kind        TEXT NOT NULL,
+            norm        TEXT NOT NULL,
+            term        TEXT NOT NULL,
+            freq        INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, norm)
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS trg_items_terms_insert AFTER INSERT ON items
+        WHEN trim(new.name) <> '' BEGIN
+            INSERT INTO terms (kind, norm, term, freq) VALUES ('item', lower(trim(new.name)), trim(new.name), 1)
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_items_terms_update AFTER UPDATE OF name ON items
+        WHEN trim(new.name) <> '' AND lower(trim(new.name)) IS NOT lower(trim(old.name)) BEGIN
+            INSERT INTO terms (kind, norm, term, freq) VALUES ('item', lower(trim(new.name)), trim(new.name), 1)
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_history_terms_insert AFTER INSERT ON purchase_history
+        WHEN trim(new.name) <> '' BEGIN
+            INSERT INTO terms (kind, norm, term, freq) VALUES ('item', new.key, trim(new.name), 1)
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_terms_insert AFTER INSERT ON recipe_ingredients BEGIN
+            INSERT INTO terms (kind, norm, term, freq)
+            SELECT 'ingredient', lower(trim(new.name)), trim(new.name), 1 WHERE trim(new.name) <> ''
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+            INSERT INTO terms (kind, norm, term, freq)
+            SELECT 'unit', lower(trim(new.unit)), trim(new.unit), 1 WHERE trim(COALESCE(new.unit, '')) <> ''
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_terms_update AFTER UPDATE OF name, unit ON recipe_ingredients BEGIN
+            INSERT INTO terms (kind, norm, term, freq)
+            SELECT 'ingredient', lower(trim(new.name)), trim(new.name), 1
+            WHERE trim(new.name) <> '' AND lower(trim(new.name)) IS NOT lower(trim(old.name))
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+            INSERT INTO terms (kind, norm, term, freq)
+            SELECT 'unit', lower(trim(new.unit)), trim(new.unit), 1
+            WHERE trim(COALESCE(new.unit, '')) <> '' AND lower(trim(new.unit)) IS NOT lower(trim(old.unit))
+            ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + 1;
+        END;
+        -- Backfill from what is already there
+        INSERT INTO terms (kind, norm, term, freq)
+        SELECT 'item', lower(trim(name)), MAX(trim(name)), COUNT(*) FROM items WHERE trim(name) <> '' GROUP BY 2
+        ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + excluded.freq;
+        INSERT INTO terms (kind, norm, term, freq)
+        SELECT 'item', key, MAX(trim(name)), COUNT(*) FROM purchase_history WHERE trim(name) <> '' GROUP BY 2
+        ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + excluded.freq;
+        INSERT INTO terms (kind, norm, term, freq)
+        SELECT 'ingredient', lower(trim(name)), MAX(trim(name)), COUNT(*) FROM recipe_ingredients WHERE trim(name) <> '' GROUP BY 2
+        ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + excluded.freq;
+        INSERT INTO terms (kind, norm, term, freq)
+        SELECT 'unit', lower(trim(unit)), MAX(trim(unit)), COUNT(*) FROM recipe_ingredients WHERE trim(COALESCE(unit, '')) <> '' GROUP BY 2
+        ON CONFLICT (kind, norm) DO UPDATE SET freq = freq + excluded.freq;
+"""
+
+INGREDIENT_INDEX_SQL = """
+        -- Inverted index: normalized ingredient name -> recipes using it.
+        -- `uses` counts ingredient rows with that name in the recipe, so a
+        -- duplicate ingredient can be removed without dropping the posting.
+        CREATE TABLE IF NOT EXISTS recipe_terms (
+            term        TEXT NOT NULL,
+            recipe_id   TEXT NOT NULL,
+            uses        INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (term, recipe_id),
+            FOREIGN KEY(recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        -- Deleting a recipe looks its postings up by recipe_id (ON DELETE CASCADE)
+        CREATE INDEX IF NOT EXISTS idx_recipe_terms_recipe ON recipe_terms(recipe_id);
+        -- Distinct ingredient terms per recipe, the denominator of coverage
+        CREATE TABLE IF NOT EXISTS recipe_term_counts (
+            recipe_id   TEXT PRIMARY KEY,
+            terms       INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        );
+        CREATE TRIGGER IF NOT EXISTS trg_recipe_terms_insert AFTER INSERT ON recipe_terms BEGIN
+            INSERT INTO recipe_term_counts (recipe_id, terms) VALUES (new.recipe_id, 1)
+            ON CONFLICT (recipe_id) DO UPDATE SET terms = terms + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_recipe_terms_delete AFTER DELETE ON recipe_terms BEGIN
+            UPDATE recipe_term_counts SET terms = terms - 1 WHERE recipe_id = old.recipe_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_index_insert AFTER INSERT ON recipe_ingredients
+        WHEN trim(new.name) <> '' BEGIN
+            INSERT INTO recipe_terms (term, recipe_id, uses) VALUES (lower(trim(new.name)), new.recipe_id, 1)
+            ON CONFLICT (term, recipe_id) DO UPDATE SET uses = uses + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_index_delete AFTER DELETE ON recipe_ingredients BEGIN
+            UPDATE recipe_terms SET uses = uses - 1 WHERE term = lower(trim(old.name)) AND recipe_id = old.recipe_id;
+            DELETE FROM recipe_terms WHERE term = lower(trim(old.name)) AND recipe_id = old.recipe_id AND uses <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_ingredients_index_update AFTER UPDATE OF name ON recipe_ingredients
+        WHEN lower(trim(new.name)) IS NOT lower(trim(old.name)) BEGIN
+            UPDATE recipe_terms SET uses = uses - 1 WHERE term = lower(trim(old.name)) AND recipe_id = old.recipe_id;
+            DELETE FROM recipe_terms WHERE term = lower(trim(old.name)) AND recipe_id = old.recipe_id AND uses <= 0;
+            INSERT INTO recipe_terms (term, recipe_id, uses)
+            SELECT lower(trim(new.name)), new.recipe_id, 1 WHERE trim(new.name) <> ''
+            ON CONFLICT (term, recipe_id) DO UPDATE SET uses = uses + 1;
+        END;
+        -- (Re)build from existing ingredients
+        DELETE FROM recipe_terms;
+        DELETE FROM recipe_term_counts;
+        INSERT INTO recipe_terms (term, recipe_id, uses)
+        SELECT lower(trim(name)), recipe_id, COUNT(*) FROM recipe_ingredients WHERE trim(name) <> '' GROUP BY 1, 2;
+"""
+
+# Indexes on foreign key child columns missing from databases created before
+# they were added to their migrations; without them every parent delete scans
+# the child table to enforce the constraint
+FOREIGN_KEY_INDEX_SQL = """
+        CREATE INDEX IF NOT EXISTS idx_recipe_terms_recipe ON recipe_terms(recipe_id);
+        CREATE INDEX IF NOT EXISTS idx_recipes_photo ON recipes(photo_id);
+"""
+
+# Id columns rebuilt as `UUID BLOB` by migration 8, and the small lookup
+# tables that are better stored clustered on their key (WITHOUT ROWID)
+UUID_COLUMNS = {
+    "lists": ("id",),
+    "categories": ("id", "list_id"),
+    "items": ("id", "list_id", "category"),
+    "recipes": ("id",),
+    "recipe_ingredients": ("id", "recipe_id"),
+    "recipe_steps": ("id", "recipe_id"),
+    "list_stats": ("list_id",),
+    "purchase_history": ("list_id", "category"),
+    "purchase_stats": ("list_id", "category"),
+    "recipe_terms": ("recipe_id",),
+    "recipe_term_counts": ("recipe_id",),
+}
+WITHOUT_ROWID_TABLES = ("list_stats", "recipe_term_counts")
+
+def _migrate_compact_ids(conn):
+    """
+    Store every row id as 16 bytes instead of 36 characters of text.
+
+    SQLite cannot change a column's type in place, so each table is rebuilt
+    from its own CREATE statement with the id columns retyped, its rows are
+    copied through uuid_blob(), and its indexes and all triggers (dropped up
+    front so none fires during the copy) are recreated. Safe to re-run.
+    """
+    conn.create_function("uuid_blob", 1, uuid_blob, deterministic=True)
+    schema = conn.execute(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall()
+    triggers = [sql for kind, name, table, sql in schema if kind == "trigger"]
+    for kind, name, table, sql in schema:
+        if kind == "trigger":
+            conn.execute(f"DROP TRIGGER {name}")
+
+    for table, columns in UUID_COLUMNS.items():
+        create = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+        for column in columns:
+            create = re.sub(rf"\b{column}(\s+)TEXT\b", rf"{column}\1UUID BLOB", create, count=1)
+        if table in WITHOUT_ROWID_TABLES and not create.rstrip().upper().endswith("WITHOUT ROWID"):
+            create = create.rstrip() + " WITHOUT ROWID"
+        if create == conn.execute("SELECT sql FROM sqlite_master WHERE name=?", (table,)).fetchone()[0]:
+            continue  # already converted
+        # Generated columns (hidden 2 and 3) are recomputed, not copied
+        copied = [r[1] for r in conn.execute(f"PRAGMA table_xinfo({table})").fetchall() if r[6] == 0]
+        select = ", ".join(f"uuid_blob({c})" if c in columns else c for c in copied)
+        conn.execute(re.sub(rf"^CREATE TABLE {table}\b", f"CREATE TABLE {table}_new", create))
+        conn.execute(f"INSERT INTO {table}_new ({', '.join(copied)}) SELECT {select} FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for kind, name, index_table, sql in schema:
+            if kind == "index" and index_table == table:
+                conn.execute(sql)
+
+    for sql in triggers:
+        conn.execute(sql)
+
+MIGRATIONS = [
+    (1, SCHEMA_SQL),
+    (2, _migrate_photo_store),
+    (3, LISTS_REVISION_SQL),
+    (4, PURCHASE_HISTORY_SQL),
+    (5, AUTOCOMPLETE_SQL),
+    (6, _migrate_recipe_minutes),
+    (7, INGREDIENT_INDEX_SQL),
+    (8, _migrate_compact_ids),
+    (9, FOREIGN_KEY_INDEX_SQL),
+    (10, _migrate_recipe_minutes),  # re-parse with fraction and unit support
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def init_db(path=None):
+    """
+    Create or upgrade the schema of `path` (default: DB_PATH).
+
+    The stored PRAGMA user_version is checked first, so when the database is
+    already current this is a single read: no DDL runs and no write lock is
+    taken. Upgrades are serialized across workers with a lock file.
+    """
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        with open(f"{path}.init-lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Only takes effect on a new file; older ones are converted by `flask maintenance vacuum`
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")  # persistent; set before any worker writes
+            for version, migration in MIGRATIONS:
+                # Re-read under the lock: another worker may have just migrated
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    continue
+                if callable(migration):
+                    conn.execute("BEGIN IMMEDIATE")
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version={version}")
+                    conn.commit()
+                else:
+                    conn.executescript(f"BEGIN IMMEDIATE;{migration}PRAGMA user_version={version};COMMIT;")
+    finally:
+        conn.close()
 
 # ---------------------------------------------------------------------------
 # Lists CRUD
 # ---------------------------------------------------------------------------
 @app.route("/api/lists", methods=["GET"])
+@revision_etag("lists")
 def get_lists():
-    rows = get_db().execute("SELECT * FROM lists ORDER BY created DESC").fetchall()
+    """List all shopping lists; `?with_stats=1` adds each list's total/done counts."""
+    if request.args.get("with_stats") in ("1", "true"):
+        rows = get_db().execute("""
+            SELECT l.*, COALESCE(s.total, 0) AS total, COALESCE(s.done, 0) AS done
+            FROM lists l LEFT JOIN list_stats s ON s.list_id = l.id
+            ORDER BY l.created DESC
+        """).fetchall()
+    else:
+        rows = get_db().execute("SELECT * FROM lists ORDER BY created DESC").fetchall()
     return jsonify([dict(r) for r in rows])
 
 @app.route("/api/lists", methods=["POST"])
 def create_list():
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    get_db().execute("INSERT INTO lists (id, name) VALUES (?, ?)", (id_, data["name"]))
-    get_db().commit()
+    id_ = uuid7()
+    run_write(lambda db: db.execute("INSERT INTO lists (id, name) VALUES (?, ?)", (id_, data["name"])))
     return jsonify({"id": id_, "name": data["name"]}), 201
 
-@app.route("/api/lists/<list_id>", methods=["PUT"])
+@app.route("/api/lists/<id:list_id>", methods=["PUT"])
 def update_list(list_id):
     data = request.get_json()
-    get_db().execute("UPDATE lists SET name=? WHERE id=?", (data["name"], list_id))
-    get_db().commit()
+    run_write(lambda db: db.execute("UPDATE lists SET name=? WHERE id=?", (data["name"], list_id)))
     return jsonify({"ok": True})
 
-@app.route("/api/lists/<list_id>", methods=["DELETE"])
+@app.route("/api/lists/<id:list_id>", methods=["DELETE"])
 def delete_list(list_id):
-    get_db().execute("DELETE FROM lists WHERE id=?", (list_id,))
-    get_db().commit()
+    run_write(lambda db: db.execute("DELETE FROM lists WHERE id=?", (list_id,)))
     return jsonify({"ok": True})
 
-@app.route("/api/lists/<list_id>/set-default", methods=["POST"])
+@app.route("/api/lists/<id:list_id>/set-default", methods=["POST"])
 def set_default_list(list_id):
     """Set a list as the default shopping list. Only one list can be default at a time."""
-    db = get_db()
-
-    # Verify list exists
-    list_row = db.execute("SELECT id FROM lists WHERE id=?", (list_id,)).fetchone()
-    if not list_row:
+    def op(db):
+        # Verify list exists
+        list_row = db.execute("SELECT id FROM lists WHERE id=?", (list_id,)).fetchone()
+        if not list_row:
+            return False
+
+        # Atomic operation: unset all defaults, then set the new one
+        db.execute("UPDATE lists SET is_default = 0")
+        db.execute("UPDATE lists SET is_default = 1 WHERE id=?", (list_id,))
+        return True
+
+    if not run_write(op):
         return jsonify({"error": "List not found"}), 404
-
-    # Atomic operation: unset all defaults, then set the new one
-    db.execute("UPDATE lists SET is_default = 0")
-    db.execute("UPDATE lists SET is_default = 1 WHERE id=?", (list_id,))
-    db.commit()
-
     return jsonify({"ok": True, "default_list_id": list_id})
 
 @app.route("/api/lists/default", methods=["GET"])
+@revision_etag("lists")
 def get_default_list():
     """Get the current default shopping list."""
     row = get_db().execute("SELECT * FROM lists WHERE is_default = 1").fetchone()
@@ -176,67 +1965,240 @@ def get_default_list():
 # ---------------------------------------------------------------------------
 # Recipes CRUD
 # ---------------------------------------------------------------------------
+SQLITE_INT_MIN, SQLITE_INT_MAX = -(1 << 63), (1 << 63) - 1
+RECIPE_FILTERS = {
+    "min_time": "total_minutes >= ?",
+    "max_time": "total_minutes <= ?",
+    "max_prep": "prep_minutes <= ?",
+    "max_cook": "cook_minutes <= ?",
+    "min_servings": "servings >= ?",
+    "max_servings": "servings <= ?",
+}
+RECIPE_SORTS = {
+    "created": "created DESC",
+    "name": "name COLLATE NOCASE",
+    "time": "total_minutes NULLS LAST, created DESC",
+    "-time": "total_minutes DESC NULLS LAST, created DESC",
+    "servings": "servings, created DESC",
+    "-servings": "servings DESC, created DESC",
+}
+
 @app.route("/api/recipes", methods=["GET"])
+@revision_etag("recipes")
 def get_recipes():
-    rows = get_db().execute("SELECT * FROM recipes ORDER BY created DESC").fetchall()
-    return jsonify([dict(r) for r in rows])
+    """
+    List recipes, newest first.
+
+    Integer range filters (RECIPE_FILTERS, in minutes or servings) and `sort`
+    (RECIPE_SORTS) run in SQL against the indexed minute and servings columns.
+    """
+    where, params = [], []
+    for arg, clause in RECIPE_FILTERS.items():
+        if arg in request.args:
+            value = request.args.get(arg, type=int)
+            if value is None or not SQLITE_INT_MIN <= value <= SQLITE_INT_MAX:
+                return jsonify({"error": f"{arg} must be a 64-bit integer"}), 400
+            where.append(clause)
+            params.append(value)
+    sort = request.args.get("sort", "created")
+    if sort not in RECIPE_SORTS:
+        return jsonify({"error": f"sort must be one of {', '.join(RECIPE_SORTS)}"}), 400
+
+    sql = "SELECT * FROM recipes"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {RECIPE_SORTS[sort]}"
+    key = "recipes" if not where and sort == "created" else f"recipes:{sort}:{where}:{params}"
+    return cached_recipe_response(key, lambda db: [
+        recipe_dict(r) for r in db.execute(sql, params).fetchall()
+    ])
 
 @app.route("/api/recipes", methods=["POST"])
 def create_recipe():
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    get_db().execute(
-        "INSERT INTO recipes (id, name, description, servings, prep_time, cook_time) VALUES (?, ?, ?, ?, ?, ?)",
+    id_ = uuid7()
+    run_write(lambda db: db.execute(
+        """INSERT INTO recipes (id, name, description, servings, prep_time, cook_time, prep_minutes, cook_minutes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
         (id_, data["name"], data.get("description", ""), data.get("servings", 4),
-         data.get("prep_time", ""), data.get("cook_time", ""))
-    )
-    get_db().commit()
+         data.get("prep_time", ""), data.get("cook_time", ""),
+         parse_minutes(data.get("prep_time")), parse_minutes(data.get("cook_time")))
+    ))
     return jsonify({"id": id_, "name": data["name"]}), 201
 
-@app.route("/api/recipes/<recipe_id>", methods=["GET"])
+@app.route("/api/recipes/<id:recipe_id>", methods=["GET"])
+@revision_etag("recipes")
 def get_recipe(recipe_id):
-    row = get_db().execute("SELECT * FROM recipes WHERE id=?", (recipe_id,)).fetchone()
-    if row:
-        return jsonify(dict(row))
+    def build(db):
+        row = db.execute("SELECT * FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+        return recipe_dict(row) if row else None
+
+    response = cached_recipe_response(f"recipe:{recipe_id}", build)
+    if response:
+        return response
     return jsonify({"error": "Not found"}), 404
 
-@app.route("/api/recipes/<recipe_id>", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>", methods=["PUT"])
 def update_recipe(recipe_id):
     data = request.get_json()
-    db = get_db()
     sets = []
     vals = []
     for k in ("name", "description", "notes", "servings", "prep_time", "cook_time"):
         if k in data:
             sets.append(f"{k}=?")
             vals.append(data[k])
+    for k in ("prep", "cook"):
+        if f"{k}_time" in data:
+            sets.append(f"{k}_minutes=?")
+            vals.append(parse_minutes(data[f"{k}_time"]))
     if sets:
         vals.append(recipe_id)
-        db.execute(f"UPDATE recipes SET {','.join(sets)} WHERE id=?", vals)
-    db.commit()
+        run_write(lambda db: db.execute(f"UPDATE recipes SET {','.join(sets)} WHERE id=?", vals))
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>", methods=["DELETE"])
+@app.route("/api/recipes/<id:recipe_id>", methods=["DELETE"])
 def delete_recipe(recipe_id):
-    get_db().execute("DELETE FROM recipes WHERE id=?", (recipe_id,))
-    get_db().commit()
+    def op(db):
+        db.execute("DELETE FROM recipes WHERE id=?", (recipe_id,))
+        release_photos(db)
+
+    run_write(op)
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/photo", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>/duplicate", methods=["POST"])
+def duplicate_recipe(recipe_id):
+    """
+    Copy a recipe with its ingredients and steps in one transaction.
+
+    Three INSERT ... SELECT statements, whatever the recipe's size; new ids
+    come from the uuid7() SQL function and the photo is shared by reference (its refcount
+    trigger counts the copy). Name defaults to "<name> (Copy)".
+    """
+    name = (request.get_json(silent=True) or {}).get("name")
+
+    def op(db):
+        row = db.execute(
+            """INSERT INTO recipes (id, name, description, notes, servings, prep_time, cook_time,
+                                    prep_minutes, cook_minutes, photo_id, created)
+                SELECT uuid7(), COALESCE(?, name || ' (Copy)'), description, notes, servings, prep_time,
+                       cook_time, prep_minutes, cook_minutes, photo_id, datetime('now')
+                FROM recipes WHERE id=?
+                RETURNING id, name""",
+            (name, recipe_id)
+        ).fetchone()
+        if not row:
+            return None
+        new = dict(row)
+        db.execute(
+            """INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position)
+                SELECT uuid7(), ?, name, quantity, unit, position FROM recipe_ingredients WHERE recipe_id=?""",
+            (new["id"], recipe_id)
+        )
+        db.execute(
+            """INSERT INTO recipe_steps (id, recipe_id, step_number, instruction)
+                SELECT uuid7(), ?, step_number, instruction FROM recipe_steps WHERE recipe_id=?""",
+            (new["id"], recipe_id)
+        )
+        return new
+
+    new = run_write(op)
+    if new is None:
+        return jsonify({"error": "Recipe not found"}), 404
+    return jsonify(new), 201
+
+RECIPE_MATCH_SQL = """
+    WITH q(term) AS (SELECT DISTINCT lower(trim(value)) FROM json_each(?))
+    SELECT t.recipe_id, COUNT(*) AS matched, c.terms AS total
+    FROM q JOIN recipe_terms t ON t.term = q.term
+    JOIN recipe_term_counts c ON c.recipe_id = t.recipe_id
+    GROUP BY t.recipe_id
+    ORDER BY CAST(COUNT(*) AS REAL) / c.terms DESC, matched DESC
+    LIMIT ?
+"""
+
+@app.route("/api/recipes/match", methods=["GET"])
+def match_recipes():
+    """
+    Rank recipes by how many of their ingredients are covered.
+
+    The query set is `?list_id=` (names on that shopping list) and/or
+    `?ingredients=a,b,c`. Only the recipe_terms postings of those names are
+    read, so the cost follows the query set, not the number of recipes.
+    Returns the top `k` with matched/total counts and the missing ingredients.
+    """
+    names = [n for n in request.args.get("ingredients", "").split(",") if n.strip()]
+    db = get_db()
+    if request.args.get("list_id"):
+        names += [r["name"] for r in db.execute(
+            "SELECT name FROM items WHERE list_id=?", (parse_id(request.args["list_id"]),)).fetchall()]
+    if not names:
+        return jsonify({"error": "Give ingredients or list_id"}), 400
+    k = max(1, min(request.args.get("k", 10, type=int), 50))
+
+    ranked = db.execute(RECIPE_MATCH_SQL, (json.dumps(names), k)).fetchall()
+    if not ranked:
+        return jsonify([])
+
+    ids = json.dumps([str(r["recipe_id"]) for r in ranked])
+    recipes = {r["id"]: r for r in db.execute(
+        "SELECT * FROM recipes WHERE id IN (SELECT uuid_blob(value) FROM json_each(?))", (ids,)).fetchall()}
+    ingredients = {}
+    for r in db.execute(
+        "SELECT recipe_id, name FROM recipe_ingredients WHERE recipe_id IN (SELECT uuid_blob(value) FROM json_each(?)) ORDER BY position",
+        (ids,)
+    ).fetchall():
+        ingredients.setdefault(r["recipe_id"], []).append(r["name"])
+
+    have = {n.strip().lower() for n in names}
+    return jsonify([{
+        **recipe_dict(recipes[r["recipe_id"]]),
+        "matched": r["matched"],
+        "total": r["total"],
+        "coverage": round(r["matched"] / r["total"], 3),
+        "missing": [n for n in ingredients.get(r["recipe_id"], []) if n.strip().lower() not in have],
+    } for r in ranked])
+
+@app.route("/api/photos/<photo_id>", methods=["GET"])
+def get_photo(photo_id):
+    """Serve photo bytes under their content hash; the URL never changes meaning."""
+    if len(photo_id) != 64 or not all(c in "0123456789abcdef" for c in photo_id):
+        return jsonify({"error": "Photo not found"}), 404
+    headers = {"Cache-Control": PHOTO_CACHE_CONTROL, "ETag": f'"{photo_id}"', **PHOTO_SECURITY_HEADERS}
+    if request.if_none_match.contains(photo_id):
+        return Response(status=304, headers=headers)
+
+    mime = materialize_photo(get_db(), photo_id)
+    if mime not in PHOTO_MIMES.values():  # also rows stored before imports were checked
+        return jsonify({"error": "Photo not found"}), 404
+    if PHOTO_ACCEL_PREFIX:
+        household = current_household()
+        headers["X-Accel-Redirect"] = PHOTO_ACCEL_PREFIX + (f"{household}/" if household else "") + photo_id
+        return Response(status=200, headers=headers, mimetype=mime)
+    response = send_file(photo_file(photo_id), mimetype=mime, etag=False, conditional=False)
+    response.headers.update(headers)
+    return response
+
+@app.route("/api/recipes/<id:recipe_id>/photo", methods=["PUT"])
+@heavy
 def upload_recipe_photo(recipe_id):
     """Upload and process a recipe photo."""
+    # Reject oversized bodies from the Content-Length header, before parsing
+    # (and spooling) the multipart body; 64KB allows for multipart framing
+    if request.content_length and request.content_length > MAX_PHOTO_BYTES + 64 * 1024:
+        return jsonify({"error": "File too large (max 5MB)"}), 400
+
     # Check if file is present
     if 'photo' not in request.files:
         return jsonify({"error": "No photo file provided"}), 400
 
     file = request.files['photo']
 
-    # Check file size (5MB limit)
+    # Check file size (5MB limit); werkzeug spools large uploads to disk
     file.seek(0, 2)  # Seek to end
     size = file.tell()
     file.seek(0)  # Reset to start
 
-    if size > 5 * 1024 * 1024:  # 5MB
+    if size > MAX_PHOTO_BYTES:
         return jsonify({"error": "File too large (max 5MB)"}), 400
 
     # Check file type
@@ -244,99 +2206,117 @@ def upload_recipe_photo(recipe_id):
         return jsonify({"error": "File must be an image"}), 400
 
     try:
-        # Process image
-        file_data = file.read()
-        photo_data = process_recipe_photo(file_data)
-
-        # Update database
-        get_db().execute(
-            "UPDATE recipes SET photo=? WHERE id=?",
-            (photo_data, recipe_id)
-        )
-        get_db().commit()
+        # Reuse the stored result if this exact file was processed before
+        source_hash = hash_stream(file.stream)
+        row = get_db().execute("SELECT id FROM photos WHERE source_hash=?", (source_hash,)).fetchone()
+        photo_data = None if row else process_recipe_photo(file.stream)
+
+        def op(db):
+            if photo_data is None:
+                exists = db.execute("SELECT 1 FROM photos WHERE id=?", (row["id"],)).fetchone()
+                if not exists:
+                    return False  # released since we looked; process it after all
+                photo_id = row["id"]
+            else:
+                photo_id = store_photo(db, photo_data, source_hash=source_hash)
+            db.execute("UPDATE recipes SET photo=NULL, photo_id=? WHERE id=?", (photo_id, recipe_id))
+            release_photos(db)
+            return True
+
+        if not run_write(op):
+            photo_data = process_recipe_photo(file.stream)
+            run_write(op)
 
         return jsonify({"ok": True, "message": "Photo uploaded successfully"})
+    except PhotoRejected as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/recipes/<recipe_id>/photo", methods=["DELETE"])
+@app.route("/api/recipes/<id:recipe_id>/photo", methods=["DELETE"])
 def delete_recipe_photo(recipe_id):
     """Delete a recipe photo."""
-    get_db().execute(
-        "UPDATE recipes SET photo=NULL WHERE id=?",
-        (recipe_id,)
-    )
-    get_db().commit()
+    def op(db):
+        db.execute("UPDATE recipes SET photo=NULL, photo_id=NULL WHERE id=?", (recipe_id,))
+        release_photos(db)
+
+    run_write(op)
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/add-to-shopping-list", methods=["POST"])
+@app.route("/api/recipes/<id:recipe_id>/add-to-shopping-list", methods=["POST"])
 def add_recipe_to_shopping_list(recipe_id):
     """Add all ingredients from a recipe to the default shopping list.
 
     Handles duplicate detection (case-insensitive) and quantity formatting.
     Returns summary of added/skipped items.
     """
-    db = get_db()
+    def op(db):
+        # 1. Get default list
+        default_list = db.execute("SELECT id FROM lists WHERE is_default = 1").fetchone()
+        if not default_list:
+            return "no_default_list"
 
-    # 1. Get default list
-    default_list = db.execute("SELECT id FROM lists WHERE is_default = 1").fetchone()
-    if not default_list:
-        return jsonify({
-            "error": "No default list set",
-            "message": "Please set a default shopping list first"
-        }), 400
+        list_id = default_list["id"]
 
-    list_id = default_list["id"]
+        # 2. Get recipe ingredients
+        ingredients = db.execute(
+            "SELECT name, quantity, unit FROM recipe_ingredients WHERE recipe_id=? ORDER BY position",
+            (recipe_id,)
+        ).fetchall()
 
-    # 2. Get recipe ingredients
-    ingredients = db.execute(
-        "SELECT name, quantity, unit FROM recipe_ingredients WHERE recipe_id=? ORDER BY position",
-        (recipe_id,)
-    ).fetchall()
+        if not ingredients:
+            return "no_ingredients"
 
-    if not ingredients:
-        return jsonify({
-            "error": "No ingredients found",
-            "message": "This recipe has no ingredients to add"
-        }), 400
+        # 3. Get existing items for duplicate detection
+        existing_items = db.execute("SELECT name FROM items WHERE list_id=?", (list_id,)).fetchall()
+        existing_names_lower = {item["name"].lower() for item in existing_items}
 
-    # 3. Get existing items for duplicate detection
-    existing_items = db.execute("SELECT name FROM items WHERE list_id=?", (list_id,)).fetchall()
-    existing_names_lower = {item["name"].lower() for item in existing_items}
+        # 4. Add ingredients (skip duplicates)
+        added = []
+        skipped = []
 
-    # 4. Add ingredients (skip duplicates)
-    added = []
-    skipped = []
+        for ing in ingredients:
+            ing_name = ing["name"]
 
-    for ing in ingredients:
-        ing_name = ing["name"]
+            # Check for duplicate (case-insensitive)
+            if ing_name.lower() in existing_names_lower:
+                skipped.append(ing_name)
+                continue
 
-        # Check for duplicate (case-insensitive)
-        if ing_name.lower() in existing_names_lower:
-            skipped.append(ing_name)
-            continue
+            # Format quantity: "quantity unit" or just quantity if no unit
+            quantity_parts = [ing["quantity"], ing["unit"]]
+            formatted_qty = " ".join(filter(None, quantity_parts)) or "1"
 
-        # Format quantity: "quantity unit" or just quantity if no unit
-        quantity_parts = [ing["quantity"], ing["unit"]]
-        formatted_qty = " ".join(filter(None, quantity_parts)) or "1"
+            # Get next position for uncategorized items
+            pos = db.execute(
+                "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS NULL",
+                (list_id,)
+            ).fetchone()["p"]
 
-        # Get next position for uncategorized items
-        pos = db.execute(
-            "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS NULL",
-            (list_id,)
-        ).fetchone()["p"]
+            # Insert the item
+            item_id = uuid7()
+            db.execute(
+                "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,NULL,?,?,'',0,?)",
+                (item_id, list_id, ing_name, formatted_qty, pos)
+            )
 
-        # Insert the item
-        item_id = str(uuid.uuid4())
-        db.execute(
-            "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,NULL,?,?,'',0,?)",
-            (item_id, list_id, ing_name, formatted_qty, pos)
-        )
+            added.append(ing_name)
+            existing_names_lower.add(ing_name.lower())  # Prevent intra-recipe duplicates
 
-        added.append(ing_name)
-        existing_names_lower.add(ing_name.lower())  # Prevent intra-recipe duplicates
+        return list_id, added, skipped
 
-    db.commit()
+    result = run_write(op)
+    if result == "no_default_list":
+        return jsonify({
+            "error": "No default list set",
+            "message": "Please set a default shopping list first"
+        }), 400
+    if result == "no_ingredients":
+        return jsonify({
+            "error": "No ingredients found",
+            "message": "This recipe has no ingredients to add"
+        }), 400
+    list_id, added, skipped = result
 
     return jsonify({
         "ok": True,
@@ -349,7 +2329,7 @@ def add_recipe_to_shopping_list(recipe_id):
                    (f" ({len(skipped)} duplicate(s) skipped)" if skipped else "")
     })
 
-@app.route("/api/recipes/<recipe_id>/ingredients/<ingredient_id>/add-to-shopping-list", methods=["POST"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients/<id:ingredient_id>/add-to-shopping-list", methods=["POST"])
 def add_ingredient_to_shopping_list(recipe_id, ingredient_id):
     """Add a single ingredient from a recipe to the default shopping list.
 
@@ -395,19 +2375,21 @@ def add_ingredient_to_shopping_list(recipe_id, ingredient_id):
     quantity_parts = [ingredient["quantity"], ingredient["unit"]]
     formatted_qty = " ".join(filter(None, quantity_parts)) or "1"
 
-    # Get next position for uncategorized items
-    pos = db.execute(
-        "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS NULL",
-        (list_id,)
-    ).fetchone()["p"]
+    def op(db):
+        # Get next position for uncategorized items
+        pos = db.execute(
+            "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS NULL",
+            (list_id,)
+        ).fetchone()["p"]
 
-    # Insert the item
-    item_id = str(uuid.uuid4())
-    db.execute(
-        "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,NULL,?,?,'',0,?)",
-        (item_id, list_id, ing_name, formatted_qty, pos)
-    )
-    db.commit()
+        # Insert the item
+        item_id = uuid7()
+        db.execute(
+            "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,NULL,?,?,'',0,?)",
+            (item_id, list_id, ing_name, formatted_qty, pos)
+        )
+
+    run_write(op)
 
     return jsonify({
         "ok": True,
@@ -418,31 +2400,36 @@ def add_ingredient_to_shopping_list(recipe_id, ingredient_id):
 # ---------------------------------------------------------------------------
 # Recipe Ingredients CRUD
 # ---------------------------------------------------------------------------
-@app.route("/api/recipes/<recipe_id>/ingredients", methods=["GET"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients", methods=["GET"])
+@revision_etag("recipes")
 def get_recipe_ingredients(recipe_id):
-    rows = get_db().execute(
-        "SELECT * FROM recipe_ingredients WHERE recipe_id=? ORDER BY position", (recipe_id,)
-    ).fetchall()
-    return jsonify([dict(r) for r in rows])
+    return cached_recipe_response(f"ingredients:{recipe_id}", lambda db: [
+        dict(r) for r in db.execute(
+            "SELECT * FROM recipe_ingredients WHERE recipe_id=? ORDER BY position", (recipe_id,)
+        ).fetchall()
+    ])
 
-@app.route("/api/recipes/<recipe_id>/ingredients", methods=["POST"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients", methods=["POST"])
 def create_recipe_ingredient(recipe_id):
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    pos = get_db().execute(
-        "SELECT COALESCE(MAX(position),0)+1 as p FROM recipe_ingredients WHERE recipe_id=?", (recipe_id,)
-    ).fetchone()["p"]
-    get_db().execute(
-        "INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position) VALUES (?,?,?,?,?,?)",
-        (id_, recipe_id, data["name"], data.get("quantity", ""), data.get("unit", ""), pos)
-    )
-    get_db().commit()
+    id_ = uuid7()
+
+    def op(db):
+        pos = db.execute(
+            "SELECT COALESCE(MAX(position),0)+1 as p FROM recipe_ingredients WHERE recipe_id=?", (recipe_id,)
+        ).fetchone()["p"]
+        db.execute(
+            "INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position) VALUES (?,?,?,?,?,?)",
+            (id_, recipe_id, data["name"], data.get("quantity", ""), data.get("unit", ""), pos)
+        )
+        return pos
+
+    pos = run_write(op)
     return jsonify({"id": id_, "name": data["name"], "position": pos}), 201
 
-@app.route("/api/recipes/<recipe_id>/ingredients/<ing_id>", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients/<id:ing_id>", methods=["PUT"])
 def update_recipe_ingredient(recipe_id, ing_id):
     data = request.get_json()
-    db = get_db()
     sets = []
     vals = []
     for k in ("name", "quantity", "unit"):
@@ -451,17 +2438,17 @@ def update_recipe_ingredient(recipe_id, ing_id):
             vals.append(data[k])
     if sets:
         vals.extend([ing_id, recipe_id])
-        db.execute(f"UPDATE recipe_ingredients SET {','.join(sets)} WHERE id=? AND recipe_id=?", vals)
-    db.commit()
+        run_write(lambda db: db.execute(
+            f"UPDATE recipe_ingredients SET {','.join(sets)} WHERE id=? AND recipe_id=?", vals))
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/ingredients/<ing_id>", methods=["DELETE"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients/<id:ing_id>", methods=["DELETE"])
 def delete_recipe_ingredient(recipe_id, ing_id):
-    get_db().execute("DELETE FROM recipe_ingredients WHERE id=? AND recipe_id=?", (ing_id, recipe_id))
-    get_db().commit()
+    run_write(lambda db: db.execute(
+        "DELETE FROM recipe_ingredients WHERE id=? AND recipe_id=?", (ing_id, recipe_id)))
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/ingredients/reorder", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>/ingredients/reorder", methods=["PUT"])
 def reorder_recipe_ingredients(recipe_id):
     """Reorder ingredients based on array of ingredient IDs."""
     data = request.get_json()
@@ -470,70 +2457,73 @@ def reorder_recipe_ingredients(recipe_id):
     if not ingredient_ids:
         return jsonify({"error": "No ingredient IDs provided"}), 400
 
-    db = get_db()
     # Update positions based on order in array
-    for idx, ing_id in enumerate(ingredient_ids, 1):
-        db.execute(
-            "UPDATE recipe_ingredients SET position=? WHERE id=? AND recipe_id=?",
-            (idx, ing_id, recipe_id)
-        )
-    db.commit()
+    run_write(lambda db: db.executemany(
+        "UPDATE recipe_ingredients SET position=? WHERE id=? AND recipe_id=?",
+        [(idx, parse_id(ing_id), recipe_id) for idx, ing_id in enumerate(ingredient_ids, 1)]
+    ))
 
     return jsonify({"ok": True})
 
 # ---------------------------------------------------------------------------
 # Recipe Steps CRUD
 # ---------------------------------------------------------------------------
-@app.route("/api/recipes/<recipe_id>/steps", methods=["GET"])
+@app.route("/api/recipes/<id:recipe_id>/steps", methods=["GET"])
+@revision_etag("recipes")
 def get_recipe_steps(recipe_id):
-    rows = get_db().execute(
-        "SELECT * FROM recipe_steps WHERE recipe_id=? ORDER BY step_number", (recipe_id,)
-    ).fetchall()
-    return jsonify([dict(r) for r in rows])
+    return cached_recipe_response(f"steps:{recipe_id}", lambda db: [
+        dict(r) for r in db.execute(
+            "SELECT * FROM recipe_steps WHERE recipe_id=? ORDER BY step_number", (recipe_id,)
+        ).fetchall()
+    ])
 
-@app.route("/api/recipes/<recipe_id>/steps", methods=["POST"])
+@app.route("/api/recipes/<id:recipe_id>/steps", methods=["POST"])
 def create_recipe_step(recipe_id):
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    step_num = get_db().execute(
-        "SELECT COALESCE(MAX(step_number),0)+1 as n FROM recipe_steps WHERE recipe_id=?", (recipe_id,)
-    ).fetchone()["n"]
-    get_db().execute(
-        "INSERT INTO recipe_steps (id, recipe_id, step_number, instruction) VALUES (?,?,?,?)",
-        (id_, recipe_id, step_num, data["instruction"])
-    )
-    get_db().commit()
+    id_ = uuid7()
+
+    def op(db):
+        step_num = db.execute(
+            "SELECT COALESCE(MAX(step_number),0)+1 as n FROM recipe_steps WHERE recipe_id=?", (recipe_id,)
+        ).fetchone()["n"]
+        db.execute(
+            "INSERT INTO recipe_steps (id, recipe_id, step_number, instruction) VALUES (?,?,?,?)",
+            (id_, recipe_id, step_num, data["instruction"])
+        )
+        return step_num
+
+    step_num = run_write(op)
     return jsonify({"id": id_, "step_number": step_num}), 201
 
-@app.route("/api/recipes/<recipe_id>/steps/<step_id>", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>/steps/<id:step_id>", methods=["PUT"])
 def update_recipe_step(recipe_id, step_id):
     data = request.get_json()
-    get_db().execute(
+    run_write(lambda db: db.execute(
         "UPDATE recipe_steps SET instruction=? WHERE id=? AND recipe_id=?",
         (data["instruction"], step_id, recipe_id)
-    )
-    get_db().commit()
+    ))
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/steps/<step_id>", methods=["DELETE"])
+@app.route("/api/recipes/<id:recipe_id>/steps/<id:step_id>", methods=["DELETE"])
 def delete_recipe_step(recipe_id, step_id):
-    db = get_db()
-    # Get the step number being deleted
-    deleted_step = db.execute(
-        "SELECT step_number FROM recipe_steps WHERE id=? AND recipe_id=?", (step_id, recipe_id)
-    ).fetchone()
-    # Delete the step
-    db.execute("DELETE FROM recipe_steps WHERE id=? AND recipe_id=?", (step_id, recipe_id))
-    # Renumber subsequent steps
-    if deleted_step:
-        db.execute(
-            "UPDATE recipe_steps SET step_number = step_number - 1 WHERE recipe_id=? AND step_number > ?",
-            (recipe_id, deleted_step["step_number"])
-        )
-    db.commit()
+    def op(db):
+        # Get the step number being deleted
+        deleted_step = db.execute(
+            "SELECT step_number FROM recipe_steps WHERE id=? AND recipe_id=?", (step_id, recipe_id)
+        ).fetchone()
+        # Delete the step
+        db.execute("DELETE FROM recipe_steps WHERE id=? AND recipe_id=?", (step_id, recipe_id))
+        # Renumber subsequent steps
+        if deleted_step:
+            db.execute(
+                "UPDATE recipe_steps SET step_number = step_number - 1 WHERE recipe_id=? AND step_number > ?",
+                (recipe_id, deleted_step["step_number"])
+            )
+
+    run_write(op)
     return jsonify({"ok": True})
 
-@app.route("/api/recipes/<recipe_id>/steps/reorder", methods=["PUT"])
+@app.route("/api/recipes/<id:recipe_id>/steps/reorder", methods=["PUT"])
 def reorder_recipe_steps(recipe_id):
     """Reorder steps based on array of step IDs."""
     data = request.get_json()
@@ -542,27 +2532,24 @@ def reorder_recipe_steps(recipe_id):
     if not step_ids:
         return jsonify({"error": "No step IDs provided"}), 400
 
-    db = get_db()
     # Update step numbers based on order in array
-    for idx, step_id in enumerate(step_ids, 1):
-        db.execute(
-            "UPDATE recipe_steps SET step_number=? WHERE id=? AND recipe_id=?",
-            (idx, step_id, recipe_id)
-        )
-    db.commit()
+    run_write(lambda db: db.executemany(
+        "UPDATE recipe_steps SET step_number=? WHERE id=? AND recipe_id=?",
+        [(idx, parse_id(step_id), recipe_id) for idx, step_id in enumerate(step_ids, 1)]
+    ))
 
     return jsonify({"ok": True})
 
 # ---------------------------------------------------------------------------
 # Recipe Import/Export
 # ---------------------------------------------------------------------------
-@app.route("/api/recipes/<recipe_id>/export", methods=["GET"])
+@app.route("/api/recipes/<id:recipe_id>/export", methods=["GET"])
 def export_recipe(recipe_id):
     """Export a single recipe as JSON with all ingredients and steps."""
     db = get_db()
 
     # Get recipe
-    recipe = db.execute("SELECT * FROM recipes WHERE id=?", (recipe_id,)).fetchone()
+    recipe = db.execute(f"{EXPORT_SELECT} WHERE r.id=?", (recipe_id,)).fetchone()
     if not recipe:
         return jsonify({"error": "Recipe not found"}), 404
 
@@ -586,7 +2573,7 @@ def export_recipe(recipe_id):
         "servings": recipe["servings"],
         "prep_time": recipe["prep_time"],
         "cook_time": recipe["cook_time"],
-        "photo": recipe["photo"],
+        "photo": export_photo(recipe),
         "ingredients": [dict(ing) for ing in ingredients],
         "steps": [dict(step) for step in steps]
     }
@@ -594,12 +2581,13 @@ def export_recipe(recipe_id):
     return jsonify(export_data)
 
 @app.route("/api/recipes/export", methods=["GET"])
+@heavy
 def export_all_recipes():
     """Export all recipes as JSON array."""
     db = get_db()
 
     # Get all recipes
-    recipes = db.execute("SELECT * FROM recipes ORDER BY created DESC").fetchall()
+    recipes = db.execute(f"{EXPORT_SELECT} ORDER BY r.created DESC").fetchall()
 
     export_data = []
     for recipe in recipes:
@@ -624,7 +2612,7 @@ def export_all_recipes():
             "servings": recipe["servings"],
             "prep_time": recipe["prep_time"],
             "cook_time": recipe["cook_time"],
-            "photo": recipe["photo"],
+            "photo": export_photo(recipe),
             "ingredients": [dict(ing) for ing in ingredients],
             "steps": [dict(step) for step in steps]
         })
@@ -632,6 +2620,7 @@ def export_all_recipes():
     return jsonify(export_data)
 
 @app.route("/api/recipes/import", methods=["POST"])
+@heavy
 def import_recipes():
     """Import recipe(s) from JSON. Accepts single recipe object or array of recipes."""
     data = request.get_json()
@@ -642,66 +2631,77 @@ def import_recipes():
     # Handle both single recipe and array of recipes
     recipes_to_import = data if isinstance(data, list) else [data]
 
-    db = get_db()
-    imported_count = 0
-    imported_names = []
+    # Decode and check photos up front so the writer only does inserts; identical
+    # photos (e.g. the same backup imported twice) hash to the same stored row.
+    # Photos Pillow does not read as an allowed format are dropped.
+    photos = [checked_photo(parse_photo_data_uri(r.get("photo"))) for r in recipes_to_import]
 
-    for recipe_data in recipes_to_import:
-        # Validate required fields
-        if not recipe_data.get("name"):
-            continue
+    def op(db):
+        imported_count = 0
+        imported_names = []
 
-        # Create recipe
-        recipe_id = str(uuid.uuid4())
-        db.execute(
-            """INSERT INTO recipes (id, name, description, notes, servings, prep_time, cook_time, photo, created)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
-            (
-                recipe_id,
-                recipe_data["name"],
-                recipe_data.get("description", ""),
-                recipe_data.get("notes", ""),
-                recipe_data.get("servings", 4),
-                recipe_data.get("prep_time", ""),
-                recipe_data.get("cook_time", ""),
-                recipe_data.get("photo")
-            )
-        )
+        for recipe_data, photo in zip(recipes_to_import, photos):
+            # Validate required fields
+            if not recipe_data.get("name"):
+                continue
 
-        # Import ingredients
-        for idx, ing in enumerate(recipe_data.get("ingredients", []), 1):
-            ing_id = str(uuid.uuid4())
+            # Create recipe
+            recipe_id = uuid7()
+            photo_id = store_photo(db, photo[1], photo[0]) if photo else None
             db.execute(
-                """INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
+                """INSERT INTO recipes (id, name, description, notes, servings, prep_time, cook_time,
+                                      prep_minutes, cook_minutes, photo_id, created)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
                 (
-                    ing_id,
                     recipe_id,
-                    ing["name"],
-                    ing.get("quantity", ""),
-                    ing.get("unit", ""),
-                    ing.get("position", idx)
+                    recipe_data["name"],
+                    recipe_data.get("description", ""),
+                    recipe_data.get("notes", ""),
+                    recipe_data.get("servings", 4),
+                    recipe_data.get("prep_time", ""),
+                    recipe_data.get("cook_time", ""),
+                    parse_minutes(recipe_data.get("prep_time")),
+                    parse_minutes(recipe_data.get("cook_time")),
+                    photo_id
                 )
             )
 
-        # Import steps
-        for idx, step in enumerate(recipe_data.get("steps", []), 1):
-            step_id = str(uuid.uuid4())
-            db.execute(
-                """INSERT INTO recipe_steps (id, recipe_id, step_number, instruction)
-                   VALUES (?, ?, ?, ?)""",
-                (
-                    step_id,
-                    recipe_id,
-                    step.get("step_number", idx),
-                    step["instruction"]
+            # Import ingredients
+            for idx, ing in enumerate(recipe_data.get("ingredients", []), 1):
+                ing_id = uuid7()
+                db.execute(
+                    """INSERT INTO recipe_ingredients (id, recipe_id, name, quantity, unit, position)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (
+                        ing_id,
+                        recipe_id,
+                        ing["name"],
+                        ing.get("quantity", ""),
+                        ing.get("unit", ""),
+                        ing.get("position", idx)
+                    )
                 )
-            )
 
-        imported_count += 1
-        imported_names.append(recipe_data["name"])
+            # Import steps
+            for idx, step in enumerate(recipe_data.get("steps", []), 1):
+                step_id = uuid7()
+                db.execute(
+                    """INSERT INTO recipe_steps (id, recipe_id, step_number, instruction)
+                       VALUES (?, ?, ?, ?)""",
+                    (
+                        step_id,
+                        recipe_id,
+                        step.get("step_number", idx),
+                        step["instruction"]
+                    )
+                )
+
+            imported_count += 1
+            imported_names.append(recipe_data["name"])
+
+        return imported_count, imported_names
 
-    db.commit()
+    imported_count, imported_names = run_write(op)
 
     return jsonify({
         "ok": True,
@@ -713,122 +2713,1020 @@ def import_recipes():
 # ---------------------------------------------------------------------------
 # Categories CRUD
 # ---------------------------------------------------------------------------
-@app.route("/api/lists/<list_id>/categories", methods=["GET"])
+@app.route("/api/lists/<id:list_id>/categories", methods=["GET"])
+@revision_etag("lists")
 def get_categories(list_id):
     rows = get_db().execute(
         "SELECT * FROM categories WHERE list_id=? ORDER BY position", (list_id,)
     ).fetchall()
     return jsonify([dict(r) for r in rows])
 
-@app.route("/api/lists/<list_id>/categories", methods=["POST"])
+@app.route("/api/lists/<id:list_id>/categories", methods=["POST"])
 def create_category(list_id):
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    pos = get_db().execute(
-        "SELECT COALESCE(MAX(position),0)+1 as p FROM categories WHERE list_id=?", (list_id,)
-    ).fetchone()["p"]
-    get_db().execute(
-        "INSERT INTO categories (id, list_id, name, position) VALUES (?,?,?,?)",
-        (id_, list_id, data["name"], pos)
-    )
-    get_db().commit()
+    id_ = uuid7()
+
+    def op(db):
+        pos = db.execute(
+            "SELECT COALESCE(MAX(position),0)+1 as p FROM categories WHERE list_id=?", (list_id,)
+        ).fetchone()["p"]
+        db.execute(
+            "INSERT INTO categories (id, list_id, name, position) VALUES (?,?,?,?)",
+            (id_, list_id, data["name"], pos)
+        )
+        return pos
+
+    pos = run_write(op)
     return jsonify({"id": id_, "name": data["name"], "position": pos}), 201
 
-@app.route("/api/lists/<list_id>/categories/<cat_id>", methods=["PUT"])
+@app.route("/api/lists/<id:list_id>/categories/<id:cat_id>", methods=["PUT"])
 def update_category(list_id, cat_id):
     data = request.get_json()
-    get_db().execute("UPDATE categories SET name=? WHERE id=? AND list_id=?", (data["name"], cat_id, list_id))
-    get_db().commit()
+    run_write(lambda db: db.execute(
+        "UPDATE categories SET name=? WHERE id=? AND list_id=?", (data["name"], cat_id, list_id)))
     return jsonify({"ok": True})
 
-@app.route("/api/lists/<list_id>/categories/<cat_id>", methods=["DELETE"])
+@app.route("/api/lists/<id:list_id>/categories/<id:cat_id>", methods=["DELETE"])
 def delete_category(list_id, cat_id):
-    # move items to uncategorised
-    get_db().execute("UPDATE items SET category=NULL WHERE category=? AND list_id=?", (cat_id, list_id))
-    get_db().execute("DELETE FROM categories WHERE id=? AND list_id=?", (cat_id, list_id))
-    get_db().commit()
+    def op(db):
+        # move items to uncategorised
+        db.execute("UPDATE items SET category=NULL WHERE category=? AND list_id=?", (cat_id, list_id))
+        db.execute("DELETE FROM categories WHERE id=? AND list_id=?", (cat_id, list_id))
+
+    run_write(op)
     return jsonify({"ok": True})
 
 # ---------------------------------------------------------------------------
 # Items CRUD
 # ---------------------------------------------------------------------------
-@app.route("/api/lists/<list_id>/items", methods=["GET"])
+@app.route("/api/lists/<id:list_id>/items", methods=["GET"])
+@revision_etag("lists")
 def get_items(list_id):
     rows = get_db().execute(
         "SELECT * FROM items WHERE list_id=? ORDER BY category, position", (list_id,)
     ).fetchall()
     return jsonify([dict(r) for r in rows])
 
-@app.route("/api/lists/<list_id>/items", methods=["POST"])
+@app.route("/api/lists/<id:list_id>/items", methods=["POST"])
 def create_item(list_id):
     data = request.get_json()
-    id_ = str(uuid.uuid4())
-    cat = data.get("category")
-    pos = get_db().execute(
-        "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS ?",
-        (list_id, cat)
-    ).fetchone()["p"]
-    get_db().execute(
-        "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,?,?,?,?,0,?)",
-        (id_, list_id, cat, data["name"], data.get("quantity","1"), data.get("note",""), pos)
-    )
-    get_db().commit()
+    id_ = uuid7()
+    cat = parse_id(data.get("category"))
+
+    def op(db):
+        pos = db.execute(
+            "SELECT COALESCE(MAX(position),0)+1 as p FROM items WHERE list_id=? AND category IS ?",
+            (list_id, cat)
+        ).fetchone()["p"]
+        db.execute(
+            "INSERT INTO items (id, list_id, category, name, quantity, note, done, position) VALUES (?,?,?,?,?,?,0,?)",
+            (id_, list_id, cat, data["name"], data.get("quantity","1"), data.get("note",""), pos)
+        )
+
+    run_write(op)
     return jsonify({"id": id_}), 201
 
-@app.route("/api/lists/<list_id>/items/<item_id>", methods=["PUT"])
+@app.route("/api/lists/<id:list_id>/items/<id:item_id>", methods=["PUT"])
 def update_item(list_id, item_id):
     data = request.get_json()
-    db = get_db()
     sets = []
     vals = []
     for k in ("name", "quantity", "note", "category"):
         if k in data:
             sets.append(f"{k}=?")
-            vals.append(data[k])
+            vals.append(parse_id(data[k]) if k == "category" else data[k])
     if sets:
         vals.extend([item_id, list_id])
-        db.execute(f"UPDATE items SET {','.join(sets)} WHERE id=? AND list_id=?", vals)
-    db.commit()
+        run_write(lambda db: db.execute(f"UPDATE items SET {','.join(sets)} WHERE id=? AND list_id=?", vals))
     return jsonify({"ok": True})
 
-@app.route("/api/lists/<list_id>/items/<item_id>/toggle", methods=["POST"])
+@app.route("/api/lists/<id:list_id>/items/<id:item_id>/toggle", methods=["POST"])
 def toggle_item(list_id, item_id):
-    db = get_db()
-    db.execute(
-        "UPDATE items SET done = 1 - done WHERE id=? AND list_id=?", (item_id, list_id)
-    )
-    db.commit()
-    row = db.execute("SELECT done FROM items WHERE id=?", (item_id,)).fetchone()
+    def op(db):
+        db.execute(
+            "UPDATE items SET done = 1 - done WHERE id=? AND list_id=?", (item_id, list_id)
+        )
+        return db.execute("SELECT done FROM items WHERE id=?", (item_id,)).fetchone()
+
+    row = run_write(op)
+    if not row:
+        return jsonify({"error": "Not found"}), 404
     return jsonify({"done": row["done"]})
 
-@app.route("/api/lists/<list_id>/items/<item_id>", methods=["DELETE"])
+@app.route("/api/lists/<id:list_id>/items/<id:item_id>", methods=["DELETE"])
 def delete_item(list_id, item_id):
-    get_db().execute("DELETE FROM items WHERE id=? AND list_id=?", (item_id, list_id))
-    get_db().commit()
+    run_write(lambda db: db.execute("DELETE FROM items WHERE id=? AND list_id=?", (item_id, list_id)))
     return jsonify({"ok": True})
 
+# ---------------------------------------------------------------------------
+# Bulk item operations (set-based, one statement per request)
+# ---------------------------------------------------------------------------
+# Id lists are bound as a single JSON array of id strings and expanded with
+# json_each (uuid_blob turns each into its stored form), so there is one
+# statement (and one plan) whatever the number of ids. The unary
+# `+` on list_id keeps the planner on the primary key (one lookup per id)
+# instead of walking the whole list through idx_items_list.
+ITEM_COLUMNS = "id, list_id, category, name, quantity, note, done, position"
+BULK_UPDATE_DONE_SQL = "UPDATE items SET done={} WHERE +list_id=? AND id IN (SELECT uuid_blob(value) FROM json_each(?)) RETURNING " + ITEM_COLUMNS
+BULK_DELETE_SQL = "DELETE FROM items WHERE +list_id=? AND id IN (SELECT uuid_blob(value) FROM json_each(?)) RETURNING " + ITEM_COLUMNS
+BULK_MOVE_SQL = f"""UPDATE items SET category=?, position=? + j.key + 1
+    FROM json_each(?) AS j
+    WHERE items.id = uuid_blob(j.value) AND +items.list_id=?
+    RETURNING {ITEM_COLUMNS}"""
+def bulk_ids():
+    """The `ids` array of a bulk request body, or None if it is missing or malformed."""
+    data = request.get_json(silent=True)
+    ids = data.get("ids") if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        return None
+    return ids
+
+def set_items_done(db, list_id, ids, done=None):
+    """Set (or with done=None, flip) done on the given items; return the updated rows."""
+    if not ids:
+        return []
+    value = "1 - done" if done is None else "?"
+    params = () if done is None else (1 if done else 0,)
+    return db.execute(BULK_UPDATE_DONE_SQL.format(value), params + (list_id, json.dumps(ids))).fetchall()
+
+def delete_items(db, list_id, ids):
+    """Delete the given items; return the deleted rows."""
+    if not ids:
+        return []
+    return db.execute(BULK_DELETE_SQL, (list_id, json.dumps(ids))).fetchall()
+
+@app.route("/api/lists/<id:list_id>/items/bulk-toggle", methods=["POST"])
+def bulk_toggle_items(list_id):
+    """Flip done on every listed item, or set it when the body has `done`."""
+    ids = bulk_ids()
+    if ids is None:
+        return jsonify({"error": "ids must be a list of item ids"}), 400
+    done = request.get_json().get("done")
+    if not (done is None or isinstance(done, bool) or (type(done) is int and done in (0, 1))):
+        return jsonify({"error": "done must be a boolean, 0 or 1"}), 400
+    rows = run_write(lambda db: set_items_done(db, list_id, ids, done))
+    return jsonify({"updated": len(rows), "items": [dict(r) for r in rows]})
+
+@app.route("/api/lists/<id:list_id>/items/bulk-delete", methods=["POST"])
+def bulk_delete_items(list_id):
+    ids = bulk_ids()
+    if ids is None:
+        return jsonify({"error": "ids must be a list of item ids"}), 400
+    rows = run_write(lambda db: delete_items(db, list_id, ids))
+    return jsonify({"deleted": len(rows), "ids": [r["id"] for r in rows]})
+
+@app.route("/api/lists/<id:list_id>/items/bulk-move", methods=["POST"])
+def bulk_move_items(list_id):
+    """Move items to `category` (null = General), appended in the order given."""
+    ids = bulk_ids()
+    if ids is None:
+        return jsonify({"error": "ids must be a list of item ids"}), 400
+    category = request.get_json().get("category")
+    if category is not None and not isinstance(category, str):
+        return jsonify({"error": "category must be a category id or null"}), 400
+    category = parse_id(category)
+
+    def op(db):
+        if category is not None and not db.execute(
+            "SELECT 1 FROM categories WHERE id=? AND list_id=?", (category, list_id)
+        ).fetchone():
+            return None
+        base = db.execute(
+            "SELECT COALESCE(MAX(position),0) AS p FROM items WHERE list_id=? AND category IS ?",
+            (list_id, category)
+        ).fetchone()["p"]
+        return db.execute(BULK_MOVE_SQL, (category, base, json.dumps(ids), list_id)).fetchall()
+
+    rows = run_write(op)
+    if rows is None:
+        return jsonify({"error": "Category not found"}), 404
+    return jsonify({"updated": len(rows), "items": [dict(r) for r in rows]})
+
+@app.route("/api/lists/<id:list_id>/items/batch", methods=["POST"])
+def batch_items(list_id):
+    """
+    Apply a batch of item mutations in one transaction.
+
+    Body: {"ops": [{"op": "set_done", "id": ..., "done": 0|1} | {"op": "delete", "id": ...}]}.
+    Ops carry final states rather than toggles so a retried batch is harmless.
+    Returns whether each op found its item.
+    """
+    data = request.get_json(silent=True)
+    ops = data.get("ops") if isinstance(data, dict) else None
+    if not isinstance(ops, list):
+        return jsonify({"error": "ops must be a list"}), 400
+    for o in ops:
+        if not isinstance(o, dict) or o.get("op") not in ("set_done", "delete") \
+                or not isinstance(o.get("id"), str) or not o["id"]:
+            return jsonify({"error": "Each op needs an id and op 'set_done' or 'delete'"}), 400
+
+    def op(db):
+        # Three set-based statements however many ops there are
+        found = {"delete": {r["id"] for r in delete_items(db, list_id, [o["id"] for o in ops if o["op"] == "delete"])},
+                 "set_done": set()}
+        for done in (1, 0):
+            ids = [o["id"] for o in ops if o["op"] == "set_done" and bool(o.get("done")) == bool(done)]
+            found["set_done"].update(r["id"] for r in set_items_done(db, list_id, ids, done))
+        return [{"id": o["id"], "op": o["op"], "found": parse_id(o["id"]) in found[o["op"]]} for o in ops]
+
+    return jsonify({"results": run_write(op)})
+
 # ---------------------------------------------------------------------------
 # Convenience: clear completed items
 # ---------------------------------------------------------------------------
-@app.route("/api/lists/<list_id>/items/clear-done", methods=["DELETE"])
+@app.route("/api/lists/<id:list_id>/items/clear-done", methods=["DELETE"])
 def clear_done(list_id):
-    get_db().execute("DELETE FROM items WHERE list_id=? AND done=1", (list_id,))
-    get_db().commit()
+    def op(db):
+        # Archive what was bought before it disappears; triggers roll it into purchase_stats
+        db.execute(
+            """INSERT INTO purchase_history (list_id, key, name, quantity, category)
+               SELECT list_id, lower(trim(name)), name, quantity, category
+               FROM items WHERE list_id=? AND done=1""",
+            (list_id,)
+        )
+        db.execute("DELETE FROM items WHERE list_id=? AND done=1", (list_id,))
+
+    run_write(op)
     return jsonify({"ok": True})
 
+@app.route("/api/lists/<id:list_id>/suggestions", methods=["GET"])
+@revision_etag("lists")
+def get_suggestions(list_id):
+    """
+    "Buy again" items for a list, most often and most recently bought first.
+
+    Reads only the purchase_stats aggregates (via idx_purchase_stats_rank);
+    items already waiting on the list are left out. `?limit=` caps the count.
+    """
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    rows = get_db().execute(
+        """SELECT name, quantity, category, times, last_purchased FROM purchase_stats
+           WHERE list_id=? AND key NOT IN (SELECT lower(trim(name)) FROM items WHERE list_id=? AND done=0)
+           ORDER BY times DESC, last_purchased DESC LIMIT ?""",
+        (list_id, list_id, limit)
+    ).fetchall()
+    return jsonify([dict(r) for r in rows])
+
 # ---------------------------------------------------------------------------
 # Stats helper (used by the UI header)
 # ---------------------------------------------------------------------------
-@app.route("/api/lists/<list_id>/stats", methods=["GET"])
+@app.route("/api/lists/<id:list_id>/stats", methods=["GET"])
+@revision_etag("lists")
 def get_stats(list_id):
-    db = get_db()
-    total = db.execute("SELECT COUNT(*) as c FROM items WHERE list_id=?", (list_id,)).fetchone()["c"]
-    done  = db.execute("SELECT COUNT(*) as c FROM items WHERE list_id=? AND done=1", (list_id,)).fetchone()["c"]
-    return jsonify({"total": total, "done": done})
+    # Counters are maintained by the trg_items_stats_* triggers
+    row = get_db().execute("SELECT total, done FROM list_stats WHERE list_id=?", (list_id,)).fetchone()
+    if not row:
+        return jsonify({"total": 0, "done": 0})
+    return jsonify({"total": row["total"], "done": row["done"]})
+
+# ---------------------------------------------------------------------------
+# Autocomplete
+# ---------------------------------------------------------------------------
+AUTOCOMPLETE_KINDS = ("item", "ingredient", "unit")
+
+@app.route("/api/autocomplete", methods=["GET"])
+def autocomplete():
+    """
+    Terms of `kind` starting with `prefix` (case-insensitive), most used first.
+
+    The prefix becomes a range on the terms primary key, so only matching
+    rows are read; trigger-maintained counts do the ranking.
+    """
+    kind = request.args.get("kind")
+    if kind not in AUTOCOMPLETE_KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(AUTOCOMPLETE_KINDS)}"}), 400
+    prefix = request.args.get("prefix", "").strip()
+    if not prefix:
+        return jsonify([])
+    limit = max(1, min(request.args.get("limit", 8, type=int), 20))
+    rows = get_db().execute(
+        """SELECT term, freq FROM terms
+           WHERE kind=?1 AND norm >= lower(?2) AND norm < lower(?2) || char(1114111)
+           ORDER BY freq DESC, norm LIMIT ?3""",
+        (kind, prefix, limit)
+    ).fetchall()
+    return jsonify([dict(r) for r in rows])
+
+# ---------------------------------------------------------------------------
+# Backups
+# ---------------------------------------------------------------------------
+# Snapshots are copied with SQLite's online backup API, BACKUP_PAGES pages per
+# step with a BACKUP_SLEEP_MS pause after each, so the source is read-locked
+# only for one short step at a time and writers run in between. A write from
+# another connection makes the stepped copy start over, so after
+# BACKUP_RESTARTS restarts the rest is copied in a single step; under WAL
+# that holds only a read snapshot, so writers still are not blocked. Each copy
+# must pass PRAGMA integrity_check, is gzipped and gets a sha256sum-style
+# checksum file; the newest BACKUP_KEEP snapshots of each database are kept.
+BACKUP_DIR = os.environ.get("BACKUP_DIR")
+BACKUP_PAGES = int(os.environ.get("BACKUP_PAGES", "256"))
+BACKUP_SLEEP_MS = float(os.environ.get("BACKUP_SLEEP_MS", "5"))
+BACKUP_RESTARTS = int(os.environ.get("BACKUP_RESTARTS", "3"))
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+BACKUP_NAME_RE = re.compile(r"cartly-\d{8}T\d{12}Z\.db\.gz")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+class BackupError(Exception):
+    """A backup could not be taken, verified or restored; the message is safe to show users."""
+
+    def __init__(self, message, status=422):
+        super().__init__(message)
+        self.status = status
+
+@app.errorhandler(BackupError)
+def backup_error(exc):
+    return jsonify({"error": str(exc)}), exc.status
+
+def backup_dir(path=None):
+    return household_subdir(BACKUP_DIR or os.path.join(os.path.dirname(DB_PATH), "backups"), path)
+
+@contextmanager
+def _backup_lock(directory):
+    # One backup or restore per database at a time, across processes
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BackupError("A backup or restore is already running", 409)
+        yield
+
+def _sha256_file(path):
+    with open(path, "rb") as f:
+        return hash_stream(f)
+
+def _check_integrity(conn):
+    result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != "ok":
+        raise BackupError(f"Integrity check failed: {result}")
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+class _BackupRestarting(Exception):
+    pass
+
+def _copy_database(src, dst):
+    """Copy `src` into `dst` in small steps, or in one once writers have restarted it too often."""
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] >= BACKUP_RESTARTS:
+                raise _BackupRestarting()
+        state["remaining"] = remaining
+        time.sleep(BACKUP_SLEEP_MS / 1000)
+
+    try:
+        src.backup(dst, pages=BACKUP_PAGES, progress=progress)
+    except _BackupRestarting:
+        src.backup(dst, pages=-1)
+    return state["restarts"]
+
+def create_backup(path=None):
+    """Snapshot database `path` (default: the current request's) and return the snapshot's info."""
+    path = path or db_path()
+    directory = backup_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    with _backup_lock(directory):
+        name = f"cartly-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}Z.db.gz"
+        archive = os.path.join(directory, name)
+        fd, raw = tempfile.mkstemp(dir=directory, suffix=".db.tmp")
+        os.close(fd)
+        try:
+            src, dst = sqlite3.connect(path), sqlite3.connect(raw)
+            try:
+                _copy_database(src, dst)
+                _check_integrity(dst)
+            finally:
+                src.close()
+                dst.close()
+            with open(raw, "rb") as f_in, gzip.open(f"{archive}.tmp", "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+            digest = _sha256_file(f"{archive}.tmp")
+            with open(f"{archive}.sha256", "w") as f:
+                f.write(f"{digest}  {name}\n")
+            os.replace(f"{archive}.tmp", archive)
+        finally:
+            _unlink(raw)
+            _unlink(f"{archive}.tmp")
+        for old in list_backups(path)[BACKUP_KEEP:]:
+            _unlink(os.path.join(directory, old["name"]))
+            _unlink(os.path.join(directory, f"{old['name']}.sha256"))
+    return {"name": name, "size": os.path.getsize(archive), "sha256": digest}
+
+def list_backups(path=None):
+    """Snapshots of database `path`, newest first."""
+    directory = backup_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if BACKUP_NAME_RE.fullmatch(n)), reverse=True)
+    return [{"name": n, "size": os.path.getsize(os.path.join(directory, n))} for n in names]
+
+def verify_backup(archive):
+    """
+    Check a snapshot against its checksum and decompress it.
+
+    Returns the path of a temporary, integrity-checked copy of the database;
+    the caller deletes it.
+    """
+    try:
+        with open(f"{archive}.sha256") as f:
+            expected = f.read().split()[0]
+    except (OSError, IndexError):
+        raise BackupError("Checksum file is missing")
+    if _sha256_file(archive) != expected:
+        raise BackupError("Checksum mismatch")
+    fd, raw = tempfile.mkstemp(dir=os.path.dirname(archive), suffix=".db.tmp")
+    os.close(fd)
+    try:
+        with gzip.open(archive, "rb") as f_in, open(raw, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        conn = sqlite3.connect(raw)
+        try:
+            _check_integrity(conn)
+            if conn.execute("PRAGMA user_version").fetchone()[0] > SCHEMA_VERSION:
+                raise BackupError("Backup is from a newer version of Cartly")
+        finally:
+            conn.close()
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        _unlink(raw)
+        raise BackupError(f"Backup is unreadable: {e}")
+    except BackupError:
+        _unlink(raw)
+        raise
+    return raw
+
+def restore_backup(name, path=None):
+    """
+    Replace database `path` (default: the current request's) with a snapshot.
+
+    The snapshot is verified first and the current state is backed up, so a
+    restore can itself be undone. Revisions end up above any value seen
+    before, so no cache or ETag from before the restore stays valid.
+    """
+    path = path or db_path()
+    directory = backup_dir(path)
+    if not BACKUP_NAME_RE.fullmatch(name) or not os.path.exists(os.path.join(directory, name)):
+        raise BackupError("Backup not found", 404)
+    raw = verify_backup(os.path.join(directory, name))
+    try:
+        safety = create_backup(path)
+        with _backup_lock(directory):
+            src = sqlite3.connect(raw)
+            dst = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+            try:
+                revisions = dst.execute("SELECT rev, scope FROM revisions").fetchall()
+                src.backup(dst)  # a single step: readers see either the old or the new database
+            finally:
+                src.close()
+                dst.close()
+    finally:
+        _unlink(raw)
+    init_db(path)  # the snapshot may predate the current schema
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        conn.executemany("UPDATE revisions SET rev = MAX(rev, ?) + 1 WHERE scope = ?", revisions)
+        conn.commit()
+    finally:
+        conn.close()
+    recipe_cache.clear()
+    return {"restored": name, "safety_backup": safety["name"]}
+
+def is_admin_request():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get("Authorization", "").encode(),
+                                                     f"Bearer {ADMIN_TOKEN}".encode())
+
+def admin_required(view):
+    """Admin endpoints need `Authorization: Bearer $ADMIN_TOKEN`; without ADMIN_TOKEN they do not exist."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        if not is_admin_request():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route("/api/admin/backups", methods=["GET"])
+@admin_required
+def get_backups():
+    return jsonify(list_backups())
+
+@app.route("/api/admin/backups", methods=["POST"])
+@admin_required
+@heavy
+def post_backup():
+    return jsonify(create_backup()), 201
+
+@app.route("/api/admin/backups/<name>/restore", methods=["POST"])
+@admin_required
+@heavy
+def post_restore(name):
+    return jsonify(restore_backup(name))
+
+# ---------------------------------------------------------------------------
+# Storage maintenance
+# ---------------------------------------------------------------------------
+# A background thread in each worker visits the databases that worker wrote
+# to since its last pass, every MAINTENANCE_INTERVAL seconds:
+#   * PRAGMA optimize (bounded by analysis_limit) every OPTIMIZE_INTERVAL;
+#   * PRAGMA incremental_vacuum once VACUUM_FREE_PAGES pages are free,
+#     at most VACUUM_STEP_PAGES per pass;
+#   * a TRUNCATE checkpoint once the WAL exceeds WAL_CHECKPOINT_BYTES, so
+#     reads stop paying for a long WAL.
+# The pass uses a short busy timeout and skips any step that would make
+# requests wait. A lock file keeps workers from visiting a database at once.
+MAINTENANCE_INTERVAL = float(os.environ.get("MAINTENANCE_INTERVAL", "60"))
+MAINTENANCE_BUSY_MS = int(os.environ.get("MAINTENANCE_BUSY_MS", "250"))
+WAL_CHECKPOINT_BYTES = int(os.environ.get("WAL_CHECKPOINT_BYTES", str(4 * 1024 * 1024)))
+OPTIMIZE_INTERVAL = float(os.environ.get("OPTIMIZE_INTERVAL", "3600"))
+ANALYSIS_LIMIT = int(os.environ.get("ANALYSIS_LIMIT", "400"))
+ANALYZE_DRIFT = int(os.environ.get("ANALYZE_DRIFT", "10"))
+VACUUM_FREE_PAGES = int(os.environ.get("VACUUM_FREE_PAGES", "256"))
+VACUUM_STEP_PAGES = int(os.environ.get("VACUUM_STEP_PAGES", "1024"))
+maintenance_log = logging.getLogger("cartly.maintenance")
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+class Maintenance:
+    """Per-process background checkpoint, optimize and incremental-vacuum passes."""
+
+    def __init__(self):
+        self.runs = 0
+        self.checkpoints = 0
+        self.optimizes = 0
+        self.vacuumed_pages = 0
+        self.seconds = 0.0
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._last_optimize = {}
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def touch(self, path):
+        """Note a write to `path`, to be looked after on the next pass."""
+        with self._dirty_lock:
+            self._dirty.add(path)
+        if MAINTENANCE_INTERVAL > 0 and self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():  # started lazily, and again after fork
+                    threading.Thread(target=self._loop, name="cartly-maintenance", daemon=True).start()
+                    self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            time.sleep(MAINTENANCE_INTERVAL)
+            with self._dirty_lock:
+                paths, self._dirty = self._dirty, set()
+            for path in paths:
+                try:
+                    self.run(path)
+                except Exception:  # never let the maintenance thread die
+                    maintenance_log.exception("maintenance of %s failed", path)
+
+    @staticmethod
+    def _probe_ms(conn):
+        start = time.perf_counter()
+        conn.execute("SELECT COUNT(*) FROM items").fetchone()
+        return round((time.perf_counter() - start) * 1000, 3)
+
+    @staticmethod
+    def _stats_stale(conn):
+        """Whether any non-empty table has no sqlite_stat1 rows, or has grown or shrunk ANALYZE_DRIFT-fold since."""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            return True
+        analyzed = {tbl: int(stat.split()[0]) for tbl, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1")}
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+        for (name,) in tables:
+            rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            if not rows:
+                continue  # ANALYZE records nothing for an empty table
+            before = analyzed.get(name)
+            if not before or max(rows, before) >= ANALYZE_DRIFT * min(rows, before):
+                return True
+        return False
+
+    def _optimize_sql(self, conn):
+        # Before 3.46 a fresh connection's PRAGMA optimize only looks at tables it
+        # has queried, so it never creates statistics; ANALYZE them outright.
+        if sqlite3.sqlite_version_info >= (3, 46):
+            return "PRAGMA optimize=0x10002"
+        return "ANALYZE" if self._stats_stale(conn) else "PRAGMA optimize"
+
+    def _step(self, conn, report, name, sql):
+        start = time.perf_counter()
+        try:
+            result = conn.execute(sql).fetchall()
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+            report[f"{name}_skipped"] = "busy"
+            return None
+        report[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    def run(self, path, force=False):
+        """
+        One maintenance pass over database `path`.
+
+        `force` runs every step regardless of thresholds. Returns a report of
+        sizes and timings before and after, or None when another process is
+        already maintaining this database.
+        """
+        with open(f"{path}.maint-lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            started = time.perf_counter()
+            conn = sqlite3.connect(path, isolation_level=None)
+            try:
+                conn.execute(f"PRAGMA busy_timeout={MAINTENANCE_BUSY_MS}")
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                report = {
+                    "path": path,
+                    "db_bytes_before": _file_size(path),
+                    "wal_bytes_before": _file_size(f"{path}-wal"),
+                    "free_pages_before": free_pages,
+                    "probe_ms_before": self._probe_ms(conn),
+                }
+
+                last = self._last_optimize.get(path)
+                if force or last is None or time.monotonic() - last >= OPTIMIZE_INTERVAL:
+                    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+                    sql = self._optimize_sql(conn)
+                    report["optimize"] = sql
+                    if self._step(conn, report, "optimize", sql) is not None:
+                        self._last_optimize[path] = time.monotonic()
+                        self.optimizes += 1
+
+                incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+                if incremental and free_pages and (force or free_pages >= VACUUM_FREE_PAGES):
+                    if self._step(conn, report, "vacuum", f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})") is not None:
+                        self.vacuumed_pages += free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+                if force or _file_size(f"{path}-wal") >= WAL_CHECKPOINT_BYTES:
+                    result = self._step(conn, report, "checkpoint", "PRAGMA wal_checkpoint(TRUNCATE)")
+                    if result is not None:
+                        report["checkpoint_busy"] = bool(result[0][0])
+                        self.checkpoints += 1
+
+                report.update({
+                    "db_bytes_after": _file_size(path),
+                    "wal_bytes_after": _file_size(f"{path}-wal"),
+                    "free_pages_after": conn.execute("PRAGMA freelist_count").fetchone()[0],
+                    "probe_ms_after": self._probe_ms(conn),
+                })
+            finally:
+                conn.close()
+            elapsed = time.perf_counter() - started
+            report["total_ms"] = round(elapsed * 1000, 3)
+            self.runs += 1
+            self.seconds += elapsed
+        maintenance_log.info("maintenance %s", json.dumps(report))
+        return report
+
+maintenance = Maintenance()
+
+@metric_collector
+def maintenance_metrics():
+    return {
+        "cartly_maintenance_runs_total": maintenance.runs,
+        "cartly_maintenance_seconds_total": maintenance.seconds,
+        "cartly_wal_checkpoints_total": maintenance.checkpoints,
+        "cartly_optimize_runs_total": maintenance.optimizes,
+        "cartly_vacuumed_pages_total": maintenance.vacuumed_pages,
+    }
+
+def vacuum_database(path):
+    """Rebuild `path` with VACUUM, switching it to incremental auto-vacuum; returns (bytes before, after)."""
+    before = _file_size(path)
+    conn = sqlite3.connect(path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return before, _file_size(path)
+
+@app.route("/api/admin/maintenance", methods=["POST"])
+@admin_required
+@heavy
+def post_maintenance():
+    report = maintenance.run(db_path(), force=True)
+    if report is None:
+        return jsonify({"error": "Maintenance is already running"}), 409
+    return jsonify(report)
+
+def _cli_db_path(household):
+    if household is None:
+        return DB_PATH
+    if not SHARD_DIR or not HOUSEHOLD_RE.fullmatch(household) or not os.path.exists(shard_path(household)):
+        raise click.BadParameter("unknown household", param_hint="--household")
+    return shard_path(household)
+
+household_option = click.option("--household", default=None, help="Household shard (default: the default database).")
+
+def backup_command(fn):
+    """Report BackupError as a CLI error rather than a traceback."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except BackupError as e:
+            raise click.ClickException(str(e))
+    return wrapper
+
+@app.cli.group("backup")
+def backup_cli():
+    """Take, list, verify and restore database snapshots."""
+
+@backup_cli.command("create")
+@backup_command
+@household_option
+def backup_create(household):
+    """Snapshot a database, then rotate old snapshots."""
+    info = create_backup(_cli_db_path(household))
+    click.echo(f"{info['name']}\t{info['size']}\t{info['sha256']}")
+
+@backup_cli.command("list")
+@backup_command
+@household_option
+def backup_list(household):
+    for info in list_backups(_cli_db_path(household)):
+        click.echo(f"{info['name']}\t{info['size']}")
+
+@backup_cli.command("verify")
+@backup_command
+@click.argument("name")
+@household_option
+def backup_verify(name, household):
+    """Check a snapshot's checksum and integrity without restoring it."""
+    os.unlink(verify_backup(os.path.join(backup_dir(_cli_db_path(household)), name)))
+    click.echo(f"{name}: ok")
+
+@backup_cli.command("restore")
+@backup_command
+@click.argument("name")
+@household_option
+def backup_restore(name, household):
+    """Replace a database with a verified snapshot (the current state is backed up first)."""
+    result = restore_backup(name, _cli_db_path(household))
+    click.echo(f"restored {result['restored']} (previous state saved as {result['safety_backup']})")
+
+@app.cli.group("maintenance")
+def maintenance_cli():
+    """Checkpoint, optimize and vacuum databases on demand."""
+
+@maintenance_cli.command("run")
+@household_option
+@click.option("--all", "all_shards", is_flag=True, help="Every database, households included.")
+def maintenance_run(household, all_shards):
+    """Run every maintenance step now and print the before/after report."""
+    paths = [path for _, path in iter_shards() if os.path.exists(path)] if all_shards else [_cli_db_path(household)]
+    for path in paths:
+        report = maintenance.run(path, force=True)
+        click.echo(json.dumps(report) if report else f"{path}: busy, skipped")
+
+@maintenance_cli.command("vacuum")
+@household_option
+def maintenance_vacuum(household):
+    """Rebuild a database with VACUUM (blocks writers while it runs)."""
+    before, after = vacuum_database(_cli_db_path(household))
+    click.echo(f"{before} -> {after} bytes")
+
+# ---------------------------------------------------------------------------
+# Profiling (off unless PROFILING=1)
+# ---------------------------------------------------------------------------
+# An admin request (Authorization: Bearer $ADMIN_TOKEN) sending `X-Profile: 1`
+# runs its view under cProfile. The stats are saved to PROFILE_DIR under the
+# name returned in X-Profile-Name, and /api/admin/profiles/<name> serves them
+# as a pstats file or, with ?format=text, as a report. A worker profiles one
+# request at a time; a request that finds the profiler in use is answered
+# normally with `X-Profile-Name: busy`. /api/admin/tracemalloc/snapshot
+# starts tracing the answering worker's allocations and reports what grew
+# since its previous snapshot; DELETE /api/admin/tracemalloc stops it.
+PROFILING = os.environ.get("PROFILING", "").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "cartly-profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_NAME_RE = re.compile(r"\d{8}T\d{12}Z-[\w.-]+\.prof")
+PROFILE_SORT_KEYS = ("cumulative", "tottime", "ncalls", "calls", "time")
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "10"))
+profile_log = logging.getLogger("cartly.profile")
+_profile_lock = threading.Lock()
+
+def list_profiles():
+    """Stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return [{"name": name, "bytes": _file_size(os.path.join(PROFILE_DIR, name))}
+            for name in sorted(os.listdir(PROFILE_DIR), reverse=True) if PROFILE_NAME_RE.fullmatch(name)]
+
+def save_profile(profiler):
+    """Dump `profiler` to PROFILE_DIR, keeping the newest PROFILE_KEEP; returns the file name."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    request_id = re.sub(r"[^\w.-]", "", current_request_id())[:32]
+    name = f"{stamp}-{request.endpoint or 'unmatched'}-{request_id}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    for old in list_profiles()[PROFILE_KEEP:]:
+        _unlink(os.path.join(PROFILE_DIR, old["name"]))
+    return name
+
+@contextmanager
+def profiled():
+    """Run the enclosed block under cProfile if the request asked for it and may."""
+    if not (PROFILING and request.headers.get(PROFILE_HEADER) == "1" and is_admin_request()):
+        yield
+        return
+    if not _profile_lock.acquire(blocking=False):
+        g.profile_name = "busy"
+        yield
+        return
+    import cProfile  # imported lazily: only profiled requests need it
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler (a debugger, coverage) owns the interpreter
+        _profile_lock.release()
+        g.profile_name = "busy"
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            g.profile_name = save_profile(profiler)
+        except OSError as e:
+            profile_log.warning("could not save profile: %s", e)
+            g.profile_name = "error"
+        finally:
+            _profile_lock.release()
+
+@app.after_request
+def add_profile_name(response):
+    if "profile_name" in g:
+        response.headers["X-Profile-Name"] = g.profile_name
+    return response
+
+class MemoryProfiler:
+    """tracemalloc snapshots of this worker, each compared with the one before."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self, key_type="lineno", limit=25):
+        import tracemalloc
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._snapshot = None
+            current = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            ))
+            previous, self._snapshot = self._snapshot, current
+        traced, peak = tracemalloc.get_traced_memory()
+        report = {"pid": os.getpid(), "traced_bytes": traced, "peak_bytes": peak}
+        if previous is None:
+            report["baseline"] = True  # tracing just started; the next snapshot shows growth
+            return report
+        report["top"] = [{
+            "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        } for stat in current.compare_to(previous, key_type)[:limit]]
+        return report
+
+    def stop(self):
+        import tracemalloc
+        with self._lock:
+            was_tracing = tracemalloc.is_tracing()
+            tracemalloc.stop()
+            self._snapshot = None
+        return {"pid": os.getpid(), "stopped": was_tracing}
+
+memory_profiler = MemoryProfiler()
+
+def profiling_required(view):
+    """Profiling endpoints exist only with PROFILING on."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not PROFILING:
+            return jsonify({"error": "Not found"}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route("/api/admin/profiles", methods=["GET"])
+@admin_required
+@profiling_required
+def get_profiles():
+    return jsonify(list_profiles())
+
+@app.route("/api/admin/profiles/<name>", methods=["GET"])
+@admin_required
+@profiling_required
+def get_profile(name):
+    path = os.path.join(PROFILE_DIR, name)
+    if not PROFILE_NAME_RE.fullmatch(name) or not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get("format") != "text":
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=name)
+    sort = request.args.get("sort", "cumulative")
+    if sort not in PROFILE_SORT_KEYS:
+        return jsonify({"error": f"sort must be one of {', '.join(PROFILE_SORT_KEYS)}"}), 400
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats(sort).print_stats(max(1, request.args.get("limit", 40, type=int)))
+    return Response(out.getvalue(), mimetype="text/plain")
+
+@app.route("/api/admin/tracemalloc/snapshot", methods=["POST"])
+@admin_required
+@profiling_required
+def post_tracemalloc_snapshot():
+    key_type = request.args.get("key", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "key must be lineno, filename or traceback"}), 400
+    return jsonify(memory_profiler.snapshot(key_type, max(1, request.args.get("limit", 25, type=int))))
+
+@app.route("/api/admin/tracemalloc", methods=["DELETE"])
+@admin_required
+@profiling_required
+def delete_tracemalloc():
+    return jsonify(memory_profiler.stop())
+
+# ---------------------------------------------------------------------------
+# Household admin commands (flask --app app shards ...)
+# ---------------------------------------------------------------------------
+@app.cli.group("shards")
+def shards_cli():
+    """Create, inspect, migrate and back up household databases."""
+
+def _shard_label(household):
+    return household or "(default)"
+
+@shards_cli.command("list")
+def shards_list():
+    """Print each database with its size and schema version."""
+    for household, path in iter_shards():
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+        click.echo(f"{_shard_label(household)}\t{os.path.getsize(path)}\tv{version}")
+
+@shards_cli.command("create")
+@click.argument("household")
+def shards_create(household):
+    """Create the database of a new household."""
+    if not SHARD_DIR:
+        raise click.UsageError("SHARD_DIR is not set")
+    if not HOUSEHOLD_RE.fullmatch(household):
+        raise click.BadParameter("1-63 characters of a-z, 0-9, - and _", param_hint="HOUSEHOLD")
+    path = shard_path(household)
+    if os.path.exists(path):
+        raise click.ClickException(f"household {household} already exists")
+    init_db(path)
+    click.echo(f"{household}: v{SCHEMA_VERSION}")
+
+@shards_cli.command("migrate")
+def shards_migrate():
+    """Bring every database up to SCHEMA_VERSION."""
+    for household, path in iter_shards():
+        init_db(path)
+        click.echo(f"{_shard_label(household)}: v{SCHEMA_VERSION}")
+
+@shards_cli.command("backup")
+@backup_command
+def shards_backup():
+    """Snapshot every database into its backup directory."""
+    for household, path in iter_shards():
+        if os.path.exists(path):
+            click.echo(f"{_shard_label(household)}: {create_backup(path)['name']}")
 
 if __name__ == "__main__":
     init_db()
     app.run(host="0.0.0.0", port=5000)
 
-# gunicorn calls this automatically
+# gunicorn calls this automatically (once in the master with --preload)
 init_db()
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
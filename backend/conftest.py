@@ -0,0 +1,36 @@
+import os
+import pytest
+import app as app_module
+from app import app, init_db, Metrics, RecipeCache
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path, monkeypatch):
+    """Keep each test's request metrics in its own directory, not the shared METRICS_DIR."""
+    path = str(tmp_path / "metrics")
+    monkeypatch.setattr(app_module, "METRICS_DIR", path)
+    monkeypatch.setattr(app_module, "metrics", Metrics(path))
+    return path
+
+
+@pytest.fixture
+def temp_dir(tmp_path):
+    """A temporary directory for the test's database and other files."""
+    return str(tmp_path)
+
+
+@pytest.fixture
+def db_path(temp_dir, monkeypatch):
+    """Point the app at a database path in the temporary directory (not yet initialised)."""
+    path = os.path.join(temp_dir, "shopping.db")
+    monkeypatch.setattr(app_module, "DB_PATH", path)
+    return path
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    """Create a test client with a freshly initialised database and an empty recipe cache."""
+    monkeypatch.setattr(app_module, "recipe_cache", RecipeCache())
+    init_db()
+    with app.test_client() as client:
+        yield client
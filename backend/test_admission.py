@@ -0,0 +1,114 @@
+import pytest
+import json
+import threading
+import time
+import app as app_module
+from app import app, AdmissionClass, AdmissionRejected
+
+
+@pytest.fixture(autouse=True)
+def admission(monkeypatch):
+    """Give each test fresh admission classes."""
+    monkeypatch.setattr(app_module, "admission", {
+        "heavy": AdmissionClass("heavy", 1, 1, 0.2),
+        "light": AdmissionClass("light", 0, 0, 0),
+    })
+
+
+class TestAdmissionClass:
+    """Test the per-class concurrency limit and wait queue."""
+
+    def test_rejects_past_queue_depth(self):
+        limiter = AdmissionClass("heavy", 1, 0, 5)
+        limiter.acquire()
+        with pytest.raises(AdmissionRejected) as info:
+            limiter.acquire()
+        assert info.value.retry_after >= 1
+        assert (limiter.in_flight, limiter.rejected) == (1, 1)
+
+    def test_waiter_admitted_on_release(self):
+        limiter = AdmissionClass("heavy", 1, 1, 5)
+        acquired = limiter.acquire()
+        admitted = threading.Event()
+
+        def wait_for_slot():
+            limiter.acquire()
+            admitted.set()
+
+        thread = threading.Thread(target=wait_for_slot)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while limiter.waiting == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not admitted.is_set()
+
+        limiter.release(acquired)
+        thread.join(5)
+        assert admitted.is_set()
+        assert (limiter.in_flight, limiter.waiting, limiter.admitted) == (1, 0, 2)
+
+    def test_wait_times_out(self):
+        limiter = AdmissionClass("heavy", 1, 1, 0.05)
+        limiter.acquire()
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected):
+            limiter.acquire()
+        assert time.monotonic() - started < 1
+        assert limiter.waiting == 0
+
+    def test_expected_wait_rejects_without_blocking(self):
+        """Test that a long average hold time sheds a request before it queues."""
+        limiter = AdmissionClass("heavy", 1, 5, 1)
+        limiter.acquire()
+        limiter.hold_seconds = 30
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected) as info:
+            limiter.acquire()
+        assert time.monotonic() - started < 0.5
+        assert info.value.retry_after == 31
+
+    def test_unlimited_only_counts(self):
+        limiter = AdmissionClass("light", 0, 0, 0)
+        for _ in range(100):
+            limiter.acquire()
+        assert limiter.in_flight == 100
+
+
+class TestAdmissionRoutes:
+    """Test that heavy routes are shed while light routes keep flowing."""
+
+    def test_heavy_route_shed_light_route_served(self, client):
+        app_module.admission["heavy"].acquire()  # an export already running
+        app_module.admission["heavy"].hold_seconds = 10
+
+        response = client.get('/api/recipes/export')
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+
+        assert client.get('/api/lists').status_code == 200
+        assert client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json').status_code == 201
+
+    def test_slot_released_after_request(self, client):
+        for _ in range(3):
+            assert client.get('/api/recipes/export').status_code == 200
+        heavy = app_module.admission["heavy"]
+        assert (heavy.in_flight, heavy.admitted) == (0, 3)
+        assert app_module.admission["light"].in_flight == 0
+
+    def test_admin_routes_are_heavy(self):
+        for endpoint in ("post_backup", "post_restore", "post_maintenance", "import_recipes", "upload_recipe_photo"):
+            assert getattr(app.view_functions[endpoint], "route_class", None) == "heavy"
+        assert not hasattr(app.view_functions["get_items"], "route_class")
+
+    def test_queue_metrics(self, client):
+        app_module.admission["heavy"].acquire()
+        app_module.admission["heavy"].hold_seconds = 10
+        client.get('/api/recipes/export')
+
+        body = client.get('/api/metrics').data.decode()
+        assert 'cartly_admission_heavy_in_flight 1' in body
+        assert 'cartly_admission_heavy_rejected_total 1' in body
+        assert 'cartly_admission_light_admitted_total' in body
+        assert 'endpoint="export_all_recipes",method="GET",status="503"' in body
@@ -0,0 +1,67 @@
+import pytest
+import json
+import sqlite3
+import app as app_module
+from app import app, init_db
+
+
+def post(client, path, body):
+    return json.loads(client.post(path, data=json.dumps(body), content_type='application/json').data)
+
+
+def complete(client, kind, prefix, **params):
+    return client.get('/api/autocomplete', query_string={'kind': kind, 'prefix': prefix, **params})
+
+
+def terms(client, kind, prefix):
+    return [t['term'] for t in json.loads(complete(client, kind, prefix).data)]
+
+
+class TestAutocomplete:
+    """Test prefix autocomplete over item names, ingredients and units."""
+
+    def test_items_ranked_by_use(self, client):
+        list_id = post(client, '/api/lists', {'name': 'Groceries'})['id']
+        for name in ['Milk', 'Mint', 'milk', 'Mushrooms', 'Milk ', 'Eggs']:
+            post(client, f'/api/lists/{list_id}/items', {'name': name})
+
+        assert terms(client, 'item', 'mi') == ['Milk', 'Mint']
+        assert terms(client, 'item', 'M')[0] == 'Milk'
+        assert json.loads(complete(client, 'item', 'milk').data)[0]['freq'] == 3
+
+    def test_ingredients_and_units(self, client):
+        recipe_id = post(client, '/api/recipes', {'name': 'Pancakes'})['id']
+        for name, unit in [('Flour', 'cups'), ('Sugar', 'tbsp'), ('Salt', 'tsp'), ('Butter', 'tbsp')]:
+            post(client, f'/api/recipes/{recipe_id}/ingredients', {'name': name, 'unit': unit})
+
+        assert terms(client, 'ingredient', 's') == ['Salt', 'Sugar']
+        assert terms(client, 'unit', 't') == ['tbsp', 'tsp']
+        assert terms(client, 'item', 'f') == []
+
+    def test_purchases_count(self, client):
+        """Test that buying an item ranks it above one that was only added."""
+        list_id = post(client, '/api/lists', {'name': 'Groceries'})['id']
+        post(client, f'/api/lists/{list_id}/items', {'name': 'Bread'})
+        butter = post(client, f'/api/lists/{list_id}/items', {'name': 'Butter'})['id']
+        client.post(f'/api/lists/{list_id}/items/{butter}/toggle')
+        client.delete(f'/api/lists/{list_id}/items/clear-done')
+
+        assert terms(client, 'item', 'b') == ['Butter', 'Bread']
+
+    def test_backfill(self, client):
+        """Test that terms are built from existing rows when the table is added."""
+        list_id = post(client, '/api/lists', {'name': 'Groceries'})['id']
+        post(client, f'/api/lists/{list_id}/items', {'name': 'Apples'})
+
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("DELETE FROM terms")
+        conn.execute("PRAGMA user_version=4")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert terms(client, 'item', 'app') == ['Apples']
+
+    def test_validation(self, client):
+        assert complete(client, 'recipe', 'a').status_code == 400
+        assert json.loads(complete(client, 'item', '  ').data) == []
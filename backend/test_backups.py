@@ -0,0 +1,169 @@
+import pytest
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+import app as app_module
+from app import app, create_backup, list_backups, verify_backup, restore_backup, BackupError
+
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+
+
+def create_list(client, name):
+    return client.post('/api/lists', data=json.dumps({'name': name}), content_type='application/json')
+
+
+def list_names(client):
+    return {l['name'] for l in json.loads(client.get('/api/lists').data)}
+
+
+def archive_path(name):
+    return os.path.join(app_module.backup_dir(app_module.DB_PATH), name)
+
+
+class TestBackups:
+    """Test compressed, checksummed snapshots and rotation."""
+
+    def test_snapshot_is_compressed_and_checksummed(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "BACKUP_PAGES", 1)  # many small steps
+        for i in range(50):
+            create_list(client, f'List {i}')
+
+        info = create_backup(app_module.DB_PATH)
+        path = archive_path(info['name'])
+        with open(f"{path}.sha256") as f:
+            assert f.read() == f"{info['sha256']}  {info['name']}\n"
+
+        raw = verify_backup(path)
+        conn = sqlite3.connect(raw)
+        assert conn.execute("SELECT COUNT(*) FROM lists WHERE name LIKE 'List %'").fetchone()[0] == 50
+        conn.close()
+        os.unlink(raw)
+        with gzip.open(path) as f:
+            assert f.read(16) == b"SQLite format 3\x00"
+
+    def test_snapshot_completes_under_concurrent_writes(self, client, monkeypatch):
+        """Test that a source written to between steps falls back to a single-step copy."""
+        monkeypatch.setattr(app_module, "BACKUP_PAGES", 1)
+        monkeypatch.setattr(app_module, "BACKUP_SLEEP_MS", 2)
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("CREATE TABLE churn (x)")
+        conn.executemany("INSERT INTO churn VALUES (?)", [("x" * 1000,) for _ in range(200)])
+        conn.commit()
+        conn.close()
+
+        restarts = []
+        copy = app_module._copy_database
+        monkeypatch.setattr(app_module, "_copy_database", lambda src, dst: restarts.append(copy(src, dst)))
+        stop = threading.Event()
+
+        def write():
+            writer = sqlite3.connect(app_module.DB_PATH, timeout=5)
+            while not stop.wait(0.001):
+                writer.execute("INSERT INTO churn VALUES ('y')")
+                writer.commit()
+            writer.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            started = time.monotonic()
+            info = create_backup(app_module.DB_PATH)
+            elapsed = time.monotonic() - started
+        finally:
+            stop.set()
+            thread.join()
+
+        assert restarts == [app_module.BACKUP_RESTARTS]
+        assert elapsed < 10
+        raw = verify_backup(archive_path(info['name']))
+        conn = sqlite3.connect(raw)
+        assert conn.execute("SELECT COUNT(*) FROM churn").fetchone()[0] >= 200
+        conn.close()
+        os.unlink(raw)
+
+    def test_rotation_keeps_newest(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "BACKUP_KEEP", 2)
+        names = [create_backup(app_module.DB_PATH)['name'] for _ in range(3)]
+
+        assert [b['name'] for b in list_backups(app_module.DB_PATH)] == names[:0:-1]
+        assert not os.path.exists(f"{archive_path(names[0])}.sha256")
+
+    def test_tampered_snapshot_rejected(self, client):
+        name = create_backup(app_module.DB_PATH)['name']
+        with open(archive_path(name), "ab") as f:
+            f.write(b"x")
+
+        with pytest.raises(BackupError, match="Checksum mismatch"):
+            verify_backup(archive_path(name))
+        response = client.post(f'/api/admin/backups/{name}/restore', headers=AUTH)
+        assert response.status_code == 422
+
+
+class TestRestore:
+    """Test restoring a snapshot over the live database."""
+
+    def test_restore_replaces_data_and_invalidates_caches(self, client):
+        create_list(client, 'Before')
+        recipe_id = json.loads(client.post('/api/recipes', data=json.dumps({'name': 'Pancakes'}),
+            content_type='application/json').data)['id']
+        name = create_backup(app_module.DB_PATH)['name']
+
+        create_list(client, 'After')
+        client.put(f'/api/recipes/{recipe_id}', data=json.dumps({'name': 'Waffles'}),
+                   content_type='application/json')
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['name'] == 'Waffles'
+        etag = client.get('/api/lists').headers['ETag']
+
+        result = restore_backup(name, app_module.DB_PATH)
+
+        assert 'Before' in list_names(client) and 'After' not in list_names(client)
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['name'] == 'Pancakes'
+        assert client.get('/api/lists', headers={'If-None-Match': etag}).status_code == 200
+        # The state before the restore was saved and can be restored in turn
+        restore_backup(result['safety_backup'], app_module.DB_PATH)
+        assert 'After' in list_names(client)
+
+    def test_unknown_backup(self, client):
+        with pytest.raises(BackupError, match="not found"):
+            restore_backup('cartly-20240101T000000000000Z.db.gz', app_module.DB_PATH)
+        assert client.post('/api/admin/backups/../shopping.db/restore', headers=AUTH).status_code == 404
+
+
+class TestBackupAdmin:
+    """Test the admin endpoint and CLI."""
+
+    def test_endpoint_requires_token(self, client, monkeypatch):
+        assert client.post('/api/admin/backups').status_code == 401
+        assert client.post('/api/admin/backups', headers={'Authorization': 'Bearer nope'}).status_code == 401
+        monkeypatch.setattr(app_module, "ADMIN_TOKEN", None)
+        assert client.post('/api/admin/backups', headers=AUTH).status_code == 404
+
+    def test_endpoint_creates_and_lists(self, client):
+        response = client.post('/api/admin/backups', headers=AUTH)
+        assert response.status_code == 201
+        name = json.loads(response.data)['name']
+        assert [b['name'] for b in json.loads(client.get('/api/admin/backups', headers=AUTH).data)] == [name]
+
+        response = client.post(f'/api/admin/backups/{name}/restore', headers=AUTH)
+        assert response.status_code == 200
+        assert json.loads(response.data)['restored'] == name
+
+    def test_cli(self, client):
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['backup', 'create'])
+        assert result.exit_code == 0, result.output
+        name = result.output.split('\t')[0]
+
+        assert runner.invoke(args=['backup', 'list']).output.startswith(name)
+        assert runner.invoke(args=['backup', 'verify', name]).output == f"{name}: ok\n"
+        assert runner.invoke(args=['backup', 'restore', name]).exit_code == 0
+        result = runner.invoke(args=['backup', 'verify', 'missing.db.gz'])
+        assert result.exit_code == 1 and 'Checksum file is missing' in result.output
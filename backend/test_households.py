@@ -0,0 +1,181 @@
+import pytest
+import io
+import json
+import os
+import sqlite3
+from PIL import Image
+import app as app_module
+from app import app, ConnectionCache, SCHEMA_VERSION
+
+
+@pytest.fixture(autouse=True)
+def shard_dir(temp_dir, monkeypatch):
+    """Enable households, with shards in the test's directory."""
+    path = os.path.join(temp_dir, "households")
+    monkeypatch.setattr(app_module, "SHARD_DIR", path)
+    return path
+
+
+@pytest.fixture
+def households(client):
+    """Create the smith and jones shards through the admin command."""
+    runner = app.test_cli_runner()
+    for household in ('smith', 'jones'):
+        result = runner.invoke(args=['shards', 'create', household])
+        assert result.exit_code == 0, result.output
+
+
+def create_list(client, name, **kwargs):
+    return client.post('/api/lists', data=json.dumps({'name': name}),
+                       content_type='application/json', **kwargs)
+
+
+def list_names(client, url='/api/lists', **kwargs):
+    return {l['name'] for l in json.loads(client.get(url, **kwargs).data)}
+
+
+class TestHouseholdRouting:
+    """Test that requests are routed to their household's database."""
+
+    def test_header_selects_shard(self, client, households):
+        create_list(client, 'Ours', headers={'X-Household': 'smith'})
+        create_list(client, 'Theirs', headers={'X-Household': 'jones'})
+
+        assert 'Ours' in list_names(client, headers={'X-Household': 'smith'})
+        assert 'Theirs' not in list_names(client, headers={'X-Household': 'smith'})
+        assert not {'Ours', 'Theirs'} & list_names(client)
+
+    def test_path_prefix_matches_header(self, client, households):
+        create_list(client, 'Ours', headers={'X-Household': 'smith'})
+        assert 'Ours' in list_names(client, '/h/smith/api/lists')
+
+        response = client.post('/h/smith/api/lists', data=json.dumps({'name': 'Prefixed'}),
+                               content_type='application/json')
+        assert response.status_code == 201
+        assert '/h/smith/api/' in response.headers['Set-Cookie']
+        assert 'Prefixed' in list_names(client, headers={'X-Household': 'smith'})
+
+    def test_etags_differ_between_households(self, client, households):
+        """Test that households at the same revision never revalidate each other's bodies."""
+        create_list(client, 'Ours', headers={'X-Household': 'smith'})
+        create_list(client, 'Theirs', headers={'X-Household': 'jones'})
+
+        smith = client.get('/api/lists', headers={'X-Household': 'smith'})
+        jones = client.get('/api/lists', headers={'X-Household': 'jones', 'If-None-Match': smith.headers['ETag']})
+        assert jones.status_code == 200
+        assert jones.headers['ETag'] != smith.headers['ETag']
+        assert smith.headers['Vary'] == 'X-Household'
+        assert client.get('/h/smith/api/lists', headers={'If-None-Match': smith.headers['ETag']}).status_code == 304
+
+    def test_unknown_household_not_created(self, client):
+        assert client.get('/api/lists', headers={'X-Household': 'smith'}).status_code == 404
+        assert create_list(client, 'Ours', headers={'X-Household': 'smith'}).status_code == 404
+        assert client.get('/h/smith/api/lists').status_code == 404
+        assert not os.path.exists(app_module.SHARD_DIR)
+        assert not any(p.startswith(app_module.SHARD_DIR) for p in app_module._ready_shards)
+
+    def test_outdated_shard_upgraded_on_first_request(self, client, households):
+        path = os.path.join(app_module.SHARD_DIR, 'smith.db')
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA user_version=8")
+        conn.commit()
+        conn.close()
+        app_module._ready_shards.discard(path)
+
+        assert client.get('/api/lists', headers={'X-Household': 'smith'}).status_code == 200
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        conn.close()
+
+    def test_invalid_household(self, client):
+        assert client.get('/api/lists', headers={'X-Household': '../etc'}).status_code == 400
+        assert client.get('/h/Smith/api/lists').status_code == 400
+
+    def test_households_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "SHARD_DIR", None)
+        assert client.get('/api/lists', headers={'X-Household': 'smith'}).status_code == 400
+        assert client.get('/api/lists').status_code == 200
+
+    def test_photos_per_household(self, client, households):
+        """Test that photo URLs and files stay inside the household."""
+        headers = {'X-Household': 'smith'}
+        recipe_id = json.loads(client.post('/api/recipes', data=json.dumps({'name': 'Toast'}),
+            content_type='application/json', headers=headers).data)['id']
+        img = io.BytesIO()
+        Image.new('RGB', (50, 50), color='blue').save(img, format='JPEG')
+        img.seek(0)
+        client.put(f'/api/recipes/{recipe_id}/photo', headers=headers,
+                   data={'photo': (img, 'toast.jpg', 'image/jpeg')}, content_type='multipart/form-data')
+
+        photo = json.loads(client.get(f'/api/recipes/{recipe_id}', headers=headers).data)['photo']
+        assert photo.startswith('/h/smith/api/photos/')
+        assert client.get(photo).status_code == 200
+        assert client.get(photo.replace('/h/smith', '')).status_code == 404
+        photo_dir = os.path.join(os.path.dirname(app_module.DB_PATH), 'photos', 'smith')
+        assert os.listdir(photo_dir) == [photo.rsplit('/', 1)[1]]
+
+
+class TestConnectionCache:
+    """Test the per-thread LRU of read connections."""
+
+    def test_reuses_and_evicts(self, temp_dir):
+        cache = ConnectionCache(max_connections=2)
+        a, b, c = (os.path.join(temp_dir, f"{name}.db") for name in "abc")
+        first = cache.acquire(a)
+        cache.acquire(b)
+        assert cache.acquire(a) is first  # a is now most recently used
+        cache.acquire(c)
+
+        assert (cache.opened, cache.evictions) == (3, 1)
+        assert cache.acquire(a) is first
+        cache.acquire(b)
+        assert cache.opened == 4
+        cache.close_all()
+
+    def test_release_rolls_back(self, temp_dir):
+        cache = ConnectionCache()
+        conn = cache.acquire(os.path.join(temp_dir, "a.db"))
+        conn.execute("CREATE TABLE t (x)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        cache.release(conn)
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        cache.close_all()
+
+
+class TestShardCommands:
+    """Test the cross-household admin commands."""
+
+    def test_create(self, client):
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['shards', 'create', 'smith'])
+        assert result.exit_code == 0, result.output
+        assert f'smith: v{SCHEMA_VERSION}' in result.output
+        assert create_list(client, 'Ours', headers={'X-Household': 'smith'}).status_code == 201
+
+        assert runner.invoke(args=['shards', 'create', 'smith']).exit_code != 0
+        assert runner.invoke(args=['shards', 'create', '../etc']).exit_code != 0
+        assert runner.invoke(args=['backup', 'create', '--household', 'jones']).exit_code != 0
+        assert [household for household, _ in app_module.iter_shards()] == [None, 'smith']
+
+    def test_migrate_list_and_backup(self, client, temp_dir, households):
+        for household in ('smith', 'jones'):
+            create_list(client, household, headers={'X-Household': household})
+        conn = sqlite3.connect(os.path.join(app_module.SHARD_DIR, 'jones.db'))
+        conn.execute("PRAGMA user_version=0")
+        conn.close()
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['shards', 'migrate'])
+        assert result.exit_code == 0, result.output
+        assert f'jones: v{SCHEMA_VERSION}' in result.output
+
+        listing = runner.invoke(args=['shards', 'list']).output.splitlines()
+        assert [line.split('\t')[0] for line in listing] == ['(default)', 'jones', 'smith']
+        assert all(line.endswith(f'v{SCHEMA_VERSION}') for line in listing)
+
+        assert runner.invoke(args=['shards', 'backup']).exit_code == 0
+        backups = os.path.join(temp_dir, 'backups')
+        assert len(app_module.list_backups(os.path.join(app_module.SHARD_DIR, 'smith.db'))) == 1
+        assert len(os.listdir(os.path.join(backups, 'smith'))) == 3  # snapshot, checksum, lock
+        assert len(app_module.list_backups(app_module.DB_PATH)) == 1
@@ -0,0 +1,82 @@
+import pytest
+import json
+import app as app_module
+from app import app
+
+
+def create_list(client, name):
+    return json.loads(client.post('/api/lists',
+        data=json.dumps({'name': name}),
+        content_type='application/json').data)['id']
+
+
+class TestRevisionETags:
+    """Test the revision ETags and headers that drive the nginx micro-cache."""
+
+    def test_read_is_cacheable(self, client):
+        response = client.get('/api/lists')
+        assert response.headers['ETag'].startswith('"lists-')
+        assert response.headers['X-Accel-Expires'] == str(app_module.MICROCACHE_SECONDS)
+        assert response.headers['Cache-Control'] == 'no-cache'
+
+    def test_matching_etag_returns_304(self, client):
+        """Test that revalidation with a current ETag skips the handler."""
+        etag = client.get('/api/recipes').headers['ETag']
+        response = client.get('/api/recipes', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+    def test_item_write_changes_list_etag(self, client):
+        list_id = create_list(client, 'Groceries')
+        etag = client.get(f'/api/lists/{list_id}/items').headers['ETag']
+
+        client.post(f'/api/lists/{list_id}/items',
+            data=json.dumps({'name': 'Milk'}),
+            content_type='application/json')
+
+        response = client.get(f'/api/lists/{list_id}/items', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert [i['name'] for i in json.loads(response.data)] == ['Milk']
+
+    def test_scopes_are_independent(self, client):
+        """Test that list writes leave recipe ETags alone."""
+        etag = client.get('/api/recipes').headers['ETag']
+        create_list(client, 'Groceries')
+        assert client.get('/api/recipes', headers={'If-None-Match': etag}).status_code == 304
+
+    def test_not_found_is_not_cacheable(self, client):
+        response = client.get('/api/recipes/missing')
+        assert response.status_code == 404
+        assert 'X-Accel-Expires' not in response.headers
+
+
+def cookie(response):
+    return response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+
+
+class TestCacheBust:
+    """Test the cookie that moves writers onto fresh nginx cache keys."""
+
+    def test_write_sets_cookie(self, client):
+        response = client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json')
+        assert 'cartly_v=' in response.headers['Set-Cookie']
+
+    def test_cookie_is_revision_after_write(self, client):
+        """Test that the cookie names the revisions a write left, so it is shared, not per writer."""
+        first = client.post('/api/lists', data=json.dumps({'name': 'Groceries'}), content_type='application/json')
+        other = app.test_client()
+        list_id = json.loads(first.data)['id']
+        again = other.put(f'/api/lists/{list_id}', data=json.dumps({'name': 'Weekly'}), content_type='application/json')
+        recipe = other.post('/api/recipes', data=json.dumps({'name': 'Toast'}), content_type='application/json')
+
+        assert cookie(first) == '1.0'  # lists.recipes
+        assert cookie(again) == '2.0'
+        assert cookie(recipe) == '2.1'
+
+    def test_read_and_failed_write_do_not(self, client):
+        assert 'Set-Cookie' not in client.get('/api/lists').headers
+        response = client.post('/api/lists/missing/items/missing/toggle')
+        assert response.status_code == 404
+        assert 'Set-Cookie' not in response.headers
@@ -0,0 +1,281 @@
+import pytest
+import json
+import sqlite3
+import app as app_module
+from app import app, init_db
+
+
+def create_list(client, name):
+    return json.loads(client.post('/api/lists',
+        data=json.dumps({'name': name}),
+        content_type='application/json').data)['id']
+
+
+def create_item(client, list_id, name):
+    return json.loads(client.post(f'/api/lists/{list_id}/items',
+        data=json.dumps({'name': name}),
+        content_type='application/json').data)['id']
+
+
+def get_stats(client, list_id):
+    return json.loads(client.get(f'/api/lists/{list_id}/stats').data)
+
+
+class TestListStats:
+    """Test trigger-maintained list counters."""
+
+    def test_counts_follow_insert_toggle_delete(self, client):
+        """Test that counters track item inserts, toggles and deletes."""
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        create_item(client, list_id, 'Eggs')
+        assert get_stats(client, list_id) == {'total': 2, 'done': 0}
+
+        client.post(f'/api/lists/{list_id}/items/{milk}/toggle')
+        assert get_stats(client, list_id) == {'total': 2, 'done': 1}
+
+        client.delete(f'/api/lists/{list_id}/items/{milk}')
+        assert get_stats(client, list_id) == {'total': 1, 'done': 0}
+
+    def test_clear_done_updates_counts(self, client):
+        """Test that clearing completed items decrements both counters."""
+        list_id = create_list(client, 'Groceries')
+        for name in ('Milk', 'Eggs', 'Bread'):
+            item_id = create_item(client, list_id, name)
+            client.post(f'/api/lists/{list_id}/items/{item_id}/toggle')
+        create_item(client, list_id, 'Butter')
+
+        client.delete(f'/api/lists/{list_id}/items/clear-done')
+        assert get_stats(client, list_id) == {'total': 1, 'done': 0}
+
+    def test_unknown_list_stats(self, client):
+        """Test that stats for a missing list are zero."""
+        assert get_stats(client, 'nonexistent-id') == {'total': 0, 'done': 0}
+
+    def test_lists_with_stats(self, client):
+        """Test that ?with_stats=1 returns progress for every list."""
+        list1 = create_list(client, 'List 1')
+        list2 = create_list(client, 'List 2')
+        item_id = create_item(client, list1, 'Milk')
+        create_item(client, list1, 'Eggs')
+        client.post(f'/api/lists/{list1}/items/{item_id}/toggle')
+
+        lists = json.loads(client.get('/api/lists?with_stats=1').data)
+        by_id = {l['id']: l for l in lists}
+        assert (by_id[list1]['total'], by_id[list1]['done']) == (2, 1)
+        assert (by_id[list2]['total'], by_id[list2]['done']) == (0, 0)
+
+        # Plain listing is unchanged
+        plain = json.loads(client.get('/api/lists').data)
+        assert 'total' not in plain[0]
+
+    def test_backfill_existing_lists(self, client):
+        """Test that init_db backfills counters for pre-existing data."""
+        list_id = create_list(client, 'Groceries')
+        create_item(client, list_id, 'Milk')
+
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("DELETE FROM list_stats")
+        conn.execute("PRAGMA user_version=0")  # as if created before schema versioning
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert get_stats(client, list_id) == {'total': 1, 'done': 0}
+
+
+class TestItemBatch:
+    """Test the batched item mutations used by the optimistic UI."""
+
+    def test_batch_applies_final_states(self, client):
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        eggs = create_item(client, list_id, 'Eggs')
+        bread = create_item(client, list_id, 'Bread')
+
+        response = client.post(f'/api/lists/{list_id}/items/batch',
+            data=json.dumps({'ops': [
+                {'op': 'set_done', 'id': milk, 'done': 1},
+                {'op': 'set_done', 'id': eggs, 'done': 0},
+                {'op': 'delete', 'id': bread},
+                {'op': 'delete', 'id': 'missing'},
+            ]}),
+            content_type='application/json')
+
+        assert response.status_code == 200
+        assert [r['found'] for r in json.loads(response.data)['results']] == [True, True, True, False]
+        assert get_stats(client, list_id) == {'total': 2, 'done': 1}
+
+    def test_batch_is_idempotent(self, client):
+        """Test that replaying a batch leaves the same state."""
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        body = json.dumps({'ops': [{'op': 'set_done', 'id': milk, 'done': 1}]})
+        for _ in range(2):
+            client.post(f'/api/lists/{list_id}/items/batch', data=body, content_type='application/json')
+        assert get_stats(client, list_id) == {'total': 1, 'done': 1}
+
+    def test_batch_scoped_to_list(self, client):
+        list1 = create_list(client, 'List 1')
+        list2 = create_list(client, 'List 2')
+        milk = create_item(client, list1, 'Milk')
+
+        response = client.post(f'/api/lists/{list2}/items/batch',
+            data=json.dumps({'ops': [{'op': 'delete', 'id': milk}]}),
+            content_type='application/json')
+        assert json.loads(response.data)['results'][0]['found'] is False
+        assert get_stats(client, list1) == {'total': 1, 'done': 0}
+
+    def test_invalid_op_rejected(self, client):
+        list_id = create_list(client, 'Groceries')
+        response = client.post(f'/api/lists/{list_id}/items/batch',
+            data=json.dumps({'ops': [{'op': 'rename', 'id': 'x'}]}),
+            content_type='application/json')
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("item_id", [[1], {"a": 1}, 5, ""])
+    def test_non_string_id_rejected(self, client, item_id):
+        list_id = create_list(client, 'Groceries')
+        response = client.post(f'/api/lists/{list_id}/items/batch',
+            data=json.dumps({'ops': [{'op': 'delete', 'id': item_id}]}),
+            content_type='application/json')
+        assert response.status_code == 400
+
+    def test_non_object_body_rejected(self, client):
+        list_id = create_list(client, 'Groceries')
+        response = client.post(f'/api/lists/{list_id}/items/batch',
+            data=json.dumps([{'op': 'delete', 'id': 'x'}]),
+            content_type='application/json')
+        assert response.status_code == 400
+
+
+def create_category(client, list_id, name):
+    return json.loads(client.post(f'/api/lists/{list_id}/categories',
+        data=json.dumps({'name': name}),
+        content_type='application/json').data)['id']
+
+
+def bulk(client, list_id, action, body):
+    return client.post(f'/api/lists/{list_id}/items/bulk-{action}',
+        data=json.dumps(body), content_type='application/json')
+
+
+class TestBulkItems:
+    """Test set-based bulk toggle, delete and move."""
+
+    def test_bulk_toggle(self, client):
+        list_id = create_list(client, 'Groceries')
+        ids = [create_item(client, list_id, f'Item {i}') for i in range(5)]
+
+        data = json.loads(bulk(client, list_id, 'toggle', {'ids': ids[:3]}).data)
+        assert data['updated'] == 3
+        assert all(item['done'] == 1 for item in data['items'])
+        assert get_stats(client, list_id) == {'total': 5, 'done': 3}
+
+        # Explicit done sets rather than flips
+        bulk(client, list_id, 'toggle', {'ids': ids, 'done': 1})
+        assert get_stats(client, list_id) == {'total': 5, 'done': 5}
+
+    def test_bulk_delete_returns_deleted_ids(self, client):
+        list_id = create_list(client, 'Groceries')
+        other = create_list(client, 'Other')
+        ids = [create_item(client, list_id, f'Item {i}') for i in range(3)]
+        foreign = create_item(client, other, 'Foreign')
+
+        data = json.loads(bulk(client, list_id, 'delete', {'ids': [ids[0], ids[1], foreign, 'missing']}).data)
+        assert data['deleted'] == 2
+        assert sorted(data['ids']) == sorted(ids[:2])
+        assert get_stats(client, list_id) == {'total': 1, 'done': 0}
+        assert get_stats(client, other) == {'total': 1, 'done': 0}
+
+    def test_bulk_move_appends_in_order(self, client):
+        list_id = create_list(client, 'Groceries')
+        dairy = create_category(client, list_id, 'Dairy')
+        client.post(f'/api/lists/{list_id}/items',
+            data=json.dumps({'name': 'Butter', 'category': dairy}),
+            content_type='application/json')
+        milk = create_item(client, list_id, 'Milk')
+        cheese = create_item(client, list_id, 'Cheese')
+
+        data = json.loads(bulk(client, list_id, 'move', {'ids': [cheese, milk], 'category': dairy}).data)
+        assert data['updated'] == 2
+
+        items = json.loads(client.get(f'/api/lists/{list_id}/items').data)
+        assert [i['name'] for i in items if i['category'] == dairy] == ['Butter', 'Cheese', 'Milk']
+
+    def test_bulk_move_unknown_category(self, client):
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        assert bulk(client, list_id, 'move', {'ids': [milk], 'category': 'nope'}).status_code == 404
+
+    def test_bulk_requires_ids(self, client):
+        list_id = create_list(client, 'Groceries')
+        assert bulk(client, list_id, 'delete', {'ids': 'abc'}).status_code == 400
+        for action in ('toggle', 'delete', 'move'):
+            assert bulk(client, list_id, action, ['abc']).status_code == 400
+
+    @pytest.mark.parametrize("done", ["false", "1", 2, 1.0, [1], {}])
+    def test_bulk_toggle_rejects_invalid_done(self, client, done):
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        assert bulk(client, list_id, 'toggle', {'ids': [milk], 'done': done}).status_code == 400
+        assert get_stats(client, list_id) == {'total': 1, 'done': 0}
+
+    def test_bulk_toggle_accepts_bool_and_int(self, client):
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        for done, expected in ((True, 1), (0, 0), (1, 1), (False, 0)):
+            bulk(client, list_id, 'toggle', {'ids': [milk], 'done': done})
+            assert get_stats(client, list_id)['done'] == expected
+
+    @pytest.mark.parametrize("category", [[1], 5, {"id": "x"}, True])
+    def test_bulk_move_rejects_invalid_category(self, client, category):
+        list_id = create_list(client, 'Groceries')
+        milk = create_item(client, list_id, 'Milk')
+        assert bulk(client, list_id, 'move', {'ids': [milk], 'category': category}).status_code == 400
+
+
+class TestSuggestions:
+    """Test purchase history archiving and "buy again" suggestions."""
+
+    def shop(self, client, list_id, names):
+        """Add, check off and clear the given items, as after one grocery run."""
+        for name in names:
+            item_id = create_item(client, list_id, name)
+            client.post(f'/api/lists/{list_id}/items/{item_id}/toggle')
+        client.delete(f'/api/lists/{list_id}/items/clear-done')
+
+    def suggestions(self, client, list_id, **params):
+        return json.loads(client.get(f'/api/lists/{list_id}/suggestions', query_string=params).data)
+
+    def test_ranked_by_frequency(self, client):
+        list_id = create_list(client, 'Groceries')
+        self.shop(client, list_id, ['Milk', 'Eggs'])
+        self.shop(client, list_id, ['milk ', 'Bread'])
+        self.shop(client, list_id, ['Milk', 'Eggs'])
+
+        suggestions = self.suggestions(client, list_id)
+        assert [(s['name'], s['times']) for s in suggestions][0] == ('Milk', 3)
+        assert [s['name'] for s in suggestions] == ['Milk', 'Eggs', 'Bread']
+
+    def test_excludes_items_on_list(self, client):
+        list_id = create_list(client, 'Groceries')
+        self.shop(client, list_id, ['Milk', 'Eggs'])
+        create_item(client, list_id, 'milk')
+
+        assert [s['name'] for s in self.suggestions(client, list_id)] == ['Eggs']
+
+    def test_only_done_items_archived(self, client):
+        list_id = create_list(client, 'Groceries')
+        create_item(client, list_id, 'Butter')
+        self.shop(client, list_id, ['Milk'])
+
+        assert [s['name'] for s in self.suggestions(client, list_id)] == ['Milk']
+
+    def test_limit_and_per_list(self, client):
+        list_id = create_list(client, 'Groceries')
+        other = create_list(client, 'Hardware')
+        self.shop(client, list_id, ['Milk', 'Eggs', 'Bread'])
+
+        assert len(self.suggestions(client, list_id, limit=2)) == 2
+        assert self.suggestions(client, other) == []
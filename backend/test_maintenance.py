@@ -0,0 +1,141 @@
+import pytest
+import fcntl
+import json
+import sqlite3
+import app as app_module
+from app import app, get_db, Maintenance, vacuum_database
+
+
+@pytest.fixture(autouse=True)
+def fresh_maintenance(monkeypatch):
+    """Fresh maintenance counters and no background thread."""
+    monkeypatch.setattr(app_module, "maintenance", Maintenance())
+    monkeypatch.setattr(app_module, "MAINTENANCE_INTERVAL", 0)
+
+
+def fill_list(client, count=300):
+    list_id = json.loads(client.post('/api/lists', data=json.dumps({'name': 'Bulk'}),
+        content_type='application/json').data)['id']
+    for i in range(count):
+        item_id = json.loads(client.post(f'/api/lists/{list_id}/items',
+            data=json.dumps({'name': f'Item {i} ' + 'x' * 500}), content_type='application/json').data)['id']
+        client.post(f'/api/lists/{list_id}/items/{item_id}/toggle')
+    return list_id
+
+
+class TestPragmaProfile:
+    """Test the per-connection pragma profile."""
+
+    def test_connections_use_profile(self, client):
+        with app.test_request_context():
+            db = get_db()
+            assert db.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert db.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+            assert db.execute("PRAGMA cache_size").fetchone()[0] == app_module.SQLITE_PRAGMAS["cache_size"]
+            assert db.execute("PRAGMA wal_autocheckpoint").fetchone()[0] == 10000
+
+    def test_new_databases_use_incremental_vacuum(self, client):
+        conn = sqlite3.connect(app_module.DB_PATH)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        conn.close()
+
+
+class TestMaintenance:
+    """Test checkpoint, optimize and incremental vacuum passes."""
+
+    def test_writes_mark_database_dirty(self, client):
+        fill_list(client, 1)
+        assert app_module.DB_PATH in app_module.maintenance._dirty
+
+    def test_forced_pass_reclaims_space(self, client):
+        list_id = fill_list(client)
+        client.delete(f'/api/lists/{list_id}/items/clear-done')
+
+        report = app_module.maintenance.run(app_module.DB_PATH, force=True)
+        assert report['wal_bytes_before'] > 0 and report['wal_bytes_after'] == 0
+        assert report['free_pages_before'] > 0 and report['free_pages_after'] < report['free_pages_before']
+        assert report['db_bytes_after'] < report['db_bytes_before'] + report['wal_bytes_before']
+        conn = sqlite3.connect(app_module.DB_PATH)
+        assert conn.execute("PRAGMA page_count").fetchone()[0] * 4096 == report['db_bytes_after']
+        conn.close()
+        assert {'optimize_ms', 'vacuum_ms', 'checkpoint_ms', 'probe_ms_before', 'probe_ms_after'} <= report.keys()
+        assert app_module.maintenance.checkpoints == 1
+
+    def test_optimize_creates_statistics(self, client):
+        fill_list(client, 20)
+        app_module.maintenance.run(app_module.DB_PATH, force=True)
+
+        conn = sqlite3.connect(app_module.DB_PATH)
+        analyzed = {tbl for (tbl,) in conn.execute("SELECT tbl FROM sqlite_stat1")}
+        stale = Maintenance._stats_stale(conn)
+        conn.close()
+        assert {'items', 'lists'} <= analyzed
+        assert not stale
+
+    def test_optimize_reanalyzes_after_growth(self, client):
+        maintenance = app_module.maintenance
+        fill_list(client, 1)
+        maintenance.run(app_module.DB_PATH, force=True)
+        fill_list(client, 30)
+        conn = sqlite3.connect(app_module.DB_PATH)
+        assert Maintenance._stats_stale(conn)
+        conn.close()
+        report = maintenance.run(app_module.DB_PATH, force=True)
+        if sqlite3.sqlite_version_info < (3, 46):
+            assert report['optimize'] == 'ANALYZE'
+
+    def test_thresholds(self, client, monkeypatch):
+        """Test that an unforced pass leaves a small WAL alone and optimizes on schedule."""
+        monkeypatch.setattr(app_module, "WAL_CHECKPOINT_BYTES", 1 << 40)
+        fill_list(client, 5)
+        maintenance = app_module.maintenance
+
+        first = maintenance.run(app_module.DB_PATH)
+        assert 'checkpoint_ms' not in first and first['wal_bytes_after'] > 0
+        assert 'optimize_ms' in first
+        assert 'optimize_ms' not in maintenance.run(app_module.DB_PATH)
+
+        monkeypatch.setattr(app_module, "WAL_CHECKPOINT_BYTES", 1)
+        assert 'checkpoint_ms' in maintenance.run(app_module.DB_PATH)
+
+    def test_skips_when_another_process_is_busy(self, client):
+        with open(f"{app_module.DB_PATH}.maint-lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert app_module.maintenance.run(app_module.DB_PATH, force=True) is None
+
+    def test_metrics(self, client):
+        app_module.maintenance.run(app_module.DB_PATH, force=True)
+        body = client.get('/api/metrics').data.decode()
+        assert 'cartly_maintenance_runs_total 1' in body
+        assert 'cartly_wal_checkpoints_total 1' in body
+
+
+class TestMaintenanceAdmin:
+    """Test the admin endpoint and CLI."""
+
+    def test_endpoint(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+        response = client.post('/api/admin/maintenance', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+        assert json.loads(response.data)['path'] == app_module.DB_PATH
+
+    def test_cli_run(self, client):
+        result = app.test_cli_runner().invoke(args=['maintenance', 'run'])
+        assert result.exit_code == 0, result.output
+        assert 'checkpoint_ms' in json.loads(result.output)
+
+    def test_vacuum_converts_old_database(self, client, tmp_path):
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE t (x)")
+        conn.executemany("INSERT INTO t VALUES (?)", [('x' * 1000,)] * 200)
+        conn.execute("DELETE FROM t")
+        conn.commit()
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        conn.close()
+
+        before, after = vacuum_database(path)
+        assert after < before
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        conn.close()
@@ -0,0 +1,53 @@
+import pytest
+import json
+import os
+
+
+class TestMetrics:
+    """Test the /api/metrics endpoint."""
+
+    def test_request_counts_by_endpoint_and_status(self, client):
+        """Test that requests are counted per endpoint, method and status."""
+        client.get('/api/lists')
+        client.get('/api/lists')
+        client.get('/api/recipes/missing')
+
+        body = client.get('/api/metrics').data.decode()
+        assert 'cartly_requests_total{endpoint="get_lists",method="GET",status="200"} 2' in body
+        assert 'cartly_requests_total{endpoint="get_recipe",method="GET",status="404"} 1' in body
+
+    def test_latency_histogram(self, client):
+        """Test that latency is exposed as a cumulative histogram."""
+        client.get('/api/lists')
+
+        body = client.get('/api/metrics').data.decode()
+        assert '# TYPE cartly_request_duration_seconds histogram' in body
+        assert 'cartly_request_duration_seconds_bucket{endpoint="get_lists",method="GET",le="+Inf"} 1' in body
+        assert 'cartly_request_duration_seconds_count{endpoint="get_lists",method="GET"} 1' in body
+
+    def test_sql_query_count(self, client):
+        """Test that SQL statements are counted per endpoint."""
+        list_id = json.loads(client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json').data)['id']
+        client.get(f'/api/lists/{list_id}/items')
+
+        body = client.get('/api/metrics').data.decode()
+        line = next(l for l in body.splitlines()
+                    if l.startswith('cartly_sql_queries_total{endpoint="get_items"'))
+        assert int(line.rsplit(' ', 1)[1]) >= 1
+
+    def test_aggregates_across_workers(self, client, metrics_dir):
+        """Test that counters written by another worker are merged in."""
+        other = {
+            "requests": {"get_lists GET 200": 5},
+            "latency": {}, "size": {}, "queries": {},
+        }
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(os.path.join(metrics_dir, "999999.json"), "w") as f:
+            json.dump(other, f)
+
+        client.get('/api/lists')
+
+        body = client.get('/api/metrics').data.decode()
+        assert 'cartly_requests_total{endpoint="get_lists",method="GET",status="200"} 6' in body
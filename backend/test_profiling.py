@@ -0,0 +1,106 @@
+import pytest
+import json
+import os
+import pstats
+import tracemalloc
+import app as app_module
+from app import app
+
+ADMIN = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture(autouse=True)
+def profiling(temp_dir, monkeypatch):
+    """Turn profiling on, with an admin token and profiles in the test's directory."""
+    monkeypatch.setattr(app_module, "PROFILE_DIR", os.path.join(temp_dir, "profiles"))
+    monkeypatch.setattr(app_module, "PROFILING", True)
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+
+
+def create_recipe(client, name):
+    return json.loads(client.post('/api/recipes',
+        data=json.dumps({'name': name}),
+        content_type='application/json').data)['id']
+
+
+def profile_export(client, headers=None):
+    return client.get('/api/recipes/export', headers={'X-Profile': '1', **(headers or ADMIN)})
+
+
+class TestRequestProfile:
+    """Test per-request cProfile."""
+
+    def test_profiles_one_request(self, client):
+        create_recipe(client, 'Pancakes')
+        response = profile_export(client)
+
+        assert response.status_code == 200
+        assert [r['name'] for r in json.loads(response.data)] == ['Pancakes']
+        name = response.headers['X-Profile-Name']
+        assert name.endswith('.prof') and '-export_all_recipes-' in name
+
+        listed = json.loads(client.get('/api/admin/profiles', headers=ADMIN).data)
+        assert [p['name'] for p in listed] == [name]
+
+        raw = client.get(f'/api/admin/profiles/{name}', headers=ADMIN)
+        path = os.path.join(app_module.PROFILE_DIR, 'downloaded.prof')
+        with open(path, 'wb') as f:
+            f.write(raw.data)
+        functions = {func for (_, _, func) in pstats.Stats(path).stats}
+        assert 'export_all_recipes' in functions
+
+        text = client.get(f'/api/admin/profiles/{name}?format=text&sort=tottime&limit=5', headers=ADMIN)
+        assert 'function calls' in text.data.decode()
+
+    def test_requires_admin(self, client):
+        response = profile_export(client, headers={'Authorization': 'Bearer wrong'})
+        assert response.status_code == 200
+        assert 'X-Profile-Name' not in response.headers
+        assert not os.path.exists(app_module.PROFILE_DIR)
+
+    def test_off_without_config(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "PROFILING", False)
+        assert 'X-Profile-Name' not in profile_export(client).headers
+        assert client.get('/api/admin/profiles', headers=ADMIN).status_code == 404
+        assert client.post('/api/admin/tracemalloc/snapshot', headers=ADMIN).status_code == 404
+
+    def test_one_profile_at_a_time(self, client):
+        with app_module._profile_lock:
+            response = profile_export(client)
+        assert response.status_code == 200
+        assert response.headers['X-Profile-Name'] == 'busy'
+
+    def test_keeps_newest(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, "PROFILE_KEEP", 2)
+        names = [profile_export(client).headers['X-Profile-Name'] for _ in range(3)]
+        listed = [p['name'] for p in json.loads(client.get('/api/admin/profiles', headers=ADMIN).data)]
+        assert listed == names[:0:-1]
+
+    def test_unknown_profile(self, client):
+        assert client.get('/api/admin/profiles/../test.db', headers=ADMIN).status_code == 404
+        assert client.get('/api/admin/profiles/20260101T000000000000Z-x-y.prof', headers=ADMIN).status_code == 404
+
+
+class TestTracemalloc:
+    """Test tracemalloc snapshot diffs of the worker."""
+
+    def test_snapshot_diff(self, client):
+        try:
+            first = json.loads(client.post('/api/admin/tracemalloc/snapshot', headers=ADMIN).data)
+            assert first['baseline'] is True
+            assert first['pid'] == os.getpid()
+
+            retained = [bytearray(1024) for _ in range(1000)]
+            diff = json.loads(client.post('/api/admin/tracemalloc/snapshot?limit=50', headers=ADMIN).data)
+            grown = [s for s in diff['top'] if any('test_profiling.py' in w for w in s['where'])]
+            assert grown and grown[0]['size_diff'] >= 1000 * 1024
+            assert len(retained) == 1000
+        finally:
+            stopped = json.loads(client.delete('/api/admin/tracemalloc', headers=ADMIN).data)
+        assert stopped['stopped'] is True
+        assert not tracemalloc.is_tracing()
+
+    def test_invalid_key(self, client):
+        response = client.post('/api/admin/tracemalloc/snapshot?key=bogus', headers=ADMIN)
+        assert response.status_code == 400
+        assert not tracemalloc.is_tracing()
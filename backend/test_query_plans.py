@@ -0,0 +1,195 @@
+import pytest
+import io
+import json
+import logging
+import re
+from PIL import Image
+import app as app_module
+from app import app, init_db, get_db, explain_query_plan, open_connection, TracedConnection
+
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)")
+
+
+def assert_no_full_scan(db, sql, params=(), allow=()):
+    """Fail if the query plan for `sql` walks a whole table instead of searching an index."""
+    plan = explain_query_plan(db, sql, params)
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) not in allow:
+            pytest.fail(f"full table scan in plan for {sql!r}: {plan}")
+
+
+@pytest.fixture
+def db(db_path):
+    """Open a traced connection on a freshly initialised database."""
+    init_db()
+    with app.test_request_context():
+        yield get_db()
+
+
+# Scans the routes make on purpose: listings of every list or recipe, the
+# "unset every default" update, and photo release, which walks only the
+# partial idx_photos_unreferenced index
+ALLOWED_SCANS = [
+    (re.compile(r"(SELECT id|DELETE) FROM photos WHERE refcount <= 0$"), ("photos",)),
+    (re.compile(r"SELECT .* FROM lists( l LEFT JOIN list_stats s .*)? ORDER BY (l\.)?created DESC$"), ("lists", "l")),
+    (re.compile(r"UPDATE lists SET is_default = 0$"), ("lists",)),
+    (re.compile(r"SELECT \* FROM recipes ORDER BY created DESC$"), ("recipes",)),
+]
+NOT_PLANNED = re.compile(r"(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)\b")
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    """Every statement the app's connections run, as SQLite expanded it."""
+    seen = []
+    trace = TracedConnection._trace
+
+    def record(self, statement):
+        trace(self, statement)
+        if not self._explaining:
+            seen.append(statement)
+
+    monkeypatch.setattr(TracedConnection, "_trace", record)
+    return seen
+
+
+def send(client, method, url, body=None):
+    response = client.open(url, method=method, data=json.dumps(body or {}), content_type='application/json')
+    assert response.status_code < 400, (method, url, response.data)
+    return json.loads(response.data) if response.data else None
+
+
+def exercise_routes(client):
+    """Drive the list, item, recipe and photo routes once each, reads and writes."""
+    list_id = send(client, 'POST', '/api/lists', {'name': 'Groceries'})['id']
+    send(client, 'POST', f'/api/lists/{list_id}/set-default')
+    send(client, 'PUT', f'/api/lists/{list_id}', {'name': 'Weekly'})
+    cat = send(client, 'POST', f'/api/lists/{list_id}/categories', {'name': 'Dairy'})['id']
+    send(client, 'PUT', f'/api/lists/{list_id}/categories/{cat}', {'name': 'Fridge'})
+    items = [send(client, 'POST', f'/api/lists/{list_id}/items', {'name': name, 'category': cat if i % 2 else None})['id']
+             for i, name in enumerate(['Milk', 'Eggs', 'Flour', 'Butter'])]
+    send(client, 'POST', f'/api/lists/{list_id}/items/{items[0]}/toggle')
+    send(client, 'PUT', f'/api/lists/{list_id}/items/{items[1]}', {'name': 'Eggs', 'quantity': '6', 'category': None})
+    send(client, 'POST', f'/api/lists/{list_id}/items/bulk-toggle', {'ids': items[1:3], 'done': True})
+    send(client, 'POST', f'/api/lists/{list_id}/items/bulk-move', {'ids': items[2:], 'category': cat})
+    send(client, 'POST', f'/api/lists/{list_id}/items/batch',
+         {'ops': [{'op': 'set_done', 'id': items[3], 'done': 1}, {'op': 'delete', 'id': items[1]}]})
+    send(client, 'POST', f'/api/lists/{list_id}/items/bulk-delete', {'ids': [items[3]]})
+    send(client, 'DELETE', f'/api/lists/{list_id}/items/clear-done')
+    for url in ('/api/lists', '/api/lists?with_stats=1', '/api/lists/default', f'/api/lists/{list_id}/categories',
+                f'/api/lists/{list_id}/items', f'/api/lists/{list_id}/suggestions', f'/api/lists/{list_id}/stats',
+                '/api/autocomplete?kind=item&prefix=mi'):
+        send(client, 'GET', url)
+
+    recipe_id = send(client, 'POST', '/api/recipes', {'name': 'Pancakes', 'prep_time': '10 min'})['id']
+    send(client, 'PUT', f'/api/recipes/{recipe_id}', {'servings': 2, 'cook_time': '15 min'})
+    ingredients = [send(client, 'POST', f'/api/recipes/{recipe_id}/ingredients', {'name': name})['id']
+                   for name in ('Flour', 'Milk', 'Sugar')]
+    send(client, 'PUT', f'/api/recipes/{recipe_id}/ingredients/{ingredients[2]}', {'name': 'Honey'})
+    send(client, 'PUT', f'/api/recipes/{recipe_id}/ingredients/reorder', {'ingredient_ids': ingredients[::-1]})
+    steps = [send(client, 'POST', f'/api/recipes/{recipe_id}/steps', {'instruction': text})['id']
+             for text in ('Mix', 'Rest', 'Fry')]
+    send(client, 'PUT', f'/api/recipes/{recipe_id}/steps/{steps[1]}', {'instruction': 'Rest 10 min'})
+    send(client, 'PUT', f'/api/recipes/{recipe_id}/steps/reorder', {'step_ids': steps[::-1]})
+    send(client, 'DELETE', f'/api/recipes/{recipe_id}/steps/{steps[0]}')
+    send(client, 'DELETE', f'/api/recipes/{recipe_id}/ingredients/{ingredients[0]}')
+    img = io.BytesIO()
+    Image.new('RGB', (20, 20), color='red').save(img, format='JPEG')
+    img.seek(0)
+    assert client.put(f'/api/recipes/{recipe_id}/photo', data={'photo': (img, 'p.jpg', 'image/jpeg')},
+                      content_type='multipart/form-data').status_code == 200
+    copy_id = send(client, 'POST', f'/api/recipes/{recipe_id}/duplicate')['id']
+    send(client, 'POST', f'/api/recipes/{recipe_id}/add-to-shopping-list')
+    for url in ('/api/recipes', '/api/recipes?max_time=30&sort=time', f'/api/recipes/{recipe_id}',
+                f'/api/recipes/{recipe_id}/ingredients', f'/api/recipes/{recipe_id}/steps',
+                f'/api/recipes/match?ingredients=milk,honey&list_id={list_id}'):
+        send(client, 'GET', url)
+    send(client, 'DELETE', f'/api/recipes/{recipe_id}/photo')
+    send(client, 'DELETE', f'/api/recipes/{copy_id}')
+    send(client, 'DELETE', f'/api/recipes/{recipe_id}')
+    send(client, 'DELETE', f'/api/lists/{list_id}/categories/{cat}')
+    send(client, 'DELETE', f'/api/lists/{list_id}')
+
+
+class TestQueryPlans:
+    """The statements the routes actually run must be served by an index."""
+
+    def test_route_statements_use_indexes(self, client, db_path, statements):
+        exercise_routes(client)
+        planned = {s for s in statements if not NOT_PLANNED.match(s.strip())}
+        assert any(s.startswith("DELETE FROM recipes WHERE id=") for s in planned)
+        assert any(s.startswith("DELETE FROM photos") for s in planned)
+        assert any("FROM purchase_stats" in s for s in planned)
+
+        conn = open_connection(db_path)
+        try:
+            for sql in sorted(planned):
+                flat = " ".join(sql.split())
+                allow = next((tables for pattern, tables in ALLOWED_SCANS if pattern.match(flat)), ())
+                assert_no_full_scan(conn, sql, allow=("json_each", "j", "q") + allow)
+        finally:
+            conn.close()
+
+    @pytest.mark.parametrize("sql,params", [
+        (app_module.BULK_UPDATE_DONE_SQL.format("?"), (1, "l", '["i"]')),
+        (app_module.BULK_DELETE_SQL, ("l", '["i"]')),
+        (app_module.BULK_MOVE_SQL, (None, 0, '["i"]', "l")),
+    ])
+    def test_bulk_statements_look_up_by_id(self, db, sql, params):
+        """Bulk statements walk the id array (json_each), never the list's items."""
+        assert_no_full_scan(db, sql, params, allow=("json_each", "j"))
+        assert any("items USING INDEX sqlite_autoindex_items_1 (id=?)" in d
+                   for d in explain_query_plan(db, sql, params))
+
+    def test_recipe_match_reads_only_query_postings(self, db):
+        """Coverage ranking walks the query terms, then looks postings up by term."""
+        plan = explain_query_plan(db, app_module.RECIPE_MATCH_SQL, ('["eggs"]', 10))
+        assert_no_full_scan(db, app_module.RECIPE_MATCH_SQL, ('["eggs"]', 10), allow=("json_each", "q"))
+        assert any(d.startswith("SEARCH t USING PRIMARY KEY (term=?)") for d in plan), plan
+
+    def test_recipe_delete_finds_children_by_index(self, db):
+        """The ON DELETE CASCADE lookups of a recipe delete search their child tables."""
+        assert_no_full_scan(db, "DELETE FROM recipes WHERE id=?", ("r",))
+        assert "SEARCH recipe_terms USING COVERING INDEX idx_recipe_terms_recipe (recipe_id=?)" in \
+            explain_query_plan(db, "DELETE FROM recipes WHERE id=?", ("r",))
+
+    def test_photo_release_checks_references_by_index(self, db):
+        """Deleting unreferenced photos checks the recipes.photo_id foreign key by index."""
+        sql = "DELETE FROM photos WHERE refcount <= 0"
+        assert_no_full_scan(db, sql, allow=("photos",))  # walks only the partial idx_photos_unreferenced
+        assert "SEARCH recipes USING COVERING INDEX idx_recipes_photo (photo_id=?)" in explain_query_plan(db, sql)
+
+    def test_upgrade_adds_foreign_key_indexes(self, db):
+        db.execute("DROP INDEX idx_recipe_terms_recipe")
+        db.execute("DROP INDEX idx_recipes_photo")
+        db.execute("PRAGMA user_version=8")
+        db.commit()
+        init_db()
+        names = {r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_recipe_terms_recipe", "idx_recipes_photo"} <= names
+
+    def test_helper_detects_full_scan(self, db):
+        """Test that the helper itself flags an unindexed predicate."""
+        with pytest.raises(pytest.fail.Exception):
+            assert_no_full_scan(db, "SELECT * FROM items WHERE name=?", ("milk",))
+
+
+class TestSqlTracing:
+    """Test statement counting and the slow-query log."""
+
+    def test_counts_statements(self, db):
+        before = db.query_count
+        db.execute("SELECT 1")
+        db.execute("SELECT 2")
+        assert db.query_count == before + 2
+
+    def test_slow_query_logged_with_plan(self, db, monkeypatch, caplog):
+        monkeypatch.setattr(app_module, "SLOW_QUERY_MS", 0)
+        before = db.query_count
+        with caplog.at_level(logging.WARNING, logger="cartly.sql"):
+            db.execute("SELECT * FROM items WHERE list_id=?", ("l",))
+        assert "slow query" in caplog.text
+        assert "idx_items_list" in caplog.text
+        # EXPLAIN for the log line is not counted as a request query
+        assert db.query_count == before + 1
@@ -0,0 +1,79 @@
+import pytest
+import json
+import sqlite3
+import uuid
+import app as app_module
+from app import app, RecipeCache
+
+
+@pytest.fixture
+def recipe_id(client):
+    return json.loads(client.post('/api/recipes',
+        data=json.dumps({'name': 'Pancakes'}),
+        content_type='application/json').data)['id']
+
+
+class TestRecipeCache:
+    """Test the revision-tagged recipe read cache."""
+
+    def test_repeat_reads_hit_cache(self, client, recipe_id):
+        """Test that the second read of a recipe is served from memory."""
+        first = client.get(f'/api/recipes/{recipe_id}')
+        second = client.get(f'/api/recipes/{recipe_id}')
+
+        assert first.data == second.data
+        assert json.loads(second.data)['name'] == 'Pancakes'
+        assert app_module.recipe_cache.hits == 1
+        assert app_module.recipe_cache.misses == 1
+
+    def test_write_invalidates(self, client, recipe_id):
+        """Test that adding an ingredient refreshes cached reads."""
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}/ingredients').data) == []
+
+        client.post(f'/api/recipes/{recipe_id}/ingredients',
+            data=json.dumps({'name': 'Flour'}),
+            content_type='application/json')
+
+        ingredients = json.loads(client.get(f'/api/recipes/{recipe_id}/ingredients').data)
+        assert [i['name'] for i in ingredients] == ['Flour']
+
+    def test_write_from_other_worker_invalidates(self, client, recipe_id):
+        """Test that a commit on another connection (another worker) is noticed."""
+        client.get(f'/api/recipes/{recipe_id}')
+
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("UPDATE recipes SET name='Waffles' WHERE id=?", (uuid.UUID(recipe_id).bytes,))
+        conn.commit()
+        conn.close()
+
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['name'] == 'Waffles'
+        assert app_module.recipe_cache.invalidations == 1
+
+    def test_not_found_is_not_cached(self, client):
+        """Test that a missing recipe still returns 404."""
+        assert client.get('/api/recipes/missing').status_code == 404
+        assert client.get('/api/recipes/missing').status_code == 404
+        assert len(app_module.recipe_cache._entries) == 0
+
+    def test_size_bound_evicts_lru(self):
+        """Test that the cache evicts least recently used entries past its byte budget."""
+        cache = RecipeCache(max_bytes=10)
+        cache.get("db", 1, "a")
+        cache.put("db", 1, "a", b"12345")
+        cache.put("db", 1, "b", b"12345")
+        cache.get("db", 1, "a")  # a is now most recently used
+        cache.put("db", 1, "c", b"12345")
+
+        assert cache.get("db", 1, "b") is None
+        assert cache.get("db", 1, "a") == b"12345"
+        assert cache.evictions == 1
+        assert cache.size == 10
+
+    def test_stats_in_metrics(self, client, recipe_id):
+        """Test that hit and eviction counters are exported."""
+        client.get(f'/api/recipes/{recipe_id}')
+        client.get(f'/api/recipes/{recipe_id}')
+
+        body = client.get('/api/metrics').data.decode()
+        assert 'cartly_recipe_cache_hits_total 1' in body
+        assert 'cartly_recipe_cache_evictions_total 0' in body
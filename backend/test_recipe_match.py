@@ -0,0 +1,69 @@
+import pytest
+import json
+
+
+def post(client, path, body):
+    return json.loads(client.post(path, data=json.dumps(body), content_type='application/json').data)
+
+
+def create_recipe(client, name, ingredients):
+    recipe_id = post(client, '/api/recipes', {'name': name})['id']
+    ids = [post(client, f'/api/recipes/{recipe_id}/ingredients', {'name': i})['id'] for i in ingredients]
+    return recipe_id, ids
+
+
+def match(client, **params):
+    response = client.get('/api/recipes/match', query_string=params)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+
+class TestIngredientIndex:
+    """Test the trigger-maintained ingredient -> recipe index and coverage ranking."""
+
+    def test_ranked_by_coverage(self, client):
+        create_recipe(client, 'Omelette', ['Eggs', 'Butter', 'Salt'])
+        create_recipe(client, 'Scrambled eggs', ['Eggs', 'Butter'])
+        create_recipe(client, 'Pasta', ['Pasta', 'Tomatoes', 'Garlic', 'Salt'])
+
+        results = match(client, ingredients='eggs, butter,salt')
+        assert [(r['name'], r['matched'], r['total']) for r in results] == [
+            ('Omelette', 3, 3), ('Scrambled eggs', 2, 2), ('Pasta', 1, 4)]
+        assert results[2]['missing'] == ['Pasta', 'Tomatoes', 'Garlic']
+
+    def test_top_k(self, client):
+        for i in range(5):
+            create_recipe(client, f'Recipe {i}', ['Flour'])
+        assert len(match(client, ingredients='flour', k=3)) == 3
+
+    def test_matches_shopping_list(self, client):
+        create_recipe(client, 'Omelette', ['Eggs', 'Butter'])
+        create_recipe(client, 'Pasta', ['Pasta', 'Garlic'])
+        list_id = post(client, '/api/lists', {'name': 'Groceries'})['id']
+        for name in ('Eggs', 'Milk'):
+            post(client, f'/api/lists/{list_id}/items', {'name': name})
+
+        results = match(client, list_id=list_id)
+        assert [(r['name'], r['coverage']) for r in results] == [('Omelette', 0.5)]
+
+    def test_follows_ingredient_edits(self, client):
+        recipe_id, (eggs, butter) = create_recipe(client, 'Omelette', ['Eggs', 'Butter'])
+        client.put(f'/api/recipes/{recipe_id}/ingredients/{butter}',
+            data=json.dumps({'name': 'Oil'}), content_type='application/json')
+        assert match(client, ingredients='butter') == []
+        assert match(client, ingredients='oil')[0]['total'] == 2
+
+        client.delete(f'/api/recipes/{recipe_id}/ingredients/{eggs}')
+        assert match(client, ingredients='oil')[0]['coverage'] == 1.0
+
+        client.delete(f'/api/recipes/{recipe_id}')
+        assert match(client, ingredients='oil') == []
+
+    def test_duplicate_ingredient_names(self, client):
+        """Test that removing one of two same-named ingredients keeps the recipe indexed."""
+        recipe_id, (salt, _) = create_recipe(client, 'Brine', ['Salt', 'salt'])
+        client.delete(f'/api/recipes/{recipe_id}/ingredients/{salt}')
+        assert match(client, ingredients='salt')[0]['total'] == 1
+
+    def test_requires_query(self, client):
+        assert client.get('/api/recipes/match').status_code == 400
@@ -4,8 +4,13 @@ import os
 import tempfile
 import shutil
 import io
+import base64
+import hashlib
+import struct
+import zlib
+import sqlite3
 import app as app_module
-from app import app, init_db, get_db
+from app import app, init_db, get_db, parse_minutes
 from PIL import Image
 
 @pytest.fixture(scope="function")
@@ -398,7 +403,7 @@ class TestRecipePhotos:
         recipe_response = client.get(f'/api/recipes/{sample_recipe["id"]}')
         recipe = json.loads(recipe_response.data)
         assert recipe['photo'] is not None
-        assert recipe['photo'].startswith('data:image/webp;base64,')
+        assert recipe['photo'].startswith('/api/photos/')
 
     def test_upload_large_photo(self, client, sample_recipe):
         """Test that large photos are rejected."""
@@ -471,7 +476,376 @@ class TestRecipePhotos:
         # Verify it was converted to WebP
         recipe_response = client.get(f'/api/recipes/{sample_recipe["id"]}')
         recipe = json.loads(recipe_response.data)
-        assert recipe['photo'].startswith('data:image/webp;base64,')
+        assert client.get(recipe['photo']).mimetype == 'image/webp'
+
+    def test_upload_non_image_rejected(self, client, sample_recipe):
+        """Test that bytes that are not an image are rejected with 400."""
+        response = client.put(
+            f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (io.BytesIO(b'not an image at all'), 'fake.jpg', 'image/jpeg')},
+            content_type='multipart/form-data'
+        )
+
+        assert response.status_code == 400
+        assert 'image' in json.loads(response.data)['error'].lower()
+
+    def test_upload_huge_dimensions_rejected_from_header(self, client, sample_recipe):
+        """Test that an image header claiming huge dimensions is rejected without decoding."""
+        ihdr = struct.pack('>IIBBBBB', 30000, 30000, 8, 2, 0, 0, 0)
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        png = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IEND', b'')
+
+        response = client.put(
+            f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (io.BytesIO(png), 'bomb.png', 'image/png')},
+            content_type='multipart/form-data'
+        )
+
+        assert response.status_code == 400
+        assert 'dimensions' in json.loads(response.data)['error'].lower()
+
+    def test_large_jpeg_scaled_to_800px(self, client, sample_recipe):
+        """Test that a large JPEG is decoded at reduced scale and resized to 800px wide."""
+        img = Image.new('RGB', (3200, 2400), color='orange')
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='JPEG')
+        img_bytes.seek(0)
+
+        response = client.put(
+            f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (img_bytes, 'big.jpg', 'image/jpeg')},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 200
+
+        recipe = json.loads(client.get(f'/api/recipes/{sample_recipe["id"]}').data)
+        webp = Image.open(io.BytesIO(client.get(recipe['photo']).data))
+        assert webp.size == (800, 600)
+
+    def test_photo_served_immutable(self, client, sample_recipe):
+        """Test that photos are served from a content-hash URL with long-lived caching."""
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(img_bytes, format='JPEG')
+        img_bytes.seek(0)
+        client.put(
+            f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (img_bytes, 'test.jpg', 'image/jpeg')},
+            content_type='multipart/form-data'
+        )
+        url = json.loads(client.get(f'/api/recipes/{sample_recipe["id"]}').data)['photo']
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert Image.open(io.BytesIO(response.data)).format == 'WEBP'
+
+        revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        assert revalidated.status_code == 304
+
+    def test_photo_served_by_nginx_when_configured(self, client, sample_recipe, monkeypatch):
+        """Test that with an accel prefix the worker hands the file to nginx instead of sending it."""
+        monkeypatch.setattr(app_module, 'PHOTO_ACCEL_PREFIX', '/_photos/')
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(img_bytes, format='JPEG')
+        img_bytes.seek(0)
+        client.put(
+            f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (img_bytes, 'test.jpg', 'image/jpeg')},
+            content_type='multipart/form-data'
+        )
+        url = json.loads(client.get(f'/api/recipes/{sample_recipe["id"]}').data)['photo']
+        photo_id = url.rsplit('/', 1)[1]
+
+        response = client.get(url)
+        assert response.headers['X-Accel-Redirect'] == f'/_photos/{photo_id}'
+        assert response.data == b''
+        assert os.path.exists(app_module.photo_file(photo_id))
+
+    def test_unknown_photo_404(self, client):
+        assert client.get('/api/photos/' + 'a' * 64).status_code == 404
+        assert client.get('/api/photos/../shopping.db').status_code == 404
+
+class TestPhotoDedup:
+    """Test content-hash deduplication of recipe photos."""
+
+    def jpeg(self, color='red'):
+        img = Image.new('RGB', (100, 100), color=color)
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='JPEG')
+        return img_bytes.getvalue()
+
+    def create_recipe(self, client, name):
+        return json.loads(client.post('/api/recipes',
+            data=json.dumps({'name': name}),
+            content_type='application/json').data)['id']
+
+    def upload(self, client, recipe_id, data):
+        return client.put(
+            f'/api/recipes/{recipe_id}/photo',
+            data={'photo': (io.BytesIO(data), 'test.jpg', 'image/jpeg')},
+            content_type='multipart/form-data'
+        )
+
+    def photo_rows(self):
+        conn = sqlite3.connect(app_module.DB_PATH)
+        rows = conn.execute("SELECT id, refcount FROM photos").fetchall()
+        conn.close()
+        return rows
+
+    def test_same_image_stored_once(self, client, monkeypatch):
+        """Test that re-uploading the same file reuses the stored result without Pillow."""
+        first = self.create_recipe(client, 'First')
+        second = self.create_recipe(client, 'Second')
+        data = self.jpeg()
+        assert self.upload(client, first, data).status_code == 200
+
+        def fail(*args, **kwargs):
+            raise AssertionError("image was processed again")
+        monkeypatch.setattr(app_module, 'process_recipe_photo', fail)
+        assert self.upload(client, second, data).status_code == 200
+
+        rows = self.photo_rows()
+        assert len(rows) == 1 and rows[0][1] == 2
+        photos = [json.loads(client.get(f'/api/recipes/{r}').data)['photo'] for r in (first, second)]
+        assert photos[0] == photos[1]
+
+    def test_unreferenced_photo_removed(self, client):
+        """Test that photos are deleted once no recipe references them."""
+        first = self.create_recipe(client, 'First')
+        second = self.create_recipe(client, 'Second')
+        data = self.jpeg()
+        self.upload(client, first, data)
+        self.upload(client, second, data)
+
+        client.delete(f'/api/recipes/{first}')
+        assert self.photo_rows()[0][1] == 1
+
+        # Replacing the last reference releases the old photo
+        self.upload(client, second, self.jpeg('blue'))
+        assert len(self.photo_rows()) == 1
+
+        photo_id = self.photo_rows()[0][0]
+        client.get(f'/api/photos/{photo_id}')
+        assert os.path.exists(app_module.photo_file(photo_id))
+
+        client.delete(f'/api/recipes/{second}/photo')
+        assert self.photo_rows() == []
+        assert not os.path.exists(app_module.photo_file(photo_id))
+
+    def test_reimport_reuses_photo(self, client):
+        """Test that importing the same export twice stores its photo once."""
+        recipe_id = self.create_recipe(client, 'Pancakes')
+        self.upload(client, recipe_id, self.jpeg())
+        exported = client.get(f'/api/recipes/{recipe_id}/export').data
+
+        for _ in range(2):
+            response = client.post('/api/recipes/import', data=exported, content_type='application/json')
+            assert response.status_code == 200
+
+        rows = self.photo_rows()
+        assert len(rows) == 1 and rows[0][1] == 3
+
+    def test_inline_photos_migrated(self, client):
+        """Test that photos stored inline before the photo table are moved into it."""
+        first = self.create_recipe(client, 'First')
+        second = self.create_recipe(client, 'Second')
+        uri = 'data:image/webp;base64,' + base64.b64encode(b'legacy-bytes').decode()
+
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("UPDATE recipes SET photo=?", (uri,))
+        conn.execute("PRAGMA user_version=1")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert self.photo_rows()[0][1] == 2
+        for recipe_id in (first, second):
+            assert json.loads(client.get(f'/api/recipes/{recipe_id}/export').data)['photo'] == uri
+
+class TestPhotoSafety:
+    """Test that imported photos can never be served as active content."""
+
+    SVG = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(document.cookie)</script></svg>'
+
+    def import_with_photo(self, client, uri):
+        response = client.post('/api/recipes/import',
+            data=json.dumps({'name': 'Imported', 'photo': uri}),
+            content_type='application/json')
+        assert response.status_code == 200
+        recipes = json.loads(client.get('/api/recipes').data)
+        return next(r for r in recipes if r['name'] == 'Imported')
+
+    def test_svg_import_dropped(self, client):
+        uri = 'data:image/svg+xml;base64,' + base64.b64encode(self.SVG).decode()
+        assert self.import_with_photo(client, uri)['photo'] is None
+
+    def test_mislabelled_svg_dropped(self, client):
+        """Test that the bytes are checked, not just the declared mime type."""
+        uri = 'data:image/png;base64,' + base64.b64encode(self.SVG).decode()
+        assert self.import_with_photo(client, uri)['photo'] is None
+
+    def test_malformed_mime_dropped(self, client):
+        img = io.BytesIO()
+        Image.new('RGB', (10, 10), color='red').save(img, format='PNG')
+        uri = 'data:image/x;foo;base64,' + base64.b64encode(img.getvalue()).decode()
+        assert self.import_with_photo(client, uri)['photo'] is None
+
+    def test_valid_import_typed_from_bytes(self, client):
+        img = io.BytesIO()
+        Image.new('RGB', (10, 10), color='red').save(img, format='PNG')
+        uri = 'data:image/jpeg;base64,' + base64.b64encode(img.getvalue()).decode()
+        photo = self.import_with_photo(client, uri)['photo']
+
+        response = client.get(photo)
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert response.headers['X-Content-Type-Options'] == 'nosniff'
+        assert response.headers['Content-Security-Policy'] == "default-src 'none'; sandbox"
+
+    def test_stored_svg_not_served(self, client):
+        """Test that a photo row stored before imports were checked is not served."""
+        photo_id = hashlib.sha256(self.SVG).hexdigest()
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("INSERT INTO photos (id, mime, refcount, data) VALUES (?, 'image/svg+xml', 1, ?)",
+                     (photo_id, self.SVG))
+        conn.commit()
+        conn.close()
+        assert client.get(f'/api/photos/{photo_id}').status_code == 404
+
+class TestRecipeTimes:
+    """Test parsed minute columns and range filters on GET /api/recipes."""
+
+    @pytest.mark.parametrize("text,minutes", [
+        ("15 mins", 15), ("1 hr 30 min", 90), ("1h30", 90), ("1:15", 75),
+        ("1.5 hours", 90), ("10-15 min", 15), ("45", 45), ("", None), ("overnight", None),
+        ("1½ hours", 90), ("1 1/2 hours", 90), ("½ hr", 30), ("¾ hour", 45), ("1-1½ hours", 90),
+        ("2 hrs 15 min", 135), ("30 seconds", None), ("2 cups", None), ("1/0 hours", None),
+        ("30 days", 43200), ("31 days", None), ("99999999999999999999 min", None), ("9" * 400 + " min", None),
+    ])
+    def test_parse_minutes(self, text, minutes):
+        assert parse_minutes(text) == minutes
+
+    def create(self, client, name, prep, cook, servings):
+        return json.loads(client.post('/api/recipes',
+            data=json.dumps({'name': name, 'prep_time': prep, 'cook_time': cook, 'servings': servings}),
+            content_type='application/json').data)['id']
+
+    def names(self, client, **params):
+        response = client.get('/api/recipes', query_string=params)
+        assert response.status_code == 200
+        return [r['name'] for r in json.loads(response.data)]
+
+    def test_minutes_stored_on_write(self, client):
+        recipe_id = self.create(client, 'Stew', '20 mins', '2 hours', 6)
+        recipe = json.loads(client.get(f'/api/recipes/{recipe_id}').data)
+        assert (recipe['prep_minutes'], recipe['cook_minutes'], recipe['total_minutes']) == (20, 120, 140)
+
+        client.put(f'/api/recipes/{recipe_id}',
+            data=json.dumps({'cook_time': '1 hr'}),
+            content_type='application/json')
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['total_minutes'] == 80
+
+    def test_range_filters_and_sort(self, client):
+        self.create(client, 'Salad', '10 min', '', 2)
+        self.create(client, 'Stew', '20 mins', '2 hours', 6)
+        self.create(client, 'Pasta', '10 min', '15 min', 4)
+        self.create(client, 'Toast', '', '', 1)
+
+        assert self.names(client, max_time=30, sort='time') == ['Salad', 'Pasta']
+        assert self.names(client, min_time=30) == ['Stew']
+        assert self.names(client, min_servings=4, sort='-servings') == ['Stew', 'Pasta']
+        assert self.names(client, sort='time')[-1] == 'Toast'
+
+    def test_invalid_filter(self, client):
+        assert client.get('/api/recipes?max_time=soon').status_code == 400
+        assert client.get('/api/recipes?min_time=99999999999999999999').status_code == 400
+        assert client.get(f'/api/recipes?max_servings={-(1 << 63) - 1}').status_code == 400
+        assert client.get(f'/api/recipes?max_servings={(1 << 63) - 1}').status_code == 200
+        assert client.get('/api/recipes?sort=rating').status_code == 400
+
+    def test_huge_time_not_stored(self, client):
+        """Test that a duration too large to be a recipe time is stored as text only."""
+        recipe_id = self.create(client, 'Forever', '99999999999999999999 min', '10 min', 2)
+        recipe = json.loads(client.get(f'/api/recipes/{recipe_id}').data)
+        assert (recipe['prep_minutes'], recipe['total_minutes']) == (None, 10)
+        assert recipe['prep_time'] == '99999999999999999999 min'
+
+    def test_backfill(self, client):
+        """Test that existing recipes get their minutes parsed by the migration."""
+        recipe_id = self.create(client, 'Stew', '20 mins', '2 hours', 6)
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("UPDATE recipes SET prep_minutes=NULL, cook_minutes=NULL")
+        conn.execute("PRAGMA user_version=5")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['total_minutes'] == 140
+
+    def test_reparse_fractions(self, client):
+        """Test that minutes stored by the parser without fraction support are re-parsed."""
+        recipe_id = self.create(client, 'Bread', '1½ hours', '40 mins', 8)
+        conn = sqlite3.connect(app_module.DB_PATH)
+        conn.execute("UPDATE recipes SET prep_minutes=1")
+        conn.execute("PRAGMA user_version=9")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert json.loads(client.get(f'/api/recipes/{recipe_id}').data)['prep_minutes'] == 90
+
+class TestRecipeDuplicate:
+    """Test server-side recipe duplication."""
+
+    def test_duplicate_copies_everything(self, client, sample_recipe):
+        recipe_id = sample_recipe['id']
+        for name in ('Flour', 'Milk'):
+            client.post(f'/api/recipes/{recipe_id}/ingredients',
+                data=json.dumps({'name': name, 'quantity': '1', 'unit': 'cup'}),
+                content_type='application/json')
+        client.post(f'/api/recipes/{recipe_id}/steps',
+            data=json.dumps({'instruction': 'Mix'}),
+            content_type='application/json')
+
+        response = client.post(f'/api/recipes/{recipe_id}/duplicate')
+        assert response.status_code == 201
+        copy = json.loads(response.data)
+        assert copy['name'] == 'Test Recipe (Copy)'
+        assert copy['id'] != recipe_id
+
+        recipe = json.loads(client.get(f'/api/recipes/{copy["id"]}').data)
+        assert (recipe['prep_time'], recipe['total_minutes'], recipe['servings']) == ('10 mins', 30, 4)
+        original = json.loads(client.get(f'/api/recipes/{recipe_id}/ingredients').data)
+        copied = json.loads(client.get(f'/api/recipes/{copy["id"]}/ingredients').data)
+        assert [(i['name'], i['unit'], i['position']) for i in copied] == \
+            [(i['name'], i['unit'], i['position']) for i in original]
+        assert not {i['id'] for i in copied} & {i['id'] for i in original}
+        steps = json.loads(client.get(f'/api/recipes/{copy["id"]}/steps').data)
+        assert [s['instruction'] for s in steps] == ['Mix']
+
+    def test_duplicate_shares_photo(self, client, sample_recipe):
+        """Test that the copy references the same stored photo."""
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (100, 100), color='red').save(img_bytes, format='JPEG')
+        img_bytes.seek(0)
+        client.put(f'/api/recipes/{sample_recipe["id"]}/photo',
+            data={'photo': (img_bytes, 'test.jpg', 'image/jpeg')},
+            content_type='multipart/form-data')
+
+        copy = json.loads(client.post(f'/api/recipes/{sample_recipe["id"]}/duplicate',
+            data=json.dumps({'name': 'Variation'}), content_type='application/json').data)
+        assert copy['name'] == 'Variation'
+
+        original = json.loads(client.get(f'/api/recipes/{sample_recipe["id"]}').data)
+        duplicate = json.loads(client.get(f'/api/recipes/{copy["id"]}').data)
+        assert duplicate['photo'] == original['photo']
+        conn = sqlite3.connect(app_module.DB_PATH)
+        assert conn.execute("SELECT refcount FROM photos").fetchall() == [(2,)]
+        conn.close()
+
+    def test_duplicate_missing(self, client):
+        assert client.post('/api/recipes/missing/duplicate').status_code == 404
 
 class TestIntegration:
     """Integration tests for complete recipe workflows."""
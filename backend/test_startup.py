@@ -0,0 +1,151 @@
+import pytest
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+import app as app_module
+from app import init_db, SCHEMA_VERSION
+
+
+def index_names(path):
+    conn = sqlite3.connect(path)
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    conn.close()
+    return names
+
+
+class TestSchemaVersion:
+    """Test that init_db only runs DDL when the stored schema is out of date."""
+
+    def test_records_schema_version(self, db_path):
+        init_db()
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        conn.close()
+
+    def test_current_schema_skips_ddl(self, db_path):
+        """Test that a current database is left untouched."""
+        init_db()
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP INDEX idx_items_list")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert "idx_items_list" not in index_names(db_path)
+
+    def test_outdated_schema_is_upgraded(self, db_path):
+        """Test that a database from before schema versioning gets the full DDL."""
+        init_db()
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP INDEX idx_items_list")
+        conn.execute("PRAGMA user_version=0")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert "idx_items_list" in index_names(db_path)
+
+
+class TestLazyImports:
+    """Test that heavy optional imports stay out of worker startup."""
+
+    def test_pillow_not_imported_at_startup(self, tmp_path):
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, app; print('PIL' in sys.modules)"],
+            cwd=os.path.dirname(app_module.__file__),
+            env=dict(os.environ, DB_DIR=str(tmp_path)),
+            capture_output=True, text=True, check=True,
+        )
+        assert result.stdout.strip() == "False"
+
+
+class TestCompactIds:
+    """Test 16-byte UUIDv7 row ids and the migration from text ids."""
+
+    LIST_ID = "6f1c2a9e-3b7d-4c55-9a0e-2d4b8f1e7c30"
+    ITEM_ID = "0b5e8d7a-91c4-4f2e-8a63-5c1d9e2f4a17"
+    RECIPE_ID = "c3a7e1f0-5d2b-4e98-b6a4-7f0e1d2c3b45"
+    INGREDIENT_ID = "legacy-ingred-01"  # 16 characters, like a UUID's bytes
+
+    def legacy_db(self, db_path, monkeypatch):
+        """Create a version 7 database holding text ids, as written before migration 8."""
+        with monkeypatch.context() as m:
+            m.setattr(app_module, "MIGRATIONS", app_module.MIGRATIONS[:7])
+            m.setattr(app_module, "SCHEMA_VERSION", 7)
+            init_db()
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO lists (id, name) VALUES (?, 'Groceries')", (self.LIST_ID,))
+        conn.execute("INSERT INTO items (id, list_id, name, done) VALUES (?, ?, 'Milk', 1)", (self.ITEM_ID, self.LIST_ID))
+        conn.execute("INSERT INTO recipes (id, name) VALUES (?, 'Pancakes')", (self.RECIPE_ID,))
+        conn.execute("INSERT INTO recipe_ingredients (id, recipe_id, name) VALUES (?, ?, 'Eggs')",
+                     (self.INGREDIENT_ID, self.RECIPE_ID))
+        conn.commit()
+        conn.close()
+
+    def test_text_ids_migrate_to_blobs(self, db_path, monkeypatch):
+        """Test that existing ids become 16-byte blobs and still resolve through the API."""
+        self.legacy_db(db_path, monkeypatch)
+        init_db()
+
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT typeof(id), length(id) FROM items").fetchone() == ("blob", 16)
+        assert conn.execute("SELECT typeof(list_id) FROM list_stats").fetchone() == ("blob",)
+        # The non-UUID legacy id is kept as text
+        assert conn.execute("SELECT typeof(id) FROM recipe_ingredients").fetchone() == ("text",)
+        conn.close()
+
+        client = app_module.app.test_client()
+        items = client.get(f"/api/lists/{self.LIST_ID}/items").get_json()
+        assert [(i["id"], i["list_id"]) for i in items] == [(self.ITEM_ID, self.LIST_ID)]
+        assert client.get(f"/api/lists/{self.LIST_ID}/stats").get_json() == {"total": 1, "done": 1}
+        assert client.get(f"/api/recipes/{self.RECIPE_ID}").get_json()["name"] == "Pancakes"
+        matches = client.get("/api/recipes/match", query_string={"ingredients": "eggs"}).get_json()
+        assert [m["id"] for m in matches] == [self.RECIPE_ID]
+        ingredients = client.get(f"/api/recipes/{self.RECIPE_ID}/ingredients").get_json()
+        assert [i["id"] for i in ingredients] == [self.INGREDIENT_ID]
+
+        # Triggers were recreated on the rebuilt tables
+        client.post(f"/api/lists/{self.LIST_ID}/items/{self.ITEM_ID}/toggle")
+        assert client.get(f"/api/lists/{self.LIST_ID}/stats").get_json() == {"total": 1, "done": 0}
+
+    def test_id_converter(self):
+        """Test that UUID columns read back the way uuid_blob() stored them."""
+        value = app_module.uuid7()
+        assert app_module._uuid_from_db(app_module.uuid_blob(str(value))) == value
+        assert app_module._uuid_from_db(uuid.UUID(int=0).bytes) == uuid.UUID(int=0)
+        assert app_module._uuid_from_db(self.INGREDIENT_ID.encode()) == self.INGREDIENT_ID
+        assert app_module._uuid_from_db(self.LIST_ID.encode()) == uuid.UUID(self.LIST_ID)
+        assert app_module._uuid_from_db(b"default") == "default"
+
+    def test_key_tables_without_rowid(self, db_path):
+        init_db()
+        conn = sqlite3.connect(db_path)
+        for table in app_module.WITHOUT_ROWID_TABLES:
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name=?", (table,)).fetchone()[0]
+            assert sql.endswith("WITHOUT ROWID")
+        conn.close()
+
+    def test_new_ids_are_uuid7(self, db_path):
+        init_db()
+        client = app_module.app.test_client()
+        list_id = client.post("/api/lists", json={"name": "Groceries"}).get_json()["id"]
+        value = uuid.UUID(list_id)
+        assert value.version == 7
+        assert abs((value.int >> 80) - time.time() * 1000) < 60_000
+
+    def test_rerun_is_safe(self, db_path):
+        """Test that re-applying every migration leaves converted tables alone."""
+        init_db()
+        client = app_module.app.test_client()
+        list_id = client.post("/api/lists", json={"name": "Groceries"}).get_json()["id"]
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA user_version=0")
+        conn.commit()
+        conn.close()
+
+        init_db()
+        assert client.get(f"/api/lists/{list_id}/items").status_code == 200
@@ -0,0 +1,129 @@
+import pytest
+import io
+import json
+import logging
+import os
+import re
+from PIL import Image
+import app as app_module
+from app import app, TraceLog
+
+
+@pytest.fixture
+def trace_file(temp_dir, monkeypatch):
+    """Write every trace to a file in the temporary directory."""
+    path = os.path.join(temp_dir, "traces", "requests.jsonl")
+    monkeypatch.setattr(app_module, "TRACE_FILE", path)
+    monkeypatch.setattr(app_module, "traces", TraceLog(path))
+    monkeypatch.setattr(app_module, "TRACE_SLOW_MS", 0)
+    return path
+
+
+def read_traces(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def span_names(trace):
+    return {s["name"] for s in trace["spans"]}
+
+
+class TestRequestId:
+    """Test that every request carries an X-Request-ID."""
+
+    def test_generated(self, client):
+        first = client.get('/api/lists').headers['X-Request-ID']
+        second = client.get('/api/lists').headers['X-Request-ID']
+        assert re.fullmatch(r"[0-9a-f]{32}", first)
+        assert first != second
+
+    def test_propagated_from_proxy(self, client):
+        response = client.get('/api/lists', headers={'X-Request-ID': '3f2a9c1be4d54c0f'})
+        assert response.headers['X-Request-ID'] == '3f2a9c1be4d54c0f'
+
+    def test_invalid_id_replaced(self, client):
+        response = client.get('/api/lists', headers={'X-Request-ID': 'bad id; "x"' + 'y' * 200})
+        assert re.fullmatch(r"[0-9a-f]{32}", response.headers['X-Request-ID'])
+
+    def test_slow_query_log_names_request(self, client, monkeypatch, caplog):
+        monkeypatch.setattr(app_module, "SLOW_QUERY_MS", 0)
+        with caplog.at_level(logging.WARNING, logger="cartly.sql"):
+            client.get('/api/lists', headers={'X-Request-ID': 'req-42'})
+        assert "slow query" in caplog.text
+        assert "[req-42]" in caplog.text
+
+
+class TestSpans:
+    """Test the per-request spans written to the trace file."""
+
+    def test_write_request_spans(self, client, trace_file):
+        response = client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json')
+
+        trace = read_traces(trace_file)[-1]
+        assert trace["request_id"] == response.headers['X-Request-ID']
+        assert (trace["endpoint"], trace["status"], trace["reason"]) == ("create_list", 201, "slow")
+        assert {"admission", "handler", "write", "commit", "sql", "serialize"} <= span_names(trace)
+        inserts = [s for s in trace["spans"] if s["name"] == "sql" and s["sql"].startswith("INSERT INTO lists")]
+        assert len(inserts) == 1
+        handler = next(s for s in trace["spans"] if s["name"] == "handler")
+        assert handler["start_ms"] <= inserts[0]["start_ms"] <= handler["start_ms"] + handler["ms"]
+        assert trace["ms"] >= handler["ms"]
+
+    def test_pillow_span(self, client, trace_file):
+        recipe_id = json.loads(client.post('/api/recipes',
+            data=json.dumps({'name': 'Toast'}),
+            content_type='application/json').data)['id']
+        img = io.BytesIO()
+        Image.new('RGB', (50, 50), color='blue').save(img, format='JPEG')
+        img.seek(0)
+        client.put(f'/api/recipes/{recipe_id}/photo',
+                   data={'photo': (img, 'toast.jpg', 'image/jpeg')}, content_type='multipart/form-data')
+
+        assert "pillow" in span_names(read_traces(trace_file)[-1])
+
+    def test_sampling(self, client, trace_file, monkeypatch):
+        """Test that fast requests are written only when sampled."""
+        monkeypatch.setattr(app_module, "TRACE_SLOW_MS", 60_000)
+        monkeypatch.setattr(app_module, "TRACE_SAMPLE_RATE", 0)
+        client.get('/api/lists')
+        assert read_traces(trace_file) == []
+
+        monkeypatch.setattr(app_module, "TRACE_SAMPLE_RATE", 1)
+        client.get('/api/lists')
+        assert [t["reason"] for t in read_traces(trace_file)] == ["sampled"]
+
+    def test_disabled_without_trace_file(self, client, temp_dir):
+        assert 'X-Request-ID' in client.get('/api/lists').headers
+        assert not os.path.exists(os.path.join(temp_dir, "traces"))
+
+    def test_span_cap(self, client, trace_file, monkeypatch):
+        monkeypatch.setattr(app_module, "TRACE_MAX_SPANS", 2)
+        client.get('/api/lists')
+        trace = read_traces(trace_file)[-1]
+        assert len(trace["spans"]) == 2
+        assert trace["dropped_spans"] > 0
+
+
+class TestTraceLog:
+    """Test the shared, rotating JSON-lines file."""
+
+    def test_rotates_and_keeps_backups(self, temp_dir):
+        path = os.path.join(temp_dir, "requests.jsonl")
+        log = TraceLog(path, max_bytes=100, backups=2)
+        for i in range(10):
+            log.write({"request_id": str(i), "pad": "x" * 80})
+
+        assert sorted(os.listdir(temp_dir)) == ["requests.jsonl.1", "requests.jsonl.2", "requests.jsonl.lock"]
+        assert read_traces(path + ".1")[0]["request_id"] == "9"
+        assert log.written == 10
+
+    def test_write_error_counted(self, temp_dir):
+        blocker = os.path.join(temp_dir, "file")
+        open(blocker, "w").close()
+        log = TraceLog(os.path.join(blocker, "requests.jsonl"))
+        log.write({"request_id": "x"})
+        assert (log.written, log.errors) == (0, 1)
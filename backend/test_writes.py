@@ -0,0 +1,209 @@
+import pytest
+import json
+import os
+import sqlite3
+import threading
+import time
+import app as app_module
+from app import app, init_db, WriteBusy, WriteQueue, WriteQueueFull
+
+
+@pytest.fixture
+def db_path(db_path):
+    """The test database, initialised."""
+    init_db()
+    return db_path
+
+
+def insert_list(name):
+    return lambda db: db.execute("INSERT INTO lists (id, name) VALUES (?, ?)", (name, name))
+
+
+def list_names(path):
+    conn = sqlite3.connect(path)
+    names = {r[0] for r in conn.execute("SELECT name FROM lists")}
+    conn.close()
+    return names
+
+
+class TestWriteQueue:
+    """Test the per-process group-commit writer."""
+
+    def test_queued_writes_share_one_commit(self, db_path):
+        """Test that writes queued behind a busy writer commit as one batch."""
+        writer = WriteQueue()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(db):
+            started.set()
+            release.wait(5)
+            db.execute("INSERT INTO lists (id, name) VALUES ('first', 'first')")
+
+        threads = [threading.Thread(target=writer.submit, args=(slow, db_path))]
+        threads[0].start()
+        assert started.wait(5)  # writer is now busy with the slow op
+        for i in range(10):
+            t = threading.Thread(target=writer.submit, args=(insert_list(f"list{i}"), db_path))
+            t.start()
+            threads.append(t)
+        deadline = time.monotonic() + 5
+        while writer.depth() < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        assert writer.ops == 11
+        assert writer.batches == 2
+        assert len(list_names(db_path)) == 11
+
+    def test_failed_op_does_not_roll_back_batch(self, db_path):
+        """Test that one failing operation only rolls back its own savepoint."""
+        writer = WriteQueue()
+        writer.submit(insert_list("dup"), db_path)
+        with pytest.raises(sqlite3.IntegrityError):
+            writer.submit(insert_list("dup"), db_path)
+        writer.submit(insert_list("other"), db_path)
+        assert list_names(db_path) == {"dup", "other"}
+
+    def test_retries_when_database_locked(self, db_path, monkeypatch):
+        """Test that SQLITE_BUSY from another process is retried with backoff."""
+        monkeypatch.setattr(app_module, "BUSY_TIMEOUT_MS", 0)
+        writer = WriteQueue()
+        blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.1, lambda: blocker.execute("COMMIT")).start()
+
+        writer.submit(insert_list("after-lock"), db_path)
+        blocker.close()
+
+        assert writer.retries > 0
+        assert "after-lock" in list_names(db_path)
+
+    def test_busy_after_retries(self, db_path, monkeypatch):
+        """Test that a lock held past the last retry fails with WriteBusy, not a raw OperationalError."""
+        monkeypatch.setattr(app_module, "BUSY_TIMEOUT_MS", 10)
+        monkeypatch.setattr(app_module, "WRITE_RETRIES", 2)
+        writer = WriteQueue()
+        blocker = sqlite3.connect(db_path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            with pytest.raises(WriteBusy):
+                writer.submit(insert_list("locked"), db_path)
+        finally:
+            blocker.execute("COMMIT")
+            blocker.close()
+        assert writer.retries == 2
+
+    def test_total_wait_is_capped(self, db_path, monkeypatch):
+        """Test that busy_timeout and backoff together never exceed WRITE_MAX_WAIT."""
+        monkeypatch.setattr(app_module, "WRITE_MAX_WAIT", 0.3)
+        writer = WriteQueue()
+        blocker = sqlite3.connect(db_path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.monotonic()
+            with pytest.raises(WriteBusy):
+                writer.submit(insert_list("locked"), db_path)
+            assert time.monotonic() - started < 1
+        finally:
+            blocker.execute("COMMIT")
+            blocker.close()
+        writer.submit(insert_list("after"), db_path)  # the lane recovers its busy_timeout
+        assert list_names(db_path) == {"after"}
+
+    def test_returns_result_and_query_count(self, db_path):
+        """Test that the operation's return value and statement count come back."""
+        writer = WriteQueue()
+        result, queries = writer.submit(lambda db: db.execute("SELECT 42").fetchone()[0], db_path)
+        assert result == 42
+        assert queries >= 1
+
+
+    def test_locked_database_does_not_delay_others(self, db_path, temp_dir):
+        """Test that a file whose write lock is held elsewhere only holds up its own writes."""
+        other = os.path.join(temp_dir, "other.db")
+        init_db(other)
+        writer = WriteQueue()
+        blocker = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        waiting = threading.Thread(target=writer.submit, args=(insert_list("blocked"), db_path))
+        waiting.start()
+        try:
+            time.sleep(0.1)  # the first lane is now waiting on busy_timeout
+            started = time.monotonic()
+            writer.submit(insert_list("free"), other)
+            assert time.monotonic() - started < 0.5
+            assert list_names(other) == {"free"}
+        finally:
+            blocker.execute("COMMIT")
+            blocker.close()
+            waiting.join(10)
+        assert "blocked" in list_names(db_path)
+
+    def test_idle_lanes_evicted(self, temp_dir):
+        """Test that at most max_connections lanes are kept, dropping the least recently used."""
+        paths = [os.path.join(temp_dir, f"{name}.db") for name in "abc"]
+        for path in paths:
+            init_db(path)
+        writer = WriteQueue(max_connections=2)
+        for i, path in enumerate(paths + paths[:1]):
+            writer.submit(insert_list(f"list{i}"), path)
+
+        assert list(writer._lanes) == [paths[2], paths[0]]
+        assert [list_names(path) for path in paths] == [{"list0", "list3"}, {"list1"}, {"list2"}]
+
+
+class TestWriteRoutes:
+    """Test mutation routes going through the writer."""
+
+    def test_concurrent_toggles(self, client, db_path):
+        """Test that concurrent toggles from many threads all apply."""
+        list_id = json.loads(client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json').data)['id']
+        item_ids = [json.loads(client.post(f'/api/lists/{list_id}/items',
+            data=json.dumps({'name': f'Item {i}'}),
+            content_type='application/json').data)['id'] for i in range(20)]
+
+        def toggle(item_id):
+            with app.test_client() as c:
+                assert c.post(f'/api/lists/{list_id}/items/{item_id}/toggle').status_code == 200
+
+        threads = [threading.Thread(target=toggle, args=(i,)) for i in item_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        stats = json.loads(client.get(f'/api/lists/{list_id}/stats').data)
+        assert stats == {'total': 20, 'done': 20}
+
+    def test_queue_full_returns_503(self, client, monkeypatch):
+        """Test that a saturated writer sheds load with 503 and Retry-After."""
+        def full(fn, path):
+            raise WriteQueueFull()
+        monkeypatch.setattr(app_module.writer, "submit", full)
+
+        response = client.post('/api/lists',
+            data=json.dumps({'name': 'Groceries'}),
+            content_type='application/json')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+    def test_locked_database_returns_503(self, client, db_path, monkeypatch):
+        """Test that a write lock held past every retry is a JSON 503, not an HTML 500."""
+        monkeypatch.setattr(app_module, "WRITE_MAX_WAIT", 0.2)
+        blocker = sqlite3.connect(db_path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            response = client.post('/api/lists',
+                data=json.dumps({'name': 'Groceries'}),
+                content_type='application/json')
+        finally:
+            blocker.execute("COMMIT")
+            blocker.close()
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert json.loads(response.data) == {'error': 'Database busy, please retry'}
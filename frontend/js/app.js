@@ -14,15 +14,227 @@ let currentScaleFactor = 1;
 // ═══════════════════════════════════════════════════════════
 //  API HELPERS
 // ═══════════════════════════════════════════════════════════
-const API = "/api";
-async function api(method, path, body) {
-  const opts = { method, headers: {} };
+// Under /h/<household>/ every request goes to that household's database
+const API = (location.pathname.match(/^\/h\/[^/]+/) || [""])[0] + "/api";
+async function api(method, path, body, init = {}) {
+  const opts = { ...init, method, headers: {} };
   if (body) { opts.headers["Content-Type"] = "application/json"; opts.body = JSON.stringify(body); }
   const r = await fetch(API + path, opts);
   if (!r.ok) throw new Error(await r.text());
   return r.json();
 }
 
+// ═══════════════════════════════════════════════════════════
+//  MUTATION QUEUE
+// ═══════════════════════════════════════════════════════════
+// Toggles and deletes change `items` and the screen at once and are sent
+// later: after FLUSH_DELAY_MS without another change (at most
+// FLUSH_MAX_WAIT_MS after the first), as one batch request per list.
+// Changes to the same item collapse to its final state, and toggling an item
+// back to its saved state drops it from the batch. A failed batch is undone.
+const FLUSH_DELAY_MS    = 400;
+const FLUSH_MAX_WAIT_MS = 2000;
+const pendingOps = new Map();   // "listId:itemId" -> { listId, item, op, base, index }
+let flushTimer = null;
+let firstQueuedAt = 0;
+
+function toggleItem(item) {
+  const key = `${currentList.id}:${item.id}`;
+  const entry = pendingOps.get(key);
+  item.done = item.done ? 0 : 1;
+  if (!entry) pendingOps.set(key, { listId: currentList.id, item, op: "set_done", base: item.done ? 0 : 1 });
+  else if (item.done === entry.base) pendingOps.delete(key);
+  scheduleFlush();
+}
+
+function deleteItem(item) {
+  const key = `${currentList.id}:${item.id}`;
+  const entry = pendingOps.get(key);
+  const index = items.indexOf(item);
+  items = items.filter(i => i !== item);
+  pendingOps.set(key, { listId: currentList.id, item, op: "delete", base: entry ? entry.base : item.done, index });
+  scheduleFlush();
+}
+
+function scheduleFlush() {
+  clearTimeout(flushTimer);
+  if (!pendingOps.size) { firstQueuedAt = 0; return; }
+  if (!firstQueuedAt) firstQueuedAt = Date.now();
+  const wait = Math.min(FLUSH_DELAY_MS, firstQueuedAt + FLUSH_MAX_WAIT_MS - Date.now());
+  flushTimer = setTimeout(flushMutations, Math.max(0, wait));
+}
+
+async function flushMutations() {
+  clearTimeout(flushTimer);
+  firstQueuedAt = 0;
+  if (!pendingOps.size) return;
+  const byList = new Map();
+  pendingOps.forEach(e => {
+    if (!byList.has(e.listId)) byList.set(e.listId, []);
+    byList.get(e.listId).push(e);
+  });
+  pendingOps.clear();
+
+  await Promise.all([...byList].map(async ([listId, entries]) => {
+    const ops = entries.map(e => e.op === "delete"
+      ? { op: "delete", id: e.item.id }
+      : { op: "set_done", id: e.item.id, done: e.item.done });
+    try {
+      // keepalive lets the batch outlive the page when flushed on pagehide
+      await api("POST", `/lists/${listId}/items/batch`, { ops }, { keepalive: true });
+    } catch (err) {
+      entries.forEach(rollbackOp);
+      if (currentList && currentList.id === listId) renderDetail();
+      alert("Couldn't save your changes, so they were undone: " + err.message);
+    }
+  }));
+}
+
+function rollbackOp(e) {
+  const newer = pendingOps.get(`${e.listId}:${e.item.id}`);
+  if (newer) {
+    // A later change is queued; it now starts from what the server still has
+    newer.base = e.base;
+    if (newer.op === "set_done" && newer.item.done === e.base) pendingOps.delete(`${e.listId}:${e.item.id}`);
+    return;
+  }
+  e.item.done = e.base;
+  if (e.op === "delete" && currentList && currentList.id === e.listId && !items.includes(e.item)) {
+    items.splice(Math.min(e.index, items.length), 0, e.item);
+  }
+}
+
+window.addEventListener("pagehide", flushMutations);
+document.addEventListener("visibilitychange", () => {
+  if (document.visibilityState === "hidden") flushMutations();
+});
+
+// ═══════════════════════════════════════════════════════════
+//  KEYED & VIRTUAL LISTS
+// ═══════════════════════════════════════════════════════════
+// Rows are reused by key and only rebuilt when their signature changes, so a
+// toggle touches one row. Past VIRTUALIZE_AFTER rows only the rows near the
+// viewport are in the DOM; two spacers stand in for the rest. Rows in one
+// list must share a height (item and card rows are single-line).
+const VIRTUALIZE_AFTER = 150;
+const OVERSCAN_ROWS    = 12;
+const liveLists = new Set();
+
+class KeyedList {
+  constructor(container, { build, signature, before = null }) {
+    this.container = container;
+    this.build     = build;
+    this.signature = signature;
+    this.data      = [];
+    this.rows      = new Map();   // key -> element currently in the DOM
+    this.pitch     = 0;           // row height + gap, measured once rows exist
+    this.rendered  = false;
+    this.top    = document.createElement("div");
+    this.bottom = document.createElement("div");
+    container.insertBefore(this.top, before);
+    container.insertBefore(this.bottom, before);
+    liveLists.add(this);
+  }
+
+  get virtual() { return this.data.length > VIRTUALIZE_AFTER; }
+
+  render(data) {
+    this.data = data;
+    this.update();
+    this.rendered = true;
+  }
+
+  update() {
+    if (!this.container.isConnected) { liveLists.delete(this); return; }
+    const n = this.data.length;
+    let start = 0, end = n;
+    if (this.virtual) {
+      if (!this.pitch) {
+        end = Math.min(n, 2 * OVERSCAN_ROWS);  // enough rows to measure
+      } else {
+        const origin = this.top.getBoundingClientRect().top;
+        start = Math.max(0, Math.floor(-origin / this.pitch) - OVERSCAN_ROWS);
+        end   = Math.min(n, Math.max(start, Math.ceil((window.innerHeight - origin) / this.pitch) + OVERSCAN_ROWS));
+      }
+    }
+    this.reconcile(start, end);
+    this.setSpacers(start, end);
+    if (this.virtual && !this.pitch && this.measure()) this.update();
+  }
+
+  reconcile(start, end) {
+    const wanted = new Set();
+    let cursor = this.top.nextSibling;
+    for (let i = start; i < end; i++) {
+      const item = this.data[i];
+      const sig  = this.signature(item);
+      let row = this.rows.get(item.id);
+      if (row && row._sig !== sig) { forgetImages(row); row.remove(); row = null; }
+      if (!row) {
+        row = this.build(item, i);
+        row._sig = sig;
+        if (this.rendered) row.style.animation = "none";
+        observeImages(row);
+        this.rows.set(item.id, row);
+      }
+      wanted.add(item.id);
+      if (row === cursor) cursor = cursor.nextSibling;
+      else this.container.insertBefore(row, cursor);
+    }
+    for (const [key, row] of this.rows) {
+      if (!wanted.has(key)) { forgetImages(row); row.remove(); this.rows.delete(key); }
+    }
+  }
+
+  setSpacers(start, end) {
+    // Negative margins cancel the flex gap the spacers themselves add
+    const gap = parseFloat(getComputedStyle(this.container).rowGap) || 0;
+    this.top.style.cssText    = `height:${start * this.pitch}px;margin-bottom:${-gap}px;animation:none`;
+    this.bottom.style.cssText = `height:${Math.max(0, (this.data.length - end) * this.pitch - gap)}px;margin-top:${-gap}px;animation:none`;
+  }
+
+  measure() {
+    if (this.rows.size < 2) return false;
+    const first = this.top.nextSibling.getBoundingClientRect();
+    const last  = this.bottom.previousSibling.getBoundingClientRect();
+    this.pitch = (last.top - first.top) / (this.rows.size - 1);
+    return this.pitch > 0;
+  }
+}
+
+// One rAF-throttled pass over every virtualized list per scroll/resize frame
+let listUpdatePending = false;
+function scheduleListUpdate() {
+  if (listUpdatePending) return;
+  listUpdatePending = true;
+  requestAnimationFrame(() => {
+    listUpdatePending = false;
+    liveLists.forEach(l => { if (l.virtual) l.update(); });
+  });
+}
+window.addEventListener("scroll", scheduleListUpdate, { passive: true });
+window.addEventListener("resize", () => { liveLists.forEach(l => l.pitch = 0); scheduleListUpdate(); });
+
+// Images carry data-src and only load once they approach the viewport
+const lazyImages = "IntersectionObserver" in window
+  ? new IntersectionObserver(entries => entries.forEach(e => {
+      if (!e.isIntersecting) return;
+      e.target.src = e.target.dataset.src;
+      e.target.removeAttribute("data-src");
+      lazyImages.unobserve(e.target);
+    }), { rootMargin: "300px" })
+  : null;
+
+function observeImages(root) {
+  root.querySelectorAll("img[data-src]").forEach(img => {
+    if (lazyImages) lazyImages.observe(img);
+    else { img.src = img.dataset.src; img.removeAttribute("data-src"); }
+  });
+}
+function forgetImages(root) {
+  if (lazyImages) root.querySelectorAll("img[data-src]").forEach(img => lazyImages.unobserve(img));
+}
+
 // ═══════════════════════════════════════════════════════════
 //  NAVIGATION
 // ═══════════════════════════════════════════════════════════
@@ -30,6 +242,8 @@ function showView(id) {
   document.querySelectorAll(".view").forEach(v => v.classList.remove("view--active"));
   document.getElementById(id).classList.add("view--active");
   updateTopbarNav(id);
+  // Lists rendered while hidden could not measure their rows
+  liveLists.forEach(l => { if (l.virtual && !l.pitch) l.update(); });
 }
 
 function updateTopbarNav(currentView) {
@@ -55,7 +269,8 @@ function updateTopbarNav(currentView) {
 //  LISTS VIEW
 // ═══════════════════════════════════════════════════════════
 async function loadLists() {
-  lists = await api("GET", "/lists");
+  await flushMutations();
+  lists = await api("GET", "/lists?with_stats=1");
   renderLists();
 }
 
@@ -79,7 +294,7 @@ function renderLists() {
           ${esc(list.name)}
           ${list.is_default ? '<span class="list-card__badge">Default</span>' : ''}
         </div>
-        <div class="list-card__meta">Created ${formatDate(list.created)}</div>
+        <div class="list-card__meta">${list.total ? `${list.done} / ${list.total} done · ` : ""}Created ${formatDate(list.created)}</div>
       </div>
       <div class="list-card__actions">
         ${!list.is_default ? '<button data-action="setdefault" title="Set as default"><svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M12 2l3.09 6.26L22 9.27l-5 4.87 1.18 6.88L12 17.77l-6.18 3.25L7 14.14 2 9.27l6.91-1.01L12 2z"/></svg></button>' : ''}
@@ -114,34 +329,58 @@ function renderLists() {
 //  DETAIL VIEW
 // ═══════════════════════════════════════════════════════════
 async function openList(id) {
+  await flushMutations();
   currentList = lists.find(l => l.id === id);
   categories  = await api("GET", `/lists/${id}/categories`);
   items       = await api("GET", `/lists/${id}/items`);
   document.getElementById("detailNameInput").value = currentList.name;
+  sectionCatsSig = null;
   renderDetail();
   showView("viewDetail");
 }
 
+// Category id ("" = General) -> { section, list }; sections are rebuilt only
+// when the set of categories changes, otherwise their item lists are patched
+let sectionViews   = new Map();
+let sectionCatsSig = null;
+
 function renderDetail() {
   const body = document.getElementById("detailBody");
-  body.innerHTML = "";
+  const catsSig = categories.map(c => c.id + ":" + c.name).join("|");
+  if (catsSig !== sectionCatsSig) {
+    body.innerHTML = "";
+    sectionViews.forEach(view => liveLists.delete(view.list));
+    sectionViews.clear();
+    sectionCatsSig = catsSig;
+  }
 
-  // Group items by category
-  const uncatItems = items.filter(i => !i.category);
-  const catGroups  = categories.map(c => ({ cat: c, items: items.filter(i => i.category === c.id) }));
+  // Group items by category in one pass
+  const groups = new Map([["", []], ...categories.map(c => [c.id, []])]);
+  items.forEach(i => { const group = groups.get(i.category || ""); if (group) group.push(i); });
 
   // Uncategorised first
-  if (uncatItems.length || !categories.length) {
-    body.appendChild(buildCategorySection(null, uncatItems));
+  const showGeneral = groups.get("").length || !categories.length;
+  if (showGeneral && !sectionViews.has("")) {
+    const view = buildCategorySection(null);
+    body.insertBefore(view.section, body.firstChild);
+    sectionViews.set("", view);
+  } else if (!showGeneral && sectionViews.has("")) {
+    sectionViews.get("").section.remove();
+    sectionViews.delete("");
   }
-  catGroups.forEach(g => {
-    body.appendChild(buildCategorySection(g.cat, g.items));
+  categories.forEach(c => {
+    if (!sectionViews.has(c.id)) {
+      const view = buildCategorySection(c);
+      body.appendChild(view.section);
+      sectionViews.set(c.id, view);
+    }
   });
+  sectionViews.forEach((view, key) => view.list.render(groups.get(key)));
 
   updateStats();
 }
 
-function buildCategorySection(cat, catItems) {
+function buildCategorySection(cat) {
   const section = document.createElement("div");
   section.className = "cat-section";
 
@@ -169,19 +408,40 @@ function buildCategorySection(cat, catItems) {
   section.appendChild(header);
 
   // Item list
-  const list = document.createElement("div");
-  list.className = "item-list";
-  catItems.forEach(item => list.appendChild(buildItemRow(item)));
-  section.appendChild(list);
+  const listEl = document.createElement("div");
+  listEl.className = "item-list";
+  section.appendChild(listEl);
+  const list = new KeyedList(listEl, { build: buildItemRow, signature: itemSignature });
 
   // Add-item bar
   section.appendChild(buildAddBar(cat ? cat.id : null));
-  return section;
+  return { section, list };
+}
+
+function itemSignature(item) {
+  return `${item.done ? 1 : 0}|${item.name}|${item.quantity}`;
 }
 
+// Row clicks are handled once on the container, not per row
+document.getElementById("detailBody").addEventListener("click", (e) => {
+  const row = e.target.closest(".item-row");
+  if (!row) return;
+  const item = items.find(i => i.id === row.dataset.id);
+  if (!item) return;
+  if (e.target.closest(".item-row__check")) {
+    toggleItem(item);
+    renderDetail();
+  } else if (e.target.closest("[data-action=edit]")) {
+    openEditItemModal(item);
+  } else if (e.target.closest("[data-action=del]")) {
+    openDeleteItemModal(item);
+  }
+});
+
 function buildItemRow(item) {
   const row = document.createElement("div");
   row.className = "item-row" + (item.done ? " item-row--done" : "");
+  row.dataset.id = item.id;
   row.innerHTML = `
     <div class="item-row__check" data-id="${item.id}">
       <svg width="13" height="13" viewBox="0 0 24 24" fill="none" stroke="#fff" stroke-width="3.5" stroke-linecap="round" stroke-linejoin="round"><path d="M20 6L9 17l-5-5"/></svg>
@@ -192,14 +452,6 @@ function buildItemRow(item) {
       <button data-action="edit" data-id="${item.id}" title="Edit">✎</button>
       <button data-action="del"  data-id="${item.id}" title="Delete">✕</button>
     </div>`;
-  row.querySelector(".item-row__check").addEventListener("click", async () => {
-    const res = await api("POST", `/lists/${currentList.id}/items/${item.id}/toggle`);
-    item.done = res.done;
-    row.classList.toggle("item-row--done", !!item.done);
-    updateStats();
-  });
-  row.querySelector("[data-action=edit]").addEventListener("click", () => openEditItemModal(item));
-  row.querySelector("[data-action=del]").addEventListener("click",  () => openDeleteItemModal(item));
   return row;
 }
 
@@ -225,6 +477,7 @@ function buildAddBar(categoryId) {
 
   const nameInput = bar.querySelector(".add-bar__input");
   const qtyInput  = bar.querySelector(".add-bar__qty");
+  attachAutocomplete(nameInput, "item");
 
   const submit = async () => {
     const name = nameInput.value.trim();
@@ -384,9 +637,8 @@ function openDeleteItemModal(item) {
   openModal("Delete item", `Remove "${esc(item.name)}" from your list?`, "",
   [
     { label: "Cancel", fn: closeModal },
-    { label: "Delete", cls: "btn--primary", fn: async () => {
-      await api("DELETE", `/lists/${currentList.id}/items/${item.id}`);
-      items = items.filter(i => i.id !== item.id);
+    { label: "Delete", cls: "btn--primary", fn: () => {
+      deleteItem(item);
       closeModal();
       renderDetail();
     }}
@@ -420,6 +672,7 @@ document.getElementById("btnBack").addEventListener("click", () => {
     const li = lists.find(l => l.id === currentList.id);
     if (li) li.name = name;
   }
+  flushMutations();
   showView("viewLists");
   renderLists();
 });
@@ -464,6 +717,7 @@ document.getElementById("btnClearDone").addEventListener("click", async () => {
   [
     { label: "Cancel", fn: closeModal },
     { label: "Clear", cls: "btn--primary", fn: async () => {
+      await flushMutations();
       await api("DELETE", `/lists/${currentList.id}/items/clear-done`);
       items = items.filter(i => !i.done);
       closeModal();
@@ -478,6 +732,23 @@ document.getElementById("btnClearDone").addEventListener("click", async () => {
 function esc(s) {
   return String(s||"").replace(/&/g,"&amp;").replace(/</g,"&lt;").replace(/>/g,"&gt;").replace(/"/g,"&quot;");
 }
+// Offer /api/autocomplete completions for `input` through a <datalist>
+let datalistSeq = 0;
+function attachAutocomplete(input, kind) {
+  const list = document.createElement("datalist");
+  list.id = `autocomplete-${++datalistSeq}`;
+  input.setAttribute("list", list.id);
+  input.after(list);
+  let latest = 0;
+  input.addEventListener("input", async () => {
+    const prefix = input.value.trim();
+    const seq = ++latest;
+    if (!prefix) { list.innerHTML = ""; return; }
+    const terms = await api("GET", `/autocomplete?kind=${kind}&prefix=${encodeURIComponent(prefix)}`).catch(() => []);
+    if (seq !== latest) return;  // a later keystroke has already been answered
+    list.innerHTML = terms.map(t => `<option value="${esc(t.term)}"></option>`).join("");
+  });
+}
 function formatDate(iso) {
   if (!iso) return "";
   const d = new Date(iso);
@@ -492,50 +763,56 @@ async function loadRecipes() {
   renderRecipes();
 }
 
+let recipeList = null;
+
 function renderRecipes() {
   const grid  = document.getElementById("recipesGrid");
   const empty = document.getElementById("recipesEmpty");
-  grid.querySelectorAll(".list-card").forEach(c => c.remove());
-
-  if (!recipes.length) { empty.style.display="block"; return; }
-  empty.style.display = "none";
+  if (!recipeList) recipeList = new KeyedList(grid, { build: buildRecipeCard, signature: recipeSignature });
 
-  recipes.forEach((recipe, i) => {
-    const card = document.createElement("div");
-    card.className = "list-card";
-    card.style.animationDelay = i * 0.04 + "s";
-    const servingsText = recipe.servings ? `Serves ${recipe.servings}` : "";
-    const times = [recipe.prep_time, recipe.cook_time].filter(Boolean).join(" • ");
+  empty.style.display = recipes.length ? "none" : "block";
+  recipeList.render(recipes);
+}
 
-    // Show photo thumbnail if available, otherwise show icon
-    const thumbnailHTML = recipe.photo
-      ? `<div class="list-card__thumbnail"><img src="${recipe.photo}" alt="${esc(recipe.name)}" /></div>`
-      : `<div class="list-card__icon">🍳</div>`;
+function recipeSignature(recipe) {
+  return [recipe.name, recipe.servings, recipe.prep_time, recipe.cook_time, recipe.photo].join("|");
+}
 
-    card.innerHTML = `
-      ${thumbnailHTML}
-      <div class="list-card__body">
-        <div class="list-card__name">${esc(recipe.name)}</div>
-        <div class="list-card__meta">${servingsText}${servingsText && times ? " • " : ""}${times}</div>
-      </div>
-      <div class="list-card__actions">
-        <button data-action="edit" title="Edit"><svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round"><path d="M11 4H4a2 2 0 00-2 2v14a2 2 0 002 2h14a2 2 0 002-2v-7"/><path d="M18.5 2.5a2.121 2.121 0 013 3L12 15l-4 1 1-4 9.5-9.5z"/></svg></button>
-        <button data-action="delete" title="Delete"><svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round"><path d="M3 6h18M19 6v14a2 2 0 01-2 2H7a2 2 0 01-2-2V6m3 0V4a2 2 0 012-2h4a2 2 0 012 2v2"/></svg></button>
-      </div>`;
-    card.addEventListener("click", (e) => {
-      if (e.target.closest("[data-action]")) return;
-      openRecipe(recipe.id);
-    });
-    card.querySelector("[data-action=edit]").addEventListener("click", (e) => {
-      e.stopPropagation();
-      openEditRecipeModal(recipe);
-    });
-    card.querySelector("[data-action=delete]").addEventListener("click", (e) => {
-      e.stopPropagation();
-      openDeleteRecipeModal(recipe);
-    });
-    grid.appendChild(card);
+function buildRecipeCard(recipe, i) {
+  const card = document.createElement("div");
+  card.className = "list-card";
+  card.style.animationDelay = Math.min(i, 12) * 0.04 + "s";
+  const servingsText = recipe.servings ? `Serves ${recipe.servings}` : "";
+  const times = [recipe.prep_time, recipe.cook_time].filter(Boolean).join(" • ");
+
+  // Show photo thumbnail if available, otherwise show icon
+  const thumbnailHTML = recipe.photo
+    ? `<div class="list-card__thumbnail"><img data-src="${esc(recipe.photo)}" alt="${esc(recipe.name)}" /></div>`
+    : `<div class="list-card__icon">🍳</div>`;
+
+  card.innerHTML = `
+    ${thumbnailHTML}
+    <div class="list-card__body">
+      <div class="list-card__name">${esc(recipe.name)}</div>
+      <div class="list-card__meta">${servingsText}${servingsText && times ? " • " : ""}${times}</div>
+    </div>
+    <div class="list-card__actions">
+      <button data-action="edit" title="Edit"><svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round"><path d="M11 4H4a2 2 0 00-2 2v14a2 2 0 002 2h14a2 2 0 002-2v-7"/><path d="M18.5 2.5a2.121 2.121 0 013 3L12 15l-4 1 1-4 9.5-9.5z"/></svg></button>
+      <button data-action="delete" title="Delete"><svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round"><path d="M3 6h18M19 6v14a2 2 0 01-2 2H7a2 2 0 01-2-2V6m3 0V4a2 2 0 012-2h4a2 2 0 012 2v2"/></svg></button>
+    </div>`;
+  card.addEventListener("click", (e) => {
+    if (e.target.closest("[data-action]")) return;
+    openRecipe(recipe.id);
+  });
+  card.querySelector("[data-action=edit]").addEventListener("click", (e) => {
+    e.stopPropagation();
+    openEditRecipeModal(recipe);
   });
+  card.querySelector("[data-action=delete]").addEventListener("click", (e) => {
+    e.stopPropagation();
+    openDeleteRecipeModal(recipe);
+  });
+  return card;
 }
 
 // ═══════════════════════════════════════════════════════════
@@ -570,8 +847,17 @@ function renderRecipeDetail() {
   // Top actions
   const topActions = document.getElementById("recipeTopActions");
   topActions.innerHTML = `
+    <button class="btn btn--sm btn--ghost" id="btnDuplicateRecipe">Duplicate</button>
     <button class="btn btn--sm btn--ghost" id="btnExportRecipe">📤 Export</button>
     <button class="btn btn--sm btn--danger" id="btnDeleteRecipe">Delete</button>`;
+  document.getElementById("btnDuplicateRecipe").onclick = async () => {
+    try {
+      const copy = await api("POST", `/recipes/${currentRecipe.id}/duplicate`);
+      await openRecipe(copy.id);
+    } catch (err) {
+      alert("Error duplicating recipe: " + err.message);
+    }
+  };
   document.getElementById("btnExportRecipe").onclick = async () => {
     try {
       const data = await api("GET", `/recipes/${currentRecipe.id}/export`);
@@ -752,6 +1038,8 @@ function renderRecipeDetail() {
 
   // Add ingredient
   const addIngBar = document.getElementById("addIngredientBar");
+  attachAutocomplete(document.getElementById("newIngredientName"), "ingredient");
+  attachAutocomplete(document.getElementById("newIngredientUnit"), "unit");
   addIngBar.querySelector(".btn").onclick = async () => {
     const name = document.getElementById("newIngredientName").value.trim();
     if (!name) return;
@@ -1080,7 +1368,7 @@ function setupPhotoHandlers() {
       formData.append('photo', file);
 
       try {
-        const response = await fetch(`/api/recipes/${currentRecipe.id}/photo`, {
+        const response = await fetch(`${API}/recipes/${currentRecipe.id}/photo`, {
           method: 'PUT',
           body: formData
         });
@@ -1250,6 +1538,8 @@ function openEditIngredientModal(ingredient) {
       renderIngredients();
     }}
   ]);
+  attachAutocomplete(document.getElementById("modalIngName"), "ingredient");
+  attachAutocomplete(document.getElementById("modalIngUnit"), "unit");
   setTimeout(() => document.getElementById("modalIngName").focus(), 50);
 }
 